@@ -22,9 +22,12 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import collections
 import sys
 import time
+import datetime
 import os.path
+import threading
 import traceback
 import uuid
 
@@ -41,15 +44,26 @@ if not sitePackagesPath in sys.path:
 
 from Deadline.Cloud import CloudPluginWrapper, CloudInstance, InstanceStatus, OSImage, HardwareType
 from FranticX import Environment2
-    
-import azure.common.credentials
-import azure.batch.batch_service_client as batchsc
-import azure.batch.models as batchmodels
 
+# The Azure SDK is imported on first use, see azuresdk
+from azuresdk import batchmodels, batchsc, credentials
+
+import autoscale
+import catalog
 import pluginconfig
 import mappers
-import images
-import hardware
+import hostnames
+import metrics
+import background
+import parallel
+import placeholders
+import profiling
+import reaper
+import resizer
+import scaledown
+import statecache
+import throttle
+import warmpool
 
 def GetCloudPluginWrapper():
     return AzureBatchCloudPlugin()
@@ -77,16 +91,94 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
         except:
             pass
         self.batch_config = None
+        self.config_loader = None
+        self._config_lock = threading.RLock()
         self.batch_client = None
+        self.catalog = None
+        self.warm_pools = None
+        self.warm_pool_worker = None
+        self.idle_pool_reaper = None
+        self.idle_pool_worker = None
+        self.placeholders = placeholders.PlaceholderTracker()
+        self.pool_instances = {}
+        self.hostnames = hostnames.HostnameCache()
+        self.metrics = metrics.MetricsRegistry()
+        self.metrics_worker = None
+        self.profiler = None
 
     def _get_config(self):
         """
-        Returns an instance of the Batch plugins config
+        Returns an instance of the Batch plugins config. Config changes are
+        picked up without a restart, and the objects built from the config
+        are updated when it changes.
         :return: BatchConfig
         """
-        if not self.batch_config:
-            self.batch_config = pluginconfig.load_config(self)
-        return self.batch_config
+        with self._config_lock:
+            if not self.config_loader:
+                self.config_loader = pluginconfig.ConfigLoader(self)
+            config = self.config_loader.get()
+            if config is not self.batch_config:
+                previous = self.batch_config
+                self.batch_config = config
+                if previous:
+                    self._apply_config_changes(previous, config)
+                else:
+                    self._configure_profiler(config)
+            return config
+
+    def _apply_config_changes(self, previous, config):
+        changed = pluginconfig.get_changed_settings(previous, config)
+        if not changed:
+            # e.g. only whitespace in an entry changed
+            return
+        ClientUtils.LogText('Config changed: {}'.format(', '.join(sorted(changed))))
+
+        if self.batch_client:
+            self.batch_client.reconfigure(config, changed)
+        if self.catalog and changed & CATALOG_SETTINGS:
+            self.catalog = None
+        if self.warm_pools and changed & WARM_POOL_SETTINGS:
+            self.warm_pools.reconfigure(*self._get_warm_pool_settings(config))
+            if self.warm_pool_worker:
+                self.warm_pool_worker.wake()
+        if self.idle_pool_reaper:
+            self.idle_pool_reaper.grace_period = config.idle_pool_grace_period
+            self.idle_pool_reaper.min_idle_checks = max(1, config.idle_pool_min_checks)
+        if changed & PROFILING_SETTINGS:
+            self._configure_profiler(config)
+
+    def _configure_profiler(self, config):
+        """
+        Profiles the callbacks selected in the config, or stops profiling if
+        none are selected or the selection is invalid. Profiling starts once
+        the config has been read, i.e. from the second callback.
+        """
+        try:
+            callbacks = profiling.parse_callback_names(config.profile_callbacks, CALLBACK_NAMES)
+        except ValueError as e:
+            ClientUtils.LogText('Profiling disabled: {}'.format(e))
+            callbacks = None
+        if not callbacks:
+            self.profiler = None
+            return
+        self.profiler = profiling.CallbackProfiler(
+            callbacks,
+            max(0, config.profile_budget),
+            min(100, max(0, config.profile_sample_percent)) / 100.0,
+            config.profile_directory or profiling.get_default_directory(),
+            ClientUtils.LogText)
+        ClientUtils.LogText('Profiling {}% of the calls to {}, reporting calls over {}s'.format(
+            config.profile_sample_percent, ', '.join(sorted(callbacks)), config.profile_budget))
+
+    def _get_catalog(self):
+        """
+        Returns the image and hardware catalog for the current config
+        :return: catalog.Catalog
+        """
+        config = self._get_config()
+        if not self.catalog:
+            self.catalog = catalog.Catalog(config)
+        return self.catalog
 
     def _get_batch_client(self):
         """
@@ -95,10 +187,135 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
         """
         if not self.batch_client:
             config = self._get_config()
-            self.batch_client = Batch(config)
+            self.batch_client = Batch(config, self.metrics)
+            self.metrics.add_collector('client', self.batch_client.get_client_stats)
         return self.batch_client
 
+    def get_metrics(self):
+        """
+        Returns the latency, error and throttling metrics of the plugin's
+        callbacks, Batch wrapper methods and Batch API requests
+        :rtype: dict
+        """
+        return self.metrics.get_snapshot()
+
+    def _start_metrics_worker(self):
+        if not self.metrics_worker:
+            config = self._get_config()
+            self.metrics_worker = background.PeriodicWorker(
+                'AzureBatchMetrics', config.metrics_interval, self._write_metrics)
+        self.metrics_worker.start()
+
+    def _write_metrics(self):
+        """
+        Writes the metrics file, runs on the metrics worker thread
+        """
+        config = self._get_config()
+        self.metrics_worker.interval = config.metrics_interval
+        if config.metrics_file:
+            self.metrics.write_prometheus(config.metrics_file)
+
+    def _get_warm_pools(self):
+        """
+        Returns the warm pool manager
+        :return: WarmPoolManager
+        """
+        if not self.warm_pools:
+            config = self._get_config()
+            self.warm_pools = warmpool.WarmPoolManager(*self._get_warm_pool_settings(config))
+        return self.warm_pools
+
+    def _get_warm_pool_settings(self, config):
+        """
+        Parses the warm node floors and schedule, both are empty if either is invalid
+        :rtype: tuple of (dict, warmpool.WarmSchedule)
+        """
+        try:
+            return (warmpool.parse_warm_floors(config.warm_pool_floors),
+                    warmpool.WarmSchedule(config.warm_pool_schedule))
+        except ValueError as e:
+            ClientUtils.LogText('Warm pools disabled: {}'.format(e))
+            return {}, warmpool.WarmSchedule()
+
+    def _start_warm_pool_worker(self):
+        if not self.warm_pool_worker:
+            self.warm_pool_worker = background.PeriodicWorker(
+                'AzureBatchWarmPools', WARM_POOL_INTERVAL, self._maintain_warm_pools)
+        self.warm_pool_worker.start()
+
+    def _start_idle_pool_worker(self):
+        if not self.idle_pool_worker:
+            config = self._get_config()
+            self.idle_pool_reaper = reaper.IdlePoolReaper(config.idle_pool_grace_period,
+                                                          config.idle_pool_min_checks)
+            self.idle_pool_worker = background.PeriodicWorker(
+                'AzureBatchIdlePools', IDLE_POOL_INTERVAL, self._reap_idle_pools)
+        self.idle_pool_worker.start()
+
+    def _is_idle_pool(self, pool):
+        """
+        Returns True if the pool has no nodes and none are on their way. A steady
+        pool whose resize ended without nodes, e.g. when the quota was reached,
+        is idle whatever its target. An autoscale pool without resize errors is
+        only idle once its formula asks for no nodes, as it may be waiting for
+        the formula to be evaluated.
+        """
+        client = self._get_batch_client()
+        if pool.allocation_state != batchmodels.AllocationState.steady \
+                or pool.state != batchmodels.PoolState.active \
+                or pool.current_dedicated_nodes != 0 \
+                or pool.current_low_priority_nodes != 0:
+            return False
+        if client.get_pending_resize(pool.id) or client.resizer.get_pending_removals(pool.id):
+            return False
+        if self._get_warm_pools().get_applied(pool) != 0:
+            return False
+        if pool.enable_auto_scale and not pool.resize_errors:
+            return sum(client.get_pool_target(pool)) == 0
+        return True
+
+    def _reap_idle_pools(self):
+        """
+        Deletes pools which have been empty for longer than the grace period.
+        Runs on the idle pool worker thread.
+        """
+        config = self._get_config()
+        client = self._get_batch_client()
+        pools = client.list_pools(id_prefix='{}-'.format(config.deadline_cloud_region),
+                                  select=POOL_SUMMARY_SELECT)
+        self.idle_pool_reaper.retain(p.id for p in pools)
+
+        for p in pools:
+            if not self.idle_pool_reaper.observe(p.id, self._is_idle_pool(p)):
+                continue
+
+            # The pool may have been grown since it was listed
+            pool = client.get_pool(p.id, use_cache=False)
+            if not pool or not self._is_idle_pool(pool):
+                self.idle_pool_reaper.forget(p.id)
+                continue
+
+            ClientUtils.LogText('Deleting pool {}, empty for {:.0f} seconds'.format(
+                p.id, self.idle_pool_reaper.get_idle_seconds(p.id)))
+            try:
+                client.delete_pool(p.id)
+                self.idle_pool_reaper.forget(p.id)
+            except:
+                ClientUtils.LogText('Failed to delete pool {}: {}'.format(p.id, traceback.format_exc()))
+                continue
+
+            try:
+                client.delete_job(p.id)
+            except:
+                # No such job
+                pass
+
     def Cleanup(self):
+        workers = [w for w in (self.metrics_worker, self.idle_pool_worker, self.warm_pool_worker) if w]
+        if self.batch_client:
+            workers.extend(self.batch_client.get_workers())
+        # Stopped together so shutdown waits at most background.STOP_TIMEOUT
+        background.stop_workers(workers)
         del self.VerifyAccessCallback
         del self.AvailableHardwareTypesCallback
         del self.AvailableOSImagesCallback
@@ -118,61 +335,138 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
 
     def VerifyAccess(self):
         client = self._get_batch_client()
-        client.list_pools()
+        client.list_pools(use_cache=False)
         return True
 
     def GetActiveInstances(self):
-
-        config = self._get_config()
-
         instanceList = []
 
         try:
-            client = self._get_batch_client()
-            pools = client.list_pools()
-            if pools:
-                for p in pools:
-                    if not p.id.startswith('{}-'.format(config.deadline_cloud_region)):
-                        continue
-
-                    if p.allocation_state == batchmodels.AllocationState.steady \
-                            and p.state == batchmodels.PoolState.active \
-                            and p.current_dedicated_nodes == 0 \
-                            and p.current_low_priority_nodes == 0:
-                        client.delete_pool(p.id)
-                        try:
-                            client.delete_job(p.id)
-                        except:
-                            # No such job
-                            pass
-                        continue
-
-                    compute_nodes = client.list_compute_nodes(p.id)
-                    if compute_nodes:
-                        for cn in compute_nodes:
-                            instance = mappers.compute_node_to_deadline_instance(p, cn)
-                            instance.RegionName = config.deadline_region
-                            instance.Zone = config.azure_region
-                            instanceList.append(instance)
-
-                    if p.allocation_state == batchmodels.AllocationState.resizing:
-                        # If the pool is resizing, we need to return mock instances
-                        # for any nodes not yet provisioned, otherwise the Balancer will
-                        # think they don't exist and keep trying to scale up.
-                        current_nodes = p.current_dedicated_nodes + p.current_low_priority_nodes
-                        target_nodes = p.target_dedicated_nodes + p.target_low_priority_nodes
-                        if current_nodes < target_nodes:
-                            for i in range(target_nodes - current_nodes):
-                                cn = mappers.get_mock_compute_node('not available')
-                                instance = mappers.compute_node_to_deadline_instance(p, cn)
-                                instance.RegionName = config.deadline_region
-                                instance.Zone = config.azure_region
-                                instanceList.append(instance)
+            for instance in self.iter_active_instances():
+                instanceList.append(instance)
         except:
             traceback.print_exc()
+            # Reporting no instances would make the Balancer scale up again,
+            # the last known instances are returned instead.
+            ClientUtils.LogText('Failed to list instances, returning the last known instances')
+            instanceList = []
+            for instances in list(self.pool_instances.values()):
+                instanceList.extend(instances)
 
         return instanceList
 
+    def iter_active_instances(self):
+        """
+        Yields the instances of all pools in the cloud region, one pool at a time.
+        Compute nodes are mapped a page at a time as they're listed, so only the
+        instances are kept rather than the Batch objects of the whole fleet.
+        :rtype: collections.Iterable[Deadline.Cloud.CloudInstance]
+        """
+        config = self._get_config()
+
+        warm_pools = self._get_warm_pools()
+        if warm_pools.enabled:
+            self._start_warm_pool_worker()
+        self._start_idle_pool_worker()
+        if config.metrics_file:
+            self._start_metrics_worker()
+
+        client = self._get_batch_client()
+        pools = client.list_pools(id_prefix='{}-'.format(config.deadline_cloud_region),
+                                  select=POOL_SUMMARY_SELECT)
+        # Empty pools are deleted by the idle pool worker once their grace period has passed
+        active_pools = []
+        if pools:
+            for p in pools:
+                if not p.id.startswith('{}-'.format(config.deadline_cloud_region)):
+                    continue
+
+                if p.current_dedicated_nodes == 0 \
+                        and p.current_low_priority_nodes == 0 \
+                        and p.allocation_state == batchmodels.AllocationState.steady \
+                        and not p.enable_auto_scale \
+                        and not client.get_pending_resize(p.id):
+                    # Nothing to list
+                    continue
+
+                active_pools.append(p)
+
+        self.placeholders.retain(p.id for p in active_pools)
+        active_pool_ids = set(p.id for p in active_pools)
+        for pool_id in list(self.pool_instances):
+            if pool_id not in active_pool_ids:
+                del self.pool_instances[pool_id]
+
+        # The pools are listed concurrently, the results are returned in pool order
+        results = parallel.imap_bounded(self._get_pool_instances, active_pools, config.max_parallel_requests)
+
+        listed_ids = []
+        for result in results:
+            pool_id = result.item.id
+            if result.succeeded:
+                self.pool_instances[pool_id] = result.value
+            else:
+                ClientUtils.LogText('Failed to list compute nodes for pool {}, returning the last known instances: {}'
+                                    .format(pool_id, result.error_trace))
+
+            for instance in self.pool_instances.get(pool_id, []):
+                listed_ids.append(instance.ID)
+                yield instance
+
+        # Nodes which have left their pool no longer need their hostname
+        self.hostnames.retain(listed_ids)
+
+    def _get_pool_instances(self, pool):
+        """
+        Lists the pool's compute nodes and maps them to instances, adding placeholders
+        for nodes not yet allocated and hiding warm nodes.
+        :rtype: list of Deadline.Cloud.CloudInstance
+        """
+        client = self._get_batch_client()
+        warm_pools = self._get_warm_pools()
+        track_states = warm_pools.get_applied(pool) > 0
+
+        instances = []
+        node_states = []
+        page = []
+        for cn in client.iter_compute_nodes(pool.id, select=NODE_SUMMARY_SELECT):
+            page.append(cn)
+            if track_states:
+                node_states.append(warmpool.NodeState(cn.id, cn.state))
+            if len(page) >= NODE_PAGE_SIZE:
+                instances.extend(self._get_cloud_instances(pool, page))
+                page = []
+        instances.extend(self._get_cloud_instances(pool, page))
+
+        # Warm nodes are hidden from the Balancer until they're handed out
+        reserved, unallocated_warm_nodes = warm_pools.select_reserved(pool, node_states)
+        if reserved or unallocated_warm_nodes:
+            self._start_warm_pool_worker()
+        if reserved:
+            instances = [ci for ci in instances if ci.Name not in reserved]
+
+        # Nodes queued for removal have already been terminated as far as the Balancer is concerned
+        removing = set(client.resizer.get_pending_removals(pool.id))
+        if removing:
+            instances = [ci for ci in instances if ci.Name not in removing]
+
+        pending_nodes = 0
+        if pool.allocation_state == batchmodels.AllocationState.resizing \
+                or pool.enable_auto_scale \
+                or client.get_pending_resize(pool.id):
+            # If the pool is resizing, we need to return mock instances
+            # for any nodes not yet provisioned, otherwise the Balancer will
+            # think they don't exist and keep trying to scale up.
+            current_nodes = pool.current_dedicated_nodes + pool.current_low_priority_nodes
+            target_nodes = sum(client.get_pool_target(pool)) - unallocated_warm_nodes
+            pending_nodes = target_nodes - current_nodes
+
+        # Placeholder ids are kept across calls and retired as real nodes appear
+        placeholder_ids = self.placeholders.reconcile(pool.id, pending_nodes)
+        instances.extend(self._get_cloud_instances(
+            pool, [mappers.get_mock_compute_node(i) for i in placeholder_ids]))
+        return instances
+
     def GetHostname(self, instanceID):
         ClientUtils.LogText('GetHostname for {}'.format(instanceID))
 
@@ -180,23 +474,38 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
             return ""
 
         try:
-            pool_id, compute_node_id = \
-                get_pool_id_and_compute_node_id_from_instance_id(instanceID)
-
-            client = self._get_batch_client()
-            return client.get_compute_node_hostname(pool_id, compute_node_id)
+            hostname = self.hostnames.get(instanceID)
+            if hostname is None:
+                self._resolve_hostnames(instanceID)
+                hostname = self.hostnames.get(instanceID)
+            return hostname or ""
         except:
             ClientUtils.LogText(traceback.format_exc())
             return ""
 
+    def _resolve_hostnames(self, instance_id):
+        """
+        Reads the hostname of the instance, along with those of the other started
+        instances in its pool that aren't cached yet. The Balancer asks for the
+        hostname of every new node, so they're read together.
+        """
+        pool_id, _ = get_pool_id_and_compute_node_id_from_instance_id(instance_id)
+        started_ids = [ci.ID for ci in self.pool_instances.get(pool_id, [])
+                       if ci.Status == InstanceStatus.Running and ci.ID != instance_id]
+        instance_ids = [instance_id] + self.hostnames.get_missing(started_ids)[:HOSTNAME_BATCH_SIZE - 1]
+
+        client = self._get_batch_client()
+        nodes = [get_pool_id_and_compute_node_id_from_instance_id(i) for i in instance_ids]
+        resolved = client.get_compute_node_hostnames(nodes)
+        self.hostnames.update(dict((i, resolved[node]) for i, node in zip(instance_ids, nodes) if node in resolved))
+
     def GetAvailableHardwareTypes(self):
         """
 
         :return:
         :rtype: list of Deadline.Cloud.HardwareType
         """
-        config = self._get_config()
-        return hardware.vm_sizes_to_hardware_types(config.vm_sizes)
+        return self._get_catalog().get_hardware_types()
 
     def GetAvailableOSImages(self):
         """
@@ -204,13 +513,7 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
         :return: OS image list
         :rtype: list of OSImage
         """
-        conf = self._get_config()
-        image_list = conf.get_os_images()
-
-        # add the default images
-        image_list.extend(images.get_abr_images())
-
-        return image_list
+        return self._get_catalog().get_os_images()
 
     def CloneInstance(self, instance, count):
         try:
@@ -227,29 +530,72 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
         config = self._get_config()
         use_low_priority = config.use_low_priority_vms
 
-        pool_id = get_pool_name(config.deadline_cloud_region, imageID, hardwareID, use_low_priority)
-        client = self._get_batch_client()
+        image = self._get_catalog().get_image(imageID)
+
+        if not image:
+            ClientUtils.LogText('Failed to find image for id {}'.format(imageID))
+            return startedInstances
+
+        if not self._get_catalog().get_hardware_type(hardwareID):
+            ClientUtils.LogText('Failed to find hardware type for id {}, it is not one of the configured VM sizes'
+                                .format(hardwareID))
+            return startedInstances
+
+        pool_id = get_pool_name(config.deadline_cloud_region, image, hardwareID, use_low_priority)
 
         ClientUtils.LogText('Looking for existing pool {}'.format(pool_id))
 
-        os_images = self.GetAvailableOSImages()
-        os_image = next((x for x in os_images if x.ID == imageID), None)
+        if not image.image_spec:
+            ClientUtils.LogText('Unsupported OS for image id {}'.format(imageID))
+            return startedInstances
+
+        # Warm nodes are handed out first, the pool is grown by the full count
+        # to back-fill them.
+        warm_nodes = self._get_warm_pools().hand_out(pool_id, count)
+        if warm_nodes:
+            ClientUtils.LogText('Handing out warm nodes {} from pool {}'.format(','.join(warm_nodes), pool_id))
 
-        if not os_image:
-            ClientUtils.LogText('Failed to find image for id {}'.format(imageID))
+        pool = self._add_instances(pool_id, hardwareID, image, count)
+        if not pool:
             return startedInstances
 
-        is_linux_pool = False
-        if os_image.Platform == Environment2.OS.Linux:
-            is_linux_pool = True
+        # Only the instances started for this request are returned, the handed out
+        # warm nodes and placeholders for the nodes still to be allocated.
+        if warm_nodes:
+            client = self._get_batch_client()
+            nodes = client.list_compute_nodes(pool_id, check_pool=False, select=NODE_SUMMARY_SELECT)
+            startedInstances.extend(self._get_cloud_instances(pool, [cn for cn in nodes if cn.id in warm_nodes]))
+
+        placeholder_ids = self.placeholders.add(pool_id, count - len(startedInstances))
+        startedInstances.extend(self._get_cloud_instances(
+            pool, [mappers.get_mock_compute_node(i) for i in placeholder_ids]))
+
+        return startedInstances
+
+    def _get_cloud_instances(self, pool, compute_nodes):
+        config = self._get_config()
+        return mappers.map_pool_nodes(pool, compute_nodes, config.deadline_region, config.azure_region)
+
+    def _add_instances(self, pool_id, hardwareID, image, count):
+        """
+        Grows the pool by count nodes, creating the pool if it doesn't exist.
+        :param image: The pool's image
+        :type image: catalog.CatalogImage
+        :return: The pool, or the parameters it was created with, None if the pool couldn't be grown
+        """
+        config = self._get_config()
+        use_low_priority = config.use_low_priority_vms
+        client = self._get_batch_client()
+
+        is_linux_pool = image.is_linux
 
         pool = client.get_pool(pool_id)
         if not pool:
             ClientUtils.LogText('Did not find existing pool {}, creating new one'.format(pool_id))
 
-            batch_image_spec = images.image_id_to_image_spec(config, imageID)
+            batch_image_spec = image.image_spec
 
-            if os_image.Platform == Environment2.OS.Windows:
+            if image.platform == Environment2.OS.Windows:
                 starttask_url = self.batch_config.windows_start_task_url
                 starttask_script = 'deadline-starttask.ps1'
             else:
@@ -257,7 +603,7 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
                 starttask_script = 'deadline-starttask.sh'
 
             app_pkgs = [batchmodels.ApplicationPackageReference('DeadlineClient')]
-            starttask_cmd = get_deadline_starttask_cmd(self.batch_config, starttask_script, os_image)
+            starttask_cmd = get_deadline_starttask_cmd(self.batch_config, starttask_script, image.os_image)
 
             app_licenses = None
             if self.batch_config.app_licenses:
@@ -266,69 +612,225 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
             dedicated_nodes = 0 if use_low_priority else count
             low_prio_nodes = count if use_low_priority else 0
 
-            client.create_pool(pool_id,
-                               hardwareID,
-                               dedicated_nodes,
-                               low_prio_nodes,
-                               batch_image_spec,
-                               starttask_cmd,
-                               starttask_url,
-                               starttask_script,
-                               self.batch_config.kv_sp_cert_thumb,
-                               app_licenses,
-                               self.batch_config.disable_remote_access,
-                               app_pkgs,
-                               self.batch_config.subnet_id,
-                               app_insights_app_key=self.batch_config.app_insights_app_key,
-                               app_insights_instrumentation_key=self.batch_config.app_insights_instrumentation_key)
+            pool = client.create_pool(pool_id,
+                                      hardwareID,
+                                      dedicated_nodes,
+                                      low_prio_nodes,
+                                      batch_image_spec,
+                                      starttask_cmd,
+                                      starttask_url,
+                                      starttask_script,
+                                      self.batch_config.kv_sp_cert_thumb,
+                                      app_licenses,
+                                      self.batch_config.disable_remote_access,
+                                      app_pkgs,
+                                      self.batch_config.subnet_id,
+                                      app_insights_app_key=self.batch_config.app_insights_app_key,
+                                      app_insights_instrumentation_key=self.batch_config.app_insights_instrumentation_key)
 
             if self.batch_config.app_licenses:
                 total_nodes = dedicated_nodes + low_prio_nodes
-                client.create_job(pool_id, pool_id, total_nodes, is_linux_pool)
+                log_failed_license_tasks(pool_id, client.create_job(pool_id, pool_id, total_nodes, is_linux_pool))
 
         else:
-            current_dedicated = pool.target_dedicated_nodes
-            current_low_prio = pool.target_low_priority_nodes
-
-            if use_low_priority:
-                current_low_prio += count
-            else:
-                current_dedicated += count
-
             try:
-                client.resize_pool(pool_id,
-                                   target_dedicated=current_dedicated,
-                                   target_low_priority=current_low_prio)
-
-                if self.batch_config.app_licenses:
-                    total_nodes = current_dedicated + current_low_prio
-                    client.create_job(pool_id, pool_id, total_nodes, is_linux_pool)
+                # Requests for the same pool within the coalescing window are
+                # combined into a single resize.
+                current_dedicated, current_low_prio = client.get_pool_target(pool)
+                target = client.grow_pool(pool_id,
+                                          current_dedicated,
+                                          current_low_prio,
+                                          0 if use_low_priority else count,
+                                          count if use_low_priority else 0)
             except:
                 traceback.print_exc()
+                return None
+
+            if self.batch_config.app_licenses:
+                try:
+                    log_failed_license_tasks(pool_id,
+                                             client.create_job(pool_id, pool_id, target.total, is_linux_pool))
+                except:
+                    traceback.print_exc()
+
+        return pool
 
-        return self.GetActiveInstances()
+    def _maintain_warm_pools(self):
+        """
+        Grows or shrinks pools so they hold the number of warm nodes configured
+        for the current time of day. Runs on the warm pool worker thread.
+        """
+        config = self._get_config()
+        warm_pools = self._get_warm_pools()
+        client = self._get_batch_client()
+
+        floors = {}
+        for (image_name, vm_size) in warm_pools.floors:
+            image = self._get_catalog().get_image_by_name(image_name)
+            if not image:
+                ClientUtils.LogText('Failed to find warm pool image {}'.format(image_name))
+                continue
+            pool_id = get_pool_name(config.deadline_cloud_region, image, vm_size, config.use_low_priority_vms)
+            floors[pool_id] = (vm_size, image, warm_pools.get_floor(image_name, vm_size))
+
+        # Pools which still hold warm nodes from an earlier configuration are emptied
+        pools = client.list_pools(id_prefix='{}-'.format(config.deadline_cloud_region),
+                                  select=POOL_SUMMARY_SELECT)
+        for p in pools:
+            if p.id not in floors and warm_pools.get_applied(p) > 0:
+                floors[p.id] = (p.vm_size, None, 0)
+
+        for pool_id, (vm_size, image, floor) in floors.items():
+            try:
+                pool = client.get_pool(pool_id)
+                applied = warm_pools.get_applied(pool) if pool else 0
+                if floor == applied:
+                    continue
+
+                ClientUtils.LogText('Changing warm nodes in pool {} from {} to {}'.format(pool_id, applied, floor))
+                if floor > applied:
+                    if not self._add_instances(pool_id, vm_size, image, floor - applied):
+                        continue
+                else:
+                    # Removing nodes and resizing can't overlap, so reserved nodes are
+                    # removed first and the rest of the target is lowered on a later pass.
+                    surplus = applied - floor
+                    node_ids = warm_pools.take_reserved(pool_id, surplus)
+                    if node_ids:
+                        failed = client.remove_compute_nodes(pool_id, node_ids, pool=pool)
+                        floor = applied - len(node_ids) + len(failed)
+                    else:
+                        target_dedicated, target_low_priority = client.get_pool_target(pool)
+                        lower_pool_target(client, pool_id, target_dedicated, target_low_priority, surplus)
+
+                client.set_pool_metadata(pool_id, warmpool.WARM_FLOOR_METADATA, str(floor))
+                warm_pools.set_applied(pool_id, floor)
+            except:
+                ClientUtils.LogText('Failed to update warm nodes for pool {}: {}'.format(pool_id, traceback.format_exc()))
 
     def TerminateInstances(self, instanceIDs):
-        results = []
         ClientUtils.LogText('Terminating instance ids {}'.format(','.join(instanceIDs)))
         if instanceIDs == None or len(instanceIDs) == 0:
             return []
+        instance_nodes = []
         pool_to_nodes = {}
         for instance_id in instanceIDs:
             pool_id, compute_node_id = \
                 get_pool_id_and_compute_node_id_from_instance_id(instance_id)
+            instance_nodes.append((pool_id, compute_node_id))
             pool_nodes = pool_to_nodes.get(pool_id)
             if pool_nodes is None:
                 pool_nodes = []
                 pool_to_nodes[pool_id] = pool_nodes
             pool_nodes.append(compute_node_id)
 
+        # Pools are independent, so their nodes are removed in parallel
+        config = self._get_config()
+        pool_results = parallel.map_bounded(
+            lambda item: self._terminate_pool_instances(*item),
+            list(pool_to_nodes.items()),
+            config.max_parallel_requests)
+
+        failed = set()
+        removed = []
+        for result in pool_results:
+            pool_id, nodes = result.item
+            if result.succeeded:
+                pool_removed, pool_failed = result.value
+                removed.extend(mappers.get_cloud_instance_id(pool_id, n) for n in pool_removed)
+                failed.update((pool_id, n) for n in pool_failed)
+            else:
+                ClientUtils.LogText('Failed to terminate instances in pool {}: {}'.format(pool_id, result.error_trace))
+                failed.update((pool_id, n) for n in nodes)
+
+        # The nodes removed may differ from the requested ones when idle nodes are preferred
+        self.hostnames.forget(removed)
+        return [node not in failed for node in instance_nodes]
+
+    def _terminate_pool_instances(self, pool_id, nodes):
+        """
+        Removes the nodes from the pool
+        :return: The ids of the nodes removed, and of the requested nodes that weren't
+        :rtype: tuple of (list of str, list of str)
+        """
+        config = self._get_config()
         client = self._get_batch_client()
-        for pool_id, nodes in pool_to_nodes.iteritems():
-            if len(nodes) > 0:
-                client.remove_compute_nodes(pool_id, nodes)
+        pool = client.get_pool(pool_id)
+        if not pool:
+            # The pool and its nodes are already gone
+            return nodes, []
+
+        # Placeholders stand for nodes not yet allocated, they're cancelled by lowering the target
+        placeholder_ids = self.placeholders.discard(pool_id, nodes)
+        removed = list(placeholder_ids)
+        nodes = [n for n in nodes if n not in placeholder_ids]
+
+        failed = []
+        target_dedicated, target_low_priority = client.get_pool_target(pool)
+        if placeholder_ids and not pool.enable_auto_scale:
+            # The target is lowered first, removing nodes then lowers the
+            # pending target by the number of nodes removed
+            lower_pool_target(client, pool_id, target_dedicated, target_low_priority, len(placeholder_ids))
+        if nodes:
+            # Lowering an autoscale pool's formula would let the service pick
+            # which nodes go, so the named nodes are removed from it too
+            removed_nodes, failed = self._remove_pool_nodes(pool, nodes)
+            removed.extend(removed_nodes)
+        if pool.enable_auto_scale:
+            # Removing nodes doesn't change the formula, so its desired nodes are
+            # lowered as well. The resizer applies it once the removals are done.
+            lower_pool_target(client, pool_id, target_dedicated, target_low_priority, len(removed))
+
+        if config.app_licenses:
+            # Drop the license tasks queued for the removed nodes
+            remaining = target_dedicated + target_low_priority - len(removed)
+            try:
+                log_failed_license_tasks(
+                    pool_id, client.reconcile_license_tasks(pool_id, max(0, remaining), is_linux_pool(pool)))
+            except:
+                ClientUtils.LogText(traceback.format_exc())
 
-        return results
+        return removed, failed
+
+    def _remove_pool_nodes(self, pool, node_ids):
+        """
+        Removes as many nodes from the pool as were requested. The scale down
+        planner picks which, so with scale_down_prefer_idle idle nodes go in
+        place of requested nodes doing work. Requested nodes left running
+        aren't removed, even if another node went in their place.
+        :return: The ids of the nodes removed, and of the requested nodes that weren't
+        :rtype: tuple of (list of str, list of str)
+        """
+        config = self._get_config()
+        client = self._get_batch_client()
+        # The license tasks run for as long as their node, the license job has the pool's id
+        license_job_ids = [pool.id] if config.app_licenses else []
+        planner = scaledown.ScaleDownPlanner(config.scale_down_prefer_idle, config.scale_down_running_nodes,
+                                             license_job_ids)
+        nodes = list(client.iter_compute_nodes(pool.id, select=NODE_SUMMARY_SELECT))
+
+        # Warm nodes and nodes already being removed are never picked in place of others
+        excluded = self._get_warm_pools().get_reserved(pool.id)
+        excluded.update(client.resizer.get_pending_removals(pool.id))
+
+        requested = set(node_ids)
+        removed = set()
+        failed = set()
+        for option, victim_ids in planner.plan(nodes, node_ids, excluded):
+            substitutes = [n for n in victim_ids if n not in requested]
+            if substitutes:
+                ClientUtils.LogText('Removing nodes {} from pool {} in place of requested nodes'.format(
+                    ','.join(substitutes), pool.id))
+            # After the first removal the pool is resizing, so it's fetched again
+            failed.update(client.remove_compute_nodes(pool.id, victim_ids, option,
+                                                      pool=None if removed else pool))
+            removed.update(victim_ids)
+
+        # Requested nodes which have left, or are leaving, the pool count as removed
+        existing = set(n.id for n in nodes if scaledown.get_victim_rank(n.state) is not None)
+        removed.update(n for n in node_ids if n not in existing)
+        removed -= failed
+        return list(removed), [n for n in node_ids if n not in removed]
 
     def StopInstances(self, instanceIDs):
         ClientUtils.LogText('Stopping instances {}'.format(','.join(instanceIDs)))
@@ -346,12 +848,17 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
         ClientUtils.LogText('Rebooting instances {}'.format(','.join(instanceIDs)))
         if instanceIDs is None or len(instanceIDs) == 0:
             return []
-        client = self._get_batch_client()
+        instance_nodes = []
+        pool_to_nodes = {}
         for instance_id in instanceIDs:
             pool_id, compute_node_id = \
                 get_pool_id_and_compute_node_id_from_instance_id(instance_id)
-            client.reboot_compute_node(pool_id, compute_node_id)
-        return results
+            instance_nodes.append((pool_id, compute_node_id))
+            pool_to_nodes.setdefault(pool_id, []).append(compute_node_id)
+
+        client = self._get_batch_client()
+        failed = client.reboot_compute_nodes(pool_to_nodes)
+        return [node not in failed for node in instance_nodes]
 
     def CreateImage(self, source):
 
@@ -369,6 +876,27 @@ class AzureBatchCloudPlugin(CloudPluginWrapper):
         return sources
 
 
+# The Deadline cloud plugin callbacks, their calls are recorded in the plugin's metrics and can be profiled
+CALLBACK_NAMES = [
+    'VerifyAccess',
+    'GetAvailableHardwareTypes',
+    'GetAvailableOSImages',
+    'CloneInstance',
+    'CreateInstances',
+    'GetActiveInstances',
+    'TerminateInstances',
+    'GetHostname',
+    'StopInstances',
+    'StartInstances',
+    'RebootInstances',
+    'CreateImage',
+    'ImageSources',
+]
+
+profiling.profile_methods(AzureBatchCloudPlugin, CALLBACK_NAMES)
+metrics.instrument_methods(AzureBatchCloudPlugin, 'callback', CALLBACK_NAMES)
+
+
 ### Mappers ###
 
 def get_pool_id_and_compute_node_id_from_instance_id(instance_id):
@@ -377,9 +905,53 @@ def get_pool_id_and_compute_node_id_from_instance_id(instance_id):
     return tokens[0], tokens[1]
 
 
-def get_pool_name(cloud_region, image_id, hardware_id, use_low_priority):
-    image_display_name = images.get_image_display_name(image_id)
-    pool_id = '{}-{}-{}'.format(cloud_region, image_display_name, hardware_id)
+def is_linux_pool(pool):
+    """
+    Returns true if the pool's node agent is a Linux agent.
+    :param pool:
+    :type pool: azure.batch.models.CloudPool
+    :rtype: bool
+    """
+    vm_config = pool.virtual_machine_configuration
+    if vm_config and vm_config.node_agent_sku_id:
+        return not vm_config.node_agent_sku_id.startswith('batch.node.windows')
+    return True
+
+
+def lower_pool_target(client, pool_id, target_dedicated, target_low_priority, count):
+    """
+    Requests a resize of the pool to count fewer nodes than the given target
+    :param client:
+    :type client: Batch
+    """
+    dedicated, low_priority = resizer.get_lowered_target(target_dedicated, target_low_priority, count)
+    return client.grow_pool(pool_id, target_dedicated, target_low_priority,
+                            dedicated - target_dedicated, low_priority - target_low_priority)
+
+
+def log_failed_license_tasks(job_id, task_results):
+    """
+    Logs the license tasks which couldn't be added, the job has fewer license
+    tasks than the pool has nodes until it's next reconciled
+    :type task_results: list of azure.batch.models.TaskAddResult
+    """
+    failed = [r for r in task_results if r.status != batchmodels.TaskAddStatus.success]
+    for task_result in failed:
+        error = task_result.error
+        ClientUtils.LogText('Error adding task {} to job {}, status={}, code={}, message={}'.format(
+            task_result.task_id, job_id, task_result.status,
+            error.code if error else None, error.message if error else None))
+    if failed:
+        ClientUtils.LogText('{} of {} license tasks could not be added to job {}'.format(
+            len(failed), len(task_results), job_id))
+
+
+def get_pool_name(cloud_region, image, hardware_id, use_low_priority):
+    """
+    :param image: The pool's image
+    :type image: catalog.CatalogImage
+    """
+    pool_id = '{}-{}-{}'.format(cloud_region, image.display_name, hardware_id)
     if use_low_priority:
         pool_id = '{}-lp'.format(pool_id)
     return pool_id
@@ -478,15 +1050,236 @@ def get_deadline_starttask_cmd(batch_config, starttask_script, os_image):
     return deadline_cmd
 
 
+# The pool and compute node properties read by the plugin callbacks and mappers,
+# used to limit the size of listing responses.
+POOL_SUMMARY_SELECT = ','.join([
+    'id',
+    'state',
+    'allocationState',
+    'vmSize',
+    'virtualMachineConfiguration',
+    'currentDedicatedNodes',
+    'currentLowPriorityNodes',
+    'targetDedicatedNodes',
+    'targetLowPriorityNodes',
+    'enableAutoScale',
+    'autoScaleFormula',
+    'resizeErrors',
+    'metadata',
+])
+
+NODE_SUMMARY_SELECT = ','.join([
+    'id',
+    'state',
+    'ipAddress',
+    'endpointConfiguration',
+    'recentTasks',
+])
+
+# The NODE_SUMMARY_SELECT properties of a compute node, cached in place of the node
+NodeSummary = collections.namedtuple('NodeSummary', ['id', 'state', 'ip_address', 'endpoint_configuration',
+                                                     'recent_tasks'])
+
+
+def get_node_summary(node):
+    """
+    Copies the summary properties of a node listed with NODE_SUMMARY_SELECT.
+    Only the running tasks are kept, they're all the scale down planner reads.
+    :type node: azure.batch.models.ComputeNode
+    :rtype: NodeSummary
+    """
+    running = [t for t in node.recent_tasks or [] if t.task_state == batchmodels.TaskState.running]
+    return NodeSummary(node.id, node.state, node.ip_address, node.endpoint_configuration, running)
+
+# The number of compute nodes requested per page when listing nodes
+NODE_PAGE_SIZE = 1000
+
+# Settings the image and hardware catalog is built from
+CATALOG_SETTINGS = frozenset([
+    'vm_sizes',
+    'managed_image_id_1',
+    'managed_image_os_1',
+    'managed_image_id_2',
+    'managed_image_os_2',
+])
+
+# Settings the warm pool manager is built from
+WARM_POOL_SETTINGS = frozenset([
+    'warm_pool_floors',
+    'warm_pool_schedule',
+])
+
+# Settings the callback profiler is built from
+PROFILING_SETTINGS = frozenset([
+    'profile_callbacks',
+    'profile_budget',
+    'profile_sample_percent',
+    'profile_directory',
+])
+
+# Settings the Batch service client is built from
+CLIENT_SETTINGS = frozenset([
+    'batch_url',
+    'batch_sp_tenant_id',
+    'batch_sp_app_id',
+    'batch_sp_app_key',
+    'authority_uri',
+    'max_parallel_requests',
+    'max_requests_per_second',
+    'max_request_attempts',
+])
+
+# The maximum number of hostnames read together when one isn't cached
+HOSTNAME_BATCH_SIZE = 32
+
+# Seconds between checks of the warm node floors
+WARM_POOL_INTERVAL = 60
+
+# Seconds between checks for empty pools
+IDLE_POOL_INTERVAL = 60
+
+# The maximum number of tasks the Batch service accepts in a single add collection request
+MAX_TASKS_PER_REQUEST = 100
+
+# How many times license tasks which failed with a server error are submitted
+LICENSE_TASK_ATTEMPTS = 3
+
+
+def get_license_task(task_id, is_linux_pool):
+    """
+    Returns the task which configures the software entitlement (license) token on a node.
+
+    :param task_id: The task id
+    :type task_id: str
+    :param is_linux_pool:
+    :type is_linux_pool: bool
+    :rtype: azure.batch.models.TaskAddParameter
+    """
+    if is_linux_pool:
+        cmd_line = '/bin/bash -c azure-batch-ses.sh'
+        script = 'azure-batch-ses.sh'
+        script_url = 'https://raw.githubusercontent.com/Azure/azure-deadline/master/CloudProviderPlugin/Scripts/azure-batch-ses.sh'
+    else:
+        cmd_line = 'powershell.exe -file azure-batch-ses.ps1'
+        script = 'azure-batch-ses.ps1'
+        script_url = 'https://raw.githubusercontent.com/Azure/azure-deadline/master/CloudProviderPlugin/Scripts/azure-batch-ses.ps1'
+
+    return batchmodels.TaskAddParameter(
+        id=task_id,
+        command_line=cmd_line,
+        resource_files=[batchmodels.ResourceFile(script_url, script)],
+        constraints=batchmodels.TaskConstraints(max_task_retry_count=3),
+        user_identity=batchmodels.UserIdentity(
+            auto_user=batchmodels.AutoUserSpecification(
+                scope=batchmodels.AutoUserScope.pool,
+                elevation_level=batchmodels.ElevationLevel.admin
+            ))
+    )
+
+
 class Batch:
-    def __init__(self, batch_config):
+    def __init__(self, batch_config, metrics=None):
+        """
+        :param metrics: Records the calls to the wrapper's methods and the requests made
+        :type metrics: metrics.MetricsRegistry
+        """
+        self.batch_config = batch_config
+        self.metrics = metrics
+        self._client = None
+        self._credentials = None
+        self._client_lock = threading.Lock()
+        self.retry_policy = throttle.RetryPolicy(
+            limiter=throttle.TokenBucket(batch_config.max_requests_per_second),
+            max_attempts=batch_config.max_request_attempts)
+        self.state_cache = statecache.StateCache(batch_config.state_cache_ttl)
+        self.resizer = resizer.PoolResizer(self,
+                                           interval=batch_config.resize_interval,
+                                           coalesce_window=batch_config.resize_coalesce_window)
+
+    def get_workers(self):
+        """
+        Returns the background workers, they're stopped by the plugin's Cleanup
+        :rtype: list of background.PeriodicWorker
+        """
+        return [self.resizer.worker]
+
+    def reconfigure(self, batch_config, changed):
+        """
+        Switches to a changed config. The service client is only rebuilt if a
+        setting it's built from changed, pending resizes and removals are kept.
+        :param changed: The names of the changed settings
+        :type changed: set of str
+        """
         self.batch_config = batch_config
+        self.resizer.reconfigure(batch_config.resize_interval, batch_config.resize_coalesce_window)
+        self.state_cache.ttl = batch_config.state_cache_ttl
+        if changed & CLIENT_SETTINGS:
+            with self._client_lock:
+                self.retry_policy = throttle.RetryPolicy(
+                    limiter=throttle.TokenBucket(batch_config.max_requests_per_second),
+                    max_attempts=batch_config.max_request_attempts)
+                self._client = None
+                self._credentials = None
+            # The account may have changed
+            self.state_cache.clear()
+
+    def get_client_stats(self):
+        """
+        Returns the token cache and request counters for the shared client
+        :return: token fetch and cache hit counts, request, retry and throttle counts
+        :rtype: dict
+        """
+        if not self._credentials:
+            stats = {'token_fetches': 0, 'token_cache_hits': 0}
+        else:
+            stats = self._credentials.get_stats()
+        stats.update(self.retry_policy.get_stats())
+        return stats
+
+    def list_pools(self, id_prefix=None, select=None, use_cache=True):
+        """
+        Returns the pools in the account
+        :param id_prefix: Only returns pools whose id starts with the prefix, filtered by the service
+        :type id_prefix: str
+        :param select: Comma separated list of properties to return, e.g. POOL_SUMMARY_SELECT
+        :type select: str
+        :param use_cache: If false, always fetches the pools from the Batch service
+        :type use_cache: bool
+        :rtype: list of azure.batch.models.CloudPool
+        """
+        cache_key = (id_prefix, select)
+        if use_cache:
+            pools = self.state_cache.get_pools(key=cache_key)
+            if pools is not statecache.StateCache.MISS:
+                return pools
+
+        list_options = None
+        if id_prefix or select:
+            odata_filter = None
+            if id_prefix:
+                odata_filter = "startswith(id,'{}')".format(id_prefix.replace("'", "''"))
+            list_options = batchmodels.PoolListOptions(filter=odata_filter, select=select)
 
-    def list_pools(self):
         client = self._get_batch_client()
-        return client.pool.list()
+        pools = list(client.pool.list(pool_list_options=list_options))
+        self.state_cache.set_pools(pools, key=cache_key, projected=select is not None)
+        return pools
 
     def create_job(self, job_id, pool_id, total_nodes, is_linux_pool):
+        """
+        Creates the license job for a pool if it doesn't exist and reconciles
+        its license tasks with the pool's node count.
+        :param job_id:
+        :type job_id: str
+        :param pool_id:
+        :type pool_id: str
+        :param total_nodes: The total (target) number of nodes in the pool
+        :type total_nodes: int
+        :param is_linux_pool:
+        :type is_linux_pool: bool
+        :return: The results for any tasks added
+        :rtype: list of azure.batch.models.TaskAddResult
+        """
         client = self._get_batch_client()
         try:
             pool_info = batchmodels.PoolInformation(pool_id=pool_id)
@@ -504,30 +1297,7 @@ class Batch:
                     print('Error creating job, code={}, message={}'.format(be.error.code, be.error.message))
                     raise
 
-            if is_linux_pool:
-                cmd_line = '/bin/bash -c azure-batch-ses.sh'
-                script = 'azure-batch-ses.sh'
-                script_url = 'https://raw.githubusercontent.com/Azure/azure-deadline/master/CloudProviderPlugin/Scripts/azure-batch-ses.sh'
-            else:
-                cmd_line = 'powershell.exe -file azure-batch-ses.ps1'
-                script = 'azure-batch-ses.ps1'
-                script_url = 'https://raw.githubusercontent.com/Azure/azure-deadline/master/CloudProviderPlugin/Scripts/azure-batch-ses.ps1'
-
-            task = batchmodels.TaskAddParameter(
-                id='',
-                command_line=cmd_line,
-                resource_files=[batchmodels.ResourceFile(script_url, script)],
-                constraints=batchmodels.TaskConstraints(max_task_retry_count=3),
-                user_identity=batchmodels.UserIdentity(
-                    auto_user=batchmodels.AutoUserSpecification(
-                        scope=batchmodels.AutoUserScope.pool,
-                        elevation_level=batchmodels.ElevationLevel.admin
-                    ))
-            )
-
-            for i in range(total_nodes):
-                task.id = str(uuid.uuid4())
-                client.task.add(job_id=job.id, task=task)
+            return self.reconcile_license_tasks(job.id, total_nodes, is_linux_pool)
 
         except batchmodels.BatchErrorException as be:
             if be.error:
@@ -537,6 +1307,109 @@ class Batch:
                         print('Key={}, Value={}'.format(e.key, e.value))
             raise
 
+    def reconcile_license_tasks(self, job_id, total_nodes, is_linux_pool):
+        """
+        Makes the number of outstanding (active, preparing or running) license tasks
+        in the job match the number of nodes. Only the missing tasks are added and
+        surplus queued tasks are deleted when the pool shrinks.
+        :param job_id:
+        :type job_id: str
+        :param total_nodes: The total (target) number of nodes in the pool
+        :type total_nodes: int
+        :param is_linux_pool:
+        :type is_linux_pool: bool
+        :return: The results for any tasks added
+        :rtype: list of azure.batch.models.TaskAddResult
+        """
+        client = self._get_batch_client()
+        list_options = batchmodels.TaskListOptions(
+            filter="state eq 'active' or state eq 'preparing' or state eq 'running'",
+            select='id,state')
+        tasks = list(client.task.list(job_id, task_list_options=list_options))
+
+        if len(tasks) < total_nodes:
+            return self.add_license_tasks(job_id, total_nodes - len(tasks), is_linux_pool)
+
+        surplus = len(tasks) - total_nodes
+        if surplus > 0:
+            # Only queued tasks are removed, running tasks belong to nodes
+            # that are still in the pool and complete on their own.
+            queued = [t.id for t in tasks if t.state == batchmodels.TaskState.active][:surplus]
+            results = parallel.map_bounded(
+                lambda task_id: client.task.delete(job_id, task_id),
+                queued,
+                self.batch_config.max_parallel_requests)
+            for result in results:
+                if not result.succeeded:
+                    print('Error deleting task {} from job {}: {}'.format(result.item, job_id, result.error))
+        return []
+
+    def add_license_tasks(self, job_id, count, is_linux_pool):
+        """
+        Adds license tasks to the job using the task collection API. The tasks are
+        submitted in chunks of MAX_TASKS_PER_REQUEST which are sent concurrently.
+        Tasks the service failed to add with a server error are resubmitted, up
+        to LICENSE_TASK_ATTEMPTS times.
+        Callers log the failed tasks, see log_failed_license_tasks.
+        :param job_id:
+        :type job_id: str
+        :param count: The number of tasks to add
+        :type count: int
+        :param is_linux_pool:
+        :type is_linux_pool: bool
+        :return: The result for each task
+        :rtype: list of azure.batch.models.TaskAddResult
+        """
+        if count <= 0:
+            return []
+
+        tasks = [get_license_task(str(uuid.uuid4()), is_linux_pool) for _ in range(count)]
+        task_results = {}
+        pending = tasks
+        for attempt in range(1, LICENSE_TASK_ATTEMPTS + 1):
+            for task_result in self._add_task_chunks(job_id, pending):
+                if attempt > 1 and task_result.error and task_result.error.code == 'TaskExists':
+                    # The earlier attempt added the task after all
+                    task_result = batchmodels.TaskAddResult(status=batchmodels.TaskAddStatus.success,
+                                                            task_id=task_result.task_id)
+                task_results[task_result.task_id] = task_result
+            pending = [t for t in pending if task_results[t.id].status == batchmodels.TaskAddStatus.server_error]
+            if not pending:
+                break
+
+        return [task_results[t.id] for t in tasks]
+
+    def _add_task_chunks(self, job_id, tasks):
+        """
+        Adds the tasks in concurrent task collection requests. A request which
+        fails as a whole is reported as a server error for each of its tasks.
+        :rtype: list of azure.batch.models.TaskAddResult
+        """
+        client = self._get_batch_client()
+        chunks = [tasks[i:i + MAX_TASKS_PER_REQUEST] for i in range(0, len(tasks), MAX_TASKS_PER_REQUEST)]
+        results = parallel.map_bounded(
+            lambda chunk: client.task.add_collection(job_id, chunk).value,
+            chunks,
+            self.batch_config.max_parallel_requests)
+
+        task_results = []
+        for result in results:
+            if result.succeeded:
+                task_results.extend(result.value)
+                continue
+            print('Error adding tasks to job {}: {}'.format(job_id, result.error_trace))
+            code = 'RequestFailed'
+            message = str(result.error)
+            if isinstance(result.error, batchmodels.BatchErrorException) and result.error.error:
+                code = result.error.error.code
+                message = result.error.error.message
+            for task in result.item:
+                task_results.append(batchmodels.TaskAddResult(
+                    status=batchmodels.TaskAddStatus.server_error,
+                    task_id=task.id,
+                    error=batchmodels.BatchError(code=code, message=message)))
+        return task_results
+
     def delete_job(self, job_id):
         client = self._get_batch_client()
         try:
@@ -549,17 +1422,26 @@ class Batch:
                         print('Key={}, Value={}'.format(e.key, e.value))
             raise
 
-    def get_pool(self, pool_id):
+    def get_pool(self, pool_id, use_cache=True):
         """
         Returns the specified pool, or None
         :param pool_id:
         :type pool_id: str
+        :param use_cache: If false, always fetches the pool from the Batch service
+        :type use_cache: bool
         :return: The pool or None
         :rtype: azure.batch.models.Pool
         """
+        if use_cache:
+            pool = self.state_cache.get_pool(pool_id)
+            if pool is not statecache.StateCache.MISS:
+                return pool
+
         client = self._get_batch_client()
         try:
-            return client.pool.get(pool_id)
+            pool = client.pool.get(pool_id)
+            self.state_cache.set_pool(pool)
+            return pool
         except batchmodels.BatchErrorException as be:
             if be.error:
                 if be.error.code == 'PoolNotFound':
@@ -579,10 +1461,12 @@ class Batch:
         """
         client = self._get_batch_client()
         try:
-            return client.pool.delete(pool_id)
+            client.pool.delete(pool_id)
+            self.state_cache.remove_pool(pool_id)
         except batchmodels.BatchErrorException as be:
             if be.error:
                 if be.error.code == 'PoolNotFound':
+                    self.state_cache.remove_pool(pool_id)
                     return None
                 print('Error deleting pool, code={}, message={}'.format(be.error.code, be.error.message))
                 if be.error.values:
@@ -590,22 +1474,108 @@ class Batch:
                         print('Key={}, Value={}'.format(e.key, e.value))
             raise
 
-    def resize_pool(self, pool_id, target_dedicated, target_low_priority):
+    def grow_pool(self, pool_id, current_dedicated, current_low_priority, delta_dedicated, delta_low_priority):
+        """
+        Adds nodes to the pool and returns immediately. Changes for the same pool
+        within the coalescing window are summed and issued as a single resize.
+        :param current_dedicated: The pool's dedicated target, used if no resize is pending
+        :type current_dedicated: int
+        :param current_low_priority: The pool's low priority target, used if no resize is pending
+        :type current_low_priority: int
+        :param delta_dedicated:
+        :type delta_dedicated: int
+        :param delta_low_priority:
+        :type delta_low_priority: int
+        :return: The combined target size of the pool
+        :rtype: resizer.ResizeTarget
+        """
+        return self.resizer.request_delta(pool_id, current_dedicated, current_low_priority,
+                                          delta_dedicated, delta_low_priority)
+
+    def get_pool_target(self, pool):
+        """
+        Returns the size the pool is heading for, taking into account any pending
+        resize and the desired nodes set in the pool's autoscale formula.
+        :param pool:
+        :type pool: azure.batch.models.CloudPool
+        :return: The dedicated and low priority targets
+        :rtype: tuple of (int, int)
+        """
+        pending = self.get_pending_resize(pool.id)
+        if pending:
+            return pending.target_dedicated, pending.target_low_priority
+
+        if pool.enable_auto_scale:
+            targets = autoscale.get_formula_targets(pool.auto_scale_formula)
+            if targets:
+                desired_nodes, prefer_low_priority = targets
+                if prefer_low_priority:
+                    return 0, desired_nodes
+                return desired_nodes, 0
+
+        return pool.target_dedicated_nodes or 0, pool.target_low_priority_nodes or 0
+
+    def set_pool_metadata(self, pool_id, name, value):
+        """
+        Sets a metadata item on the pool, leaving other items unchanged.
+        """
         client = self._get_batch_client()
         pool = self.get_pool(pool_id)
-        if pool:
-            if pool.allocation_state == batchmodels.AllocationState.resizing:
-                client.pool.stop_resize(pool_id)
+        metadata = [m for m in (pool.metadata or []) if m.name != name] if pool else []
+        metadata.append(batchmodels.MetadataItem(name, value))
+        client.pool.patch(pool_id, batchmodels.PoolPatchParameter(metadata=metadata))
+        self.state_cache.patch_pool(pool_id, metadata=metadata)
+
+    def apply_autoscale_target(self, pool_id, desired_nodes, prefer_low_priority):
+        """
+        Updates the desired nodes in the pool's autoscale formula. The service
+        evaluates the formula and resizes the pool.
+        """
+        client = self._get_batch_client()
+        formula = autoscale.get_autoscale_formula(desired_nodes, prefer_low_priority)
+        self._evaluate_autoscale_formula(pool_id, formula)
+        client.pool.enable_auto_scale(
+            pool_id,
+            auto_scale_formula=formula,
+            auto_scale_evaluation_interval=datetime.timedelta(minutes=self.batch_config.autoscale_interval))
+        self.state_cache.patch_pool(pool_id, auto_scale_formula=formula)
+
+    def _evaluate_autoscale_formula(self, pool_id, formula):
+        """
+        Evaluates the formula against the pool without applying it
+        :raises: autoscale.FormulaError if the service couldn't evaluate it
+        :rtype: azure.batch.models.AutoScaleRun
+        """
+        client = self._get_batch_client()
+        run = client.pool.evaluate_auto_scale(pool_id, formula)
+        if run.error:
+            raise autoscale.FormulaError('Autoscale formula for pool {} failed to evaluate: {} {}'.format(
+                pool_id, run.error.code, run.error.message))
+        return run
 
-                while (pool.allocation_state != batchmodels.AllocationState.steady):
-                    time.sleep(15)
-                    pool = self.get_pool(pool_id)
+    def get_pending_resize(self, pool_id):
+        """
+        Returns the target size of the pool that hasn't been applied yet, or None
+        :rtype: resizer.ResizeTarget
+        """
+        return self.resizer.get_pending_target(pool_id)
 
-            resize_param = batchmodels.PoolResizeParameter(
-                target_dedicated_nodes=target_dedicated,
-                target_low_priority_nodes=target_low_priority
-            )
-            client.pool.resize(pool_id, resize_param)
+    def apply_resize(self, pool_id, target_dedicated, target_low_priority):
+        client = self._get_batch_client()
+        resize_param = batchmodels.PoolResizeParameter(
+            target_dedicated_nodes=target_dedicated,
+            target_low_priority_nodes=target_low_priority
+        )
+        client.pool.resize(pool_id, resize_param)
+        self.state_cache.patch_pool(pool_id,
+                                    target_dedicated_nodes=target_dedicated,
+                                    target_low_priority_nodes=target_low_priority,
+                                    allocation_state=batchmodels.AllocationState.resizing)
+
+    def stop_resize(self, pool_id):
+        client = self._get_batch_client()
+        client.pool.stop_resize(pool_id)
+        self.state_cache.invalidate_pool(pool_id)
 
     def create_pool(self, pool_id, vm_size, target_dedicated, target_low_priority,
                     batch_image_spec, starttask_cmd,
@@ -624,6 +1594,14 @@ class Batch:
             certificate_references=[batchmodels.CertificateReference(sp_cert_thumb, 'sha1')]
         )
 
+        if self.batch_config.use_autoscale:
+            pool.target_dedicated_nodes = None
+            pool.target_low_priority_nodes = None
+            pool.enable_auto_scale = True
+            pool.auto_scale_formula = autoscale.get_autoscale_formula(
+                target_dedicated + target_low_priority, target_low_priority > 0)
+            pool.auto_scale_evaluation_interval = datetime.timedelta(minutes=self.batch_config.autoscale_interval)
+
         if app_licenses:
             pool.application_licenses = app_licenses
 
@@ -688,6 +1666,9 @@ class Batch:
         try:
             client = self._get_batch_client()
             client.pool.add(pool)
+            self.state_cache.invalidate_pool(pool_id)
+            self.state_cache.invalidate_pool_list()
+            return pool
         except batchmodels.BatchErrorException as be:
             if be.error:
                 print('Error creating pool, code={}, message={}'.format(be.error.code, be.error.message))
@@ -696,53 +1677,228 @@ class Batch:
                         print('Key={}, Value={}'.format(e.key, e.value))
             raise
 
-    def list_compute_nodes(self, pool_id):
+    def list_compute_nodes(self, pool_id, check_pool=True, use_cache=True, select=None):
+        """
+        Lists the compute nodes in the specified pool
+        :param pool_id:
+        :type pool_id: str
+        :param check_pool: If true, returns None when the pool doesn't exist.
+         Callers that already hold the pool can skip the extra round trip.
+        :type check_pool: bool
+        :param use_cache: If false, always fetches the nodes from the Batch service
+        :type use_cache: bool
+        :param select: Comma separated list of properties to return, e.g. NODE_SUMMARY_SELECT
+        :type select: str
+        :return: The compute nodes or None
+        :rtype: list of azure.batch.models.ComputeNode
+        """
+        if use_cache:
+            nodes = self.state_cache.get_nodes(pool_id, key=select)
+            if nodes is not statecache.StateCache.MISS:
+                return nodes
+
         client = self._get_batch_client()
-        pool = self.get_pool(pool_id)
-        if not pool:
-            return None
-        return client.compute_node.list(pool_id)
+        if check_pool:
+            pool = self.get_pool(pool_id)
+            if not pool:
+                return None
+
+        list_options = None
+        if select:
+            list_options = batchmodels.ComputeNodeListOptions(select=select)
+        nodes = list(client.compute_node.list(pool_id, compute_node_list_options=list_options))
+        self.state_cache.set_nodes(pool_id, nodes, key=select)
+        return nodes
+
+    def iter_compute_nodes(self, pool_id, select=None, use_cache=True):
+        """
+        Yields the compute nodes in the specified pool as they're listed, a page
+        at a time. Cached nodes are used if available. A complete listing with
+        NODE_SUMMARY_SELECT is cached as NodeSummary records, which hold less
+        than the nodes, other listings aren't cached.
+        :param pool_id:
+        :type pool_id: str
+        :param select: Comma separated list of properties to return, e.g. NODE_SUMMARY_SELECT
+        :type select: str
+        :rtype: collections.Iterable[azure.batch.models.ComputeNode]
+        """
+        if use_cache:
+            nodes = self.state_cache.get_nodes(pool_id, key=select)
+            if nodes is not statecache.StateCache.MISS:
+                for cn in nodes:
+                    yield cn
+                return
 
-    def reboot_compute_node(self, pool_id, compute_node_id):
         client = self._get_batch_client()
-        pool = self.get_pool(pool_id)
+        list_options = batchmodels.ComputeNodeListOptions(select=select, max_results=NODE_PAGE_SIZE)
+        summaries = None
+        if select == NODE_SUMMARY_SELECT and self.state_cache.enabled:
+            summaries = []
+        for cn in client.compute_node.list(pool_id, compute_node_list_options=list_options):
+            if summaries is not None:
+                summaries.append(get_node_summary(cn))
+            yield cn
+        if summaries is not None:
+            self.state_cache.set_nodes(pool_id, summaries, key=select)
+
+    def reboot_compute_nodes(self, pool_to_nodes):
+        """
+        Reboots compute nodes in parallel. Each pool is checked once, nodes in
+        pools that no longer exist fail.
+        :param pool_to_nodes: The ids of the nodes to reboot by pool id
+        :type pool_to_nodes: dict of str to list of str
+        :return: The (pool id, compute node id) pairs that couldn't be rebooted
+        :rtype: set of (str, str)
+        """
+        client = self._get_batch_client()
+        max_workers = self.batch_config.max_parallel_requests
+        pool_results = parallel.map_bounded(self.get_pool, list(pool_to_nodes), max_workers)
+
+        failed = set()
+        nodes = []
+        for result in pool_results:
+            pool_nodes = [(result.item, n) for n in pool_to_nodes[result.item]]
+            if result.succeeded and result.value:
+                nodes.extend(pool_nodes)
+                continue
+            if result.succeeded:
+                print('Error rebooting nodes, pool {} not found'.format(result.item))
+            else:
+                print('Error getting pool {}: {}'.format(result.item, result.error))
+            failed.update(pool_nodes)
+
+        results = parallel.map_bounded(
+            lambda node: client.compute_node.reboot(*node),
+            nodes,
+            max_workers)
+        for result in results:
+            if not result.succeeded:
+                print('Error rebooting node {} in pool {}: {}'.format(result.item[1], result.item[0], result.error))
+                failed.add(result.item)
+
+        for pool_id in set(pool_id for pool_id, _ in nodes):
+            self.state_cache.invalidate_nodes(pool_id)
+        return failed
+
+    def remove_compute_nodes(self, pool_id, compute_node_ids, deallocation_option=None, pool=None):
+        """
+        Removes nodes from the pool. The service removes at most
+        resizer.MAX_NODES_PER_REMOVAL nodes per request and none while the pool
+        is resizing, so the first chunk is removed straight away if the pool is
+        steady and the rest are queued and removed in the background.
+        :param deallocation_option: What to do with tasks running on the nodes, defaults to terminate
+        :type deallocation_option: azure.batch.models.ComputeNodeDeallocationOption
+        :param pool: The pool, if already fetched
+        :type pool: azure.batch.models.CloudPool
+        :return: The ids of the nodes that couldn't be removed
+        :rtype: list of str
+        """
+        pool = pool or self.get_pool(pool_id)
         if not pool:
-            return None
-        client.compute_node.reboot(pool_id, compute_node_id)
+            return []
+
+        failed = []
+        compute_node_ids = list(compute_node_ids)
+        if pool.allocation_state == batchmodels.AllocationState.steady and \
+                not self.resizer.get_pending_removals(pool_id):
+            node_ids = compute_node_ids[:resizer.MAX_NODES_PER_REMOVAL]
+            compute_node_ids = compute_node_ids[len(node_ids):]
+            try:
+                self.apply_removal(pool_id, node_ids, deallocation_option, bool(pool.enable_auto_scale))
+            except Exception as e:
+                if throttle.get_status_code(e) == 409:
+                    # The pool has started resizing since it was fetched
+                    compute_node_ids = node_ids + compute_node_ids
+                else:
+                    print('Error removing nodes from pool {}: {}'.format(pool_id, e))
+                    failed = node_ids
 
-    def remove_compute_nodes(self, pool_id, compute_node_ids):
+        if compute_node_ids:
+            self.resizer.request_removal(pool_id, compute_node_ids, deallocation_option)
+        return failed
+
+    def apply_removal(self, pool_id, compute_node_ids, deallocation_option=None, auto_scale=False):
+        """
+        Removes up to resizer.MAX_NODES_PER_REMOVAL nodes from a steady pool
+        :param auto_scale: Whether the pool is sized by an autoscale formula
+        :type autoscale: bool
+        """
         client = self._get_batch_client()
-        pool = self.get_pool(pool_id)
-        if not pool:
-            return None
         remove_param = batchmodels.NodeRemoveParameter(
             node_list=compute_node_ids,
-            node_deallocation_option=batchmodels.ComputeNodeDeallocationOption.terminate
+            node_deallocation_option=deallocation_option or batchmodels.ComputeNodeDeallocationOption.terminate
         )
         client.pool.remove_nodes(pool_id, remove_param)
+        self.state_cache.invalidate_pool(pool_id)
+        self.resizer.on_removed(pool_id, len(compute_node_ids), auto_scale)
 
     def get_compute_node_hostname(self, pool_id, compute_node_id):
+        """
+        Reads the hostname the start task wrote on the node
+        :rtype: str
+        """
         client = self._get_batch_client()
-        pool = self.get_pool(pool_id)
-        if not pool:
-            return None
-        resp = client.file.get_from_compute_node(pool_id, compute_node_id, '/startup/wd/hostname.txt')
-        print('Response: {0}'.format(resp))
-        type(resp)
+        content = client.file.get_from_compute_node(pool_id, compute_node_id, hostnames.HOSTNAME_FILE_PATH)
+        return hostnames.decode_hostname(b''.join(content))
 
+    def get_compute_node_hostnames(self, nodes):
+        """
+        Reads the hostnames of many nodes concurrently. Nodes whose hostname
+        can't be read, e.g. because the start task hasn't run yet, are left out.
+        :param nodes: (pool id, compute node id) pairs
+        :type nodes: list of (str, str)
+        :return: The hostnames by (pool id, compute node id)
+        :rtype: dict of (str, str) to str
+        """
+        results = parallel.map_bounded(
+            lambda node: self.get_compute_node_hostname(*node),
+            nodes,
+            self.batch_config.max_parallel_requests)
+
+        resolved = {}
+        for result in results:
+            if not result.succeeded:
+                print('Error reading the hostname of node {} in pool {}: {}'.format(
+                    result.item[1], result.item[0], result.error))
+            elif result.value:
+                resolved[result.item] = result.value
+        return resolved
 
     def _get_batch_client(self):
-        batch_client = batchsc.BatchServiceClient(
-            self._get_batch_credentials(),
-            base_url=self.batch_config.batch_url)
-        return batch_client
+        """
+        Returns the shared BatchServiceClient, creating it on first use.
+        The client signs requests with a cached token and keeps its HTTP
+        session alive between calls. Requests are rate limited and retried.
+        :rtype: azure.batch.batch_service_client.BatchServiceClient
+        """
+        with self._client_lock:
+            if not self._client:
+                # Imported here as it pulls in msrest and requests
+                import batchauth
+                get_credentials = self._get_batch_credentials
+                if self.metrics:
+                    get_credentials = self.metrics.wrap('auth', 'get_token', get_credentials)
+                self._credentials = batchauth.CachedTokenCredentials(
+                    get_credentials,
+                    pool_size=self.batch_config.max_parallel_requests)
+                batch_client = batchsc.BatchServiceClient(
+                    self._credentials,
+                    base_url=self.batch_config.batch_url)
+                batch_client.config.keep_alive = True
+                self._client = throttle.ThrottledClient(batch_client, self.retry_policy, self.metrics,
+                                                        self._credentials.invalidate)
+            return self._client
 
     def _get_batch_credentials(self):
         resource_uri = 'https://batch.core.windows.net/'
-        return azure.common.credentials.ServicePrincipalCredentials(
+        return credentials.ServicePrincipalCredentials(
             self.batch_config.batch_sp_app_id,
             self.batch_config.batch_sp_app_key,
             tenant=self.batch_config.batch_sp_tenant_id,
             auth_uri=self.batch_config.authority_uri,
             resource=resource_uri,
         )
+
+
+# Calls to the wrapper's methods are recorded in its metrics, the requests they make are recorded separately
+metrics.instrument_methods(Batch, 'batch', exclude=['close', 'reconfigure', 'get_client_stats'])
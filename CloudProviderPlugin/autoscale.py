@@ -0,0 +1,271 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import re
+
+# The variables the plugin sets in the autoscale formula
+DESIRED_NODES_VARIABLE = '$desiredNodes'
+PREFER_LOW_PRIORITY_VARIABLE = '$preferLowPriority'
+
+AUTOSCALE_FORMULA_TEMPLATE = (
+    '{desired} = {desired_nodes};\n'
+    '{prefer_low_priority} = {prefer_low_priority_value};\n'
+    '$TargetDedicatedNodes = {prefer_low_priority} == 1 ? 0 : {desired};\n'
+    '$TargetLowPriorityNodes = {prefer_low_priority} == 1 ? {desired} : 0;\n'
+    '$NodeDeallocationOption = {deallocation_option};'
+)
+
+
+def get_autoscale_formula(desired_nodes, prefer_low_priority, deallocation_option='taskcompletion'):
+    """
+    Returns a Batch autoscale formula which sizes the pool to the desired
+    number of dedicated or low priority nodes.
+    :param desired_nodes: The number of nodes
+    :type desired_nodes: int
+    :param prefer_low_priority: If true, low priority nodes are used
+    :type prefer_low_priority: bool
+    :param deallocation_option: What happens to running tasks when nodes are removed
+    :type deallocation_option: str
+    :rtype: str
+    """
+    return AUTOSCALE_FORMULA_TEMPLATE.format(
+        desired=DESIRED_NODES_VARIABLE,
+        desired_nodes=int(max(0, desired_nodes)),
+        prefer_low_priority=PREFER_LOW_PRIORITY_VARIABLE,
+        prefer_low_priority_value=1 if prefer_low_priority else 0,
+        deallocation_option=deallocation_option)
+
+
+def get_formula_targets(formula):
+    """
+    Evaluates the formula and returns the targets it sets.
+    :param formula: An autoscale formula, e.g. from get_autoscale_formula
+    :type formula: str
+    :return: The desired nodes and whether low priority nodes are preferred, or None
+     if the formula wasn't generated by the plugin
+    :rtype: tuple of (int, bool)
+    """
+    if not formula:
+        return None
+    try:
+        variables = evaluate_formula(formula)
+    except FormulaError:
+        return None
+    if DESIRED_NODES_VARIABLE not in variables:
+        return None
+    return int(variables[DESIRED_NODES_VARIABLE]), bool(variables.get(PREFER_LOW_PRIORITY_VARIABLE))
+
+
+class FormulaError(Exception):
+    pass
+
+
+_TOKEN_RE = re.compile(r'\s*(?:(\d+\.\d*|\.\d+|\d+)|(\$\w+)|([A-Za-z_]\w*)|(==|!=|<=|>=|&&|\|\||[-+*/<>!?:;=(),]))')
+
+_FUNCTIONS = {
+    'max': max,
+    'min': min,
+    'sum': lambda *values: sum(values),
+    'avg': lambda *values: float(sum(values)) / len(values),
+}
+
+
+def evaluate_formula(formula, variables=None):
+    """
+    Evaluates an autoscale formula locally. Supports the subset of the Batch
+    formula language used by the plugin: assignments, numbers, arithmetic,
+    comparison and logical operators, the ternary operator, max/min/sum/avg
+    and keywords such as taskcompletion, which evaluate to their name.
+    :param formula: The formula
+    :type formula: str
+    :param variables: Initial values for service defined variables, e.g. $PendingTasks
+    :type variables: dict
+    :return: The value of every variable after evaluation
+    :rtype: dict
+    """
+    parser = _FormulaParser(_tokenize(formula), dict(variables or {}))
+    return parser.parse()
+
+
+def _tokenize(formula):
+    tokens = []
+    pos = 0
+    formula = formula.rstrip()
+    while pos < len(formula):
+        match = _TOKEN_RE.match(formula, pos)
+        if not match:
+            raise FormulaError('Unexpected character at {}: {}'.format(pos, formula[pos:pos + 10]))
+        number, variable, name, op = match.groups()
+        if number is not None:
+            tokens.append(('number', float(number)))
+        elif variable is not None:
+            tokens.append(('variable', variable))
+        elif name is not None:
+            tokens.append(('name', name))
+        else:
+            tokens.append(('op', op))
+        pos = match.end()
+    return tokens
+
+
+class _FormulaParser:
+    def __init__(self, tokens, variables):
+        self.tokens = tokens
+        self.pos = 0
+        self.variables = variables
+
+    def parse(self):
+        while self._peek() is not None:
+            if self._accept('op', ';'):
+                continue
+            kind, name = self._expect('variable')
+            self._expect('op', '=')
+            self.variables[name] = self._ternary()
+            if self._peek() is not None:
+                self._expect('op', ';')
+        return self.variables
+
+    def _ternary(self):
+        condition = self._or()
+        if self._accept('op', '?'):
+            when_true = self._ternary()
+            self._expect('op', ':')
+            when_false = self._ternary()
+            return when_true if condition else when_false
+        return condition
+
+    def _or(self):
+        value = self._and()
+        while self._accept('op', '||'):
+            right = self._and()
+            value = 1.0 if (value or right) else 0.0
+        return value
+
+    def _and(self):
+        value = self._comparison()
+        while self._accept('op', '&&'):
+            right = self._comparison()
+            value = 1.0 if (value and right) else 0.0
+        return value
+
+    def _comparison(self):
+        value = self._additive()
+        for op in ('==', '!=', '<=', '>=', '<', '>'):
+            if self._accept('op', op):
+                right = self._additive()
+                result = {
+                    '==': value == right,
+                    '!=': value != right,
+                    '<=': value <= right,
+                    '>=': value >= right,
+                    '<': value < right,
+                    '>': value > right,
+                }[op]
+                return 1.0 if result else 0.0
+        return value
+
+    def _additive(self):
+        value = self._multiplicative()
+        while True:
+            if self._accept('op', '+'):
+                value = value + self._multiplicative()
+            elif self._accept('op', '-'):
+                value = value - self._multiplicative()
+            else:
+                return value
+
+    def _multiplicative(self):
+        value = self._unary()
+        while True:
+            if self._accept('op', '*'):
+                value = value * self._unary()
+            elif self._accept('op', '/'):
+                divisor = self._unary()
+                if divisor == 0:
+                    raise FormulaError('Division by zero')
+                value = float(value) / divisor
+            else:
+                return value
+
+    def _unary(self):
+        if self._accept('op', '-'):
+            return -self._unary()
+        if self._accept('op', '!'):
+            return 0.0 if self._unary() else 1.0
+        return self._primary()
+
+    def _primary(self):
+        token = self._next()
+        kind, value = token
+        if kind == 'number':
+            return value
+        if kind == 'variable':
+            if value not in self.variables:
+                raise FormulaError('Undefined variable {}'.format(value))
+            return self.variables[value]
+        if kind == 'name':
+            if self._accept('op', '('):
+                function = _FUNCTIONS.get(value.lower())
+                if function is None:
+                    raise FormulaError('Unsupported function {}'.format(value))
+                args = []
+                if not self._accept('op', ')'):
+                    args.append(self._ternary())
+                    while self._accept('op', ','):
+                        args.append(self._ternary())
+                    self._expect('op', ')')
+                return function(*args)
+            # Keywords such as taskcompletion evaluate to their name
+            return value
+        if token == ('op', '('):
+            value = self._ternary()
+            self._expect('op', ')')
+            return value
+        raise FormulaError('Unexpected token {}'.format(value))
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise FormulaError('Unexpected end of formula')
+        self.pos += 1
+        return token
+
+    def _accept(self, kind, value=None):
+        token = self._peek()
+        if token and token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def _expect(self, kind, value=None):
+        token = self._peek()
+        if not token or token[0] != kind or (value is not None and token[1] != value):
+            raise FormulaError('Expected {} but found {}'.format(value or kind, token))
+        self.pos += 1
+        return token
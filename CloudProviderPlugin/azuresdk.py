@@ -0,0 +1,64 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""
+The Azure SDK modules used by the plugin, imported on first use. Deadline
+loads the plugin in processes which only list images and hardware types,
+and never make a Batch call, so they don't pay for importing the SDK.
+"""
+
+import sys
+import threading
+
+_import_lock = threading.Lock()
+
+
+class LazyModule:
+    """
+    Stands in for a module and imports it when one of its attributes is first read
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        with _import_lock:
+            if self._module is None:
+                __import__(self._name)
+                self._module = sys.modules[self._name]
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, name):
+        module = self._module
+        if module is None:
+            module = self._load()
+        return getattr(module, name)
+
+
+batchmodels = LazyModule('azure.batch.models')
+batchsc = LazyModule('azure.batch.batch_service_client')
+credentials = LazyModule('azure.common.credentials')
@@ -0,0 +1,138 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+import traceback
+
+# Seconds to wait for stopped workers to finish their current run, the threads
+# are daemons so one which is still running doesn't block Deadline from exiting
+STOP_TIMEOUT = 30
+
+
+def stop_workers(workers, timeout=STOP_TIMEOUT):
+    """
+    Stops the workers together, all of them are asked to stop before waiting
+    at most timeout seconds in all for their current runs to finish.
+    :type workers: list of PeriodicWorker
+    :param timeout: Seconds to wait
+    :type timeout: float
+    :return: False if a worker was still running when the wait timed out
+    :rtype: bool
+    """
+    for worker in workers:
+        worker.request_stop()
+    deadline = time.time() + timeout
+    stopped = True
+    for worker in workers:
+        if not worker.join(max(0, deadline - time.time())):
+            print('Worker {} did not stop within {} seconds'.format(worker.name, timeout))
+            stopped = False
+    return stopped
+
+
+class PeriodicWorker:
+    """
+    Runs a function on a daemon thread at a fixed interval until stopped.
+    The thread is started on the first call to start() and can be woken
+    early with wake().
+    """
+    def __init__(self, name, interval, func):
+        """
+        :param name: The thread name
+        :type name: str
+        :param interval: Seconds between runs
+        :type interval: float
+        :param func: The function to run, exceptions are printed and ignored
+        """
+        self.name = name
+        self.interval = interval
+        self._func = func
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stopping_thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def wake(self):
+        self._wake_event.set()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """
+        Stops the worker and waits for the current run to finish, see stop_workers
+        :rtype: bool
+        """
+        return stop_workers([self], timeout)
+
+    def request_stop(self):
+        """
+        Asks the worker to stop without waiting for the current run, see join
+        """
+        with self._lock:
+            if self._thread is not None:
+                self._stopping_thread = self._thread
+            self._thread = None
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def join(self, timeout):
+        """
+        Waits for a worker asked to stop to finish its current run
+        :param timeout: Seconds to wait
+        :type timeout: float
+        :return: False if the worker was still running when the wait timed out
+        :rtype: bool
+        """
+        thread = self._stopping_thread
+        if thread is None or thread is threading.current_thread():
+            return True
+        thread.join(timeout)
+        if thread.is_alive():
+            return False
+        self._stopping_thread = None
+        return True
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                self._func()
+            except:
+                traceback.print_exc()
@@ -0,0 +1,168 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+
+import requests
+import requests.adapters
+from msrest.authentication import Authentication
+
+
+class TokenCache:
+    """
+    Thread safe cache for an AAD access token which is refreshed shortly
+    before it expires.
+    """
+    def __init__(self, fetch_token, refresh_margin=300, default_lifetime=3600, clock=time.time):
+        """
+        :param fetch_token: Callable returning a tuple of (access_token, expires_in_seconds)
+        :param refresh_margin: Seconds before expiry at which the token is refreshed
+        :param default_lifetime: Lifetime used when the token has no expiry information
+        :param clock: Callable returning the current time in seconds
+        """
+        self._fetch_token = fetch_token
+        self._refresh_margin = refresh_margin
+        self._default_lifetime = default_lifetime
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0
+        self.token_fetches = 0
+        self.cache_hits = 0
+
+    def get_token(self):
+        """
+        Returns a valid access token, fetching a new one if the cached
+        token is missing or about to expire.
+        :return: The access token
+        :rtype: str
+        """
+        with self._lock:
+            now = self._clock()
+            if self._token and now < self._expires_at - self._refresh_margin:
+                self.cache_hits += 1
+                return self._token
+
+            token, expires_in = self._fetch_token()
+            if expires_in is None:
+                expires_in = self._default_lifetime
+            self._token = token
+            self._expires_at = now + expires_in
+            self.token_fetches += 1
+            return self._token
+
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'token_fetches': self.token_fetches,
+                'token_cache_hits': self.cache_hits
+            }
+
+
+class CachedTokenCredentials(Authentication):
+    """
+    msrest credentials which sign requests with a cached AAD token and
+    share a single pool of HTTP connections between all callers. msrest
+    creates its own sessions and passes them in to be signed, so the
+    pooled adapter is mounted on each session it signs.
+    """
+    def __init__(self, credentials_factory, pool_size=10, refresh_margin=300):
+        """
+        :param credentials_factory: Callable returning msrestazure credentials, e.g.
+         ServicePrincipalCredentials. The credentials are created on the first token fetch.
+        :param pool_size: Maximum number of pooled HTTP connections
+        :param refresh_margin: Seconds before expiry at which the token is refreshed
+        """
+        self._credentials_factory = credentials_factory
+        self._credentials = None
+        self._pool_size = pool_size
+        self._adapter = None
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.token_cache = TokenCache(self._fetch_token, refresh_margin=refresh_margin)
+
+    def signed_session(self, session=None):
+        """
+        Signs the supplied session, or the shared pooled session if none is given.
+        HTTPS requests made with the session use the pooled connections.
+        :param session: The session to sign
+        :type session: requests.Session
+        :rtype: requests.Session
+        """
+        if session is None:
+            session = self._get_pooled_session()
+        else:
+            adapter = self._get_adapter()
+            if session.adapters.get('https://') is not adapter:
+                session.mount('https://', adapter)
+        session.headers['Authorization'] = 'Bearer {}'.format(self.token_cache.get_token())
+        return session
+
+    def invalidate(self):
+        """
+        Drops the cached token, e.g. when the service rejected it, the next
+        request fetches a new one
+        """
+        self.token_cache.invalidate()
+
+    def get_stats(self):
+        return self.token_cache.get_stats()
+
+    def _get_adapter(self):
+        with self._session_lock:
+            if self._adapter is None:
+                self._adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self._pool_size,
+                    pool_maxsize=self._pool_size)
+            return self._adapter
+
+    def _get_pooled_session(self):
+        adapter = self._get_adapter()
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _fetch_token(self):
+        if self._credentials is None:
+            # Creating the credentials acquires the initial token
+            self._credentials = self._credentials_factory()
+        else:
+            self._credentials.set_token()
+
+        token = self._credentials.token
+        expires_in = None
+        if token.get('expires_on'):
+            expires_in = float(token['expires_on']) - time.time()
+        elif token.get('expires_in'):
+            expires_in = float(token['expires_in'])
+        return token['access_token'], expires_in
@@ -0,0 +1,88 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Benchmark for the cold import time of the plugin module. Each sample imports
+the module in a fresh interpreter, as Deadline does when it loads the plugin,
+and checks the Azure SDK isn't imported along with it. Exits with an error if
+it is, so a module level SDK import is caught.
+
+Usage: python bench_import.py [repeats]
+"""
+
+import sys
+import os
+import subprocess
+
+# Imports the modules given on the command line and prints the seconds taken,
+# followed by 1 if the Azure SDK has been imported, otherwise 0
+_SAMPLE = '''
+import sys
+import os
+import time
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+start = time.time()
+for name in sys.argv[1:]:
+    __import__(name)
+elapsed = time.time() - start
+print('{} {}'.format(elapsed, int('azure.batch.models' in sys.modules)))
+'''
+
+SDK_MODULES = ['azure.batch.models', 'azure.batch.batch_service_client', 'azure.common.credentials', 'batchauth']
+
+
+def sample(modules):
+    """
+    :return: The import time in seconds, and whether the SDK was imported
+    :rtype: tuple of (float, bool)
+    """
+    output = subprocess.check_output([sys.executable, '-c', _SAMPLE] + modules,
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed, sdk_loaded = output.decode('utf-8').split()
+    return float(elapsed), sdk_loaded == '1'
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    plugin_samples = [sample(['AzureBatch']) for _ in range(repeats)]
+    sdk_samples = [sample(SDK_MODULES) for _ in range(repeats)]
+
+    print('Cold import, median of {}'.format(repeats))
+    print('  AzureBatch:  {:8.2f} ms'.format(median([s[0] for s in plugin_samples]) * 1000))
+    print('  Azure SDK:   {:8.2f} ms'.format(median([s[0] for s in sdk_samples]) * 1000))
+
+    if any(sdk_loaded for _, sdk_loaded in plugin_samples):
+        print('The Azure SDK was imported with the plugin module')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Micro-benchmark for mapping compute nodes to Deadline cloud instances.
+Compares mapping nodes one at a time, as GetActiveInstances used to, with
+mappers.map_pool_nodes.
+
+Usage: python bench_mappers.py [node count] [repeats]
+"""
+
+import sys
+import os
+import timeit
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import azure.batch.models as batchmodels
+from Deadline.Cloud import CloudInstance
+
+import mappers
+
+_STATES = [
+    batchmodels.ComputeNodeState.idle,
+    batchmodels.ComputeNodeState.running,
+    batchmodels.ComputeNodeState.starting,
+    batchmodels.ComputeNodeState.waiting_for_start_task,
+    batchmodels.ComputeNodeState.offline,
+    batchmodels.ComputeNodeState.preempted,
+]
+
+
+def get_pool():
+    pool = batchmodels.CloudPool(id='azurewestus-rendering-centos73-Standard_F16', vm_size='Standard_F16')
+    pool.virtual_machine_configuration = batchmodels.VirtualMachineConfiguration(
+        image_reference=batchmodels.ImageReference(
+            publisher='batch', offer='rendering-centos73', sku='rendering', version='latest'),
+        node_agent_sku_id='batch.node.centos 7')
+    return pool
+
+
+def get_nodes(count):
+    return [batchmodels.ComputeNode(id='tvmps_{:08d}'.format(i),
+                                    state=_STATES[i % len(_STATES)],
+                                    ip_address='10.0.{}.{}'.format(i // 256 % 256, i % 256))
+            for i in range(count)]
+
+
+def legacy_state_to_status(compute_node_state):
+    # The if chain mappers.compute_node_state_to_deadline_status used before the state table
+    states = batchmodels.ComputeNodeState
+    statuses = mappers.InstanceStatus
+    if compute_node_state == states.idle:
+        return statuses.Running
+    if compute_node_state == states.rebooting:
+        return statuses.Rebooting
+    if compute_node_state == states.reimaging:
+        return statuses.Rebooting
+    if compute_node_state == states.running:
+        return statuses.Running
+    if compute_node_state == states.unusable:
+        return statuses.Unknown
+    if compute_node_state == states.starting:
+        return statuses.Pending
+    if compute_node_state == states.waiting_for_start_task:
+        return statuses.Pending
+    if compute_node_state == states.start_task_failed:
+        return statuses.Unknown
+    if compute_node_state == states.unknown:
+        return statuses.Unknown
+    if compute_node_state == states.leaving_pool:
+        return statuses.Stopping
+    if compute_node_state == states.offline:
+        return statuses.Stopped
+    if compute_node_state == states.preempted:
+        return statuses.Stopped
+    return statuses.Unknown
+
+
+def legacy_map(pool, compute_nodes, region, zone):
+    # Per node mapping, the pool's image id is recomputed for every node
+    instances = []
+    for compute_node in compute_nodes:
+        ci = CloudInstance()
+        ci.ID = mappers.get_cloud_instance_id(pool.id, compute_node.id)
+        ci.Name = compute_node.id
+        ci.HardwareID = pool.vm_size
+        ci.Provider = "AzureBatch"
+        ci.Zone = None
+        ci.ImageID = mappers.get_pool_image_id(pool)
+        ci.Hostname = compute_node.id
+        ci.PublicIP = compute_node.ip_address
+        ci.PrivateIP = compute_node.ip_address
+        ci.Status = legacy_state_to_status(compute_node.state)
+        if compute_node.endpoint_configuration and compute_node.endpoint_configuration.inbound_endpoints:
+            for endpoint in compute_node.endpoint_configuration.inbound_endpoints:
+                if endpoint.name.startswith("RDP") or endpoint.name.startswith("SSH"):
+                    ci.PublicIP = endpoint.public_ip_address
+        ci.RegionName = region
+        ci.Zone = zone
+        instances.append(ci)
+    return instances
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    pool = get_pool()
+    nodes = get_nodes(count)
+
+    legacy = min(timeit.repeat(lambda: legacy_map(pool, nodes, 'westus', 'westus2'), number=1, repeat=repeats))
+    batched = min(timeit.repeat(lambda: mappers.map_pool_nodes(pool, nodes, 'westus', 'westus2'),
+                                number=1, repeat=repeats))
+
+    print('{} nodes, best of {}'.format(count, repeats))
+    print('  per node:       {:8.2f} ms'.format(legacy * 1000))
+    print('  map_pool_nodes: {:8.2f} ms'.format(batched * 1000))
+    print('  speedup:        {:8.2f}x'.format(legacy / batched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+
+from FranticX import Environment2
+
+import hardware
+import images
+
+
+class CatalogImage:
+    """
+    An OS image offered to Deadline along with the values derived from its id
+    """
+    def __init__(self, os_image, image_spec, display_name):
+        """
+        :param os_image: The Deadline image
+        :type os_image: Deadline.Cloud.OSImage
+        :param image_spec: The Batch image, None if the image id isn't recognised
+        :type image_spec: images.BatchImageSpec
+        :param display_name: The image name used in pool ids
+        :type display_name: str
+        """
+        self.os_image = os_image
+        self.image_spec = image_spec
+        self.display_name = display_name
+        self.platform = os_image.Platform
+
+    @property
+    def id(self):
+        return self.os_image.ID
+
+    @property
+    def is_linux(self):
+        return self.platform == Environment2.OS.Linux
+
+
+class Catalog:
+    """
+    The OS images and hardware types available for a plugin configuration,
+    built on first use and not modified afterwards. A new catalog is created
+    when the configuration is reloaded.
+    """
+    def __init__(self, config):
+        """
+        :param config: The plugin configuration
+        :type config: pluginconfig.BatchPluginConfig
+        """
+        self.config = config
+        self._lock = threading.Lock()
+        self._images = None
+        self._images_by_id = None
+        self._images_by_name = None
+        self._hardware_types = None
+        self._hardware_types_by_id = None
+
+    def _build_images(self):
+        with self._lock:
+            if self._images is not None:
+                return
+            os_images = self.config.get_os_images()
+            os_images.extend(images.get_abr_images())
+
+            catalog_images = []
+            for osi in os_images:
+                try:
+                    image_spec = images.image_id_to_image_spec(self.config, osi.ID)
+                except KeyError:
+                    # Unsupported OS for a managed image
+                    image_spec = None
+                catalog_images.append(CatalogImage(osi, image_spec, images.get_image_display_name(osi.ID)))
+
+            self._images_by_id = dict((i.id, i) for i in catalog_images)
+            self._images_by_name = dict((i.display_name, i) for i in catalog_images)
+            self._images = tuple(catalog_images)
+
+    def _build_hardware_types(self):
+        with self._lock:
+            if self._hardware_types is not None:
+                return
+            hardware_types = hardware.vm_sizes_to_hardware_types(self.config.vm_sizes)
+            self._hardware_types_by_id = dict((hwt.ID, hwt) for hwt in hardware_types)
+            self._hardware_types = tuple(hardware_types)
+
+    @property
+    def images(self):
+        """
+        :rtype: tuple of CatalogImage
+        """
+        if self._images is None:
+            self._build_images()
+        return self._images
+
+    def get_os_images(self):
+        """
+        :return: A new list of the OS images
+        :rtype: list of Deadline.Cloud.OSImage
+        """
+        return [i.os_image for i in self.images]
+
+    def get_image(self, image_id):
+        """
+        :return: The image, or None if the image id isn't available
+        :rtype: CatalogImage
+        """
+        if self._images is None:
+            self._build_images()
+        return self._images_by_id.get(image_id)
+
+    def get_image_by_name(self, display_name):
+        """
+        :return: The image, or None if no image has the display name
+        :rtype: CatalogImage
+        """
+        if self._images is None:
+            self._build_images()
+        return self._images_by_name.get(display_name)
+
+    def get_hardware_types(self):
+        """
+        :return: A new list of the hardware types
+        :rtype: list of Deadline.Cloud.HardwareType
+        """
+        if self._hardware_types is None:
+            self._build_hardware_types()
+        return list(self._hardware_types)
+
+    def get_hardware_type(self, vm_size):
+        """
+        :return: The hardware type, or None if the VM size isn't available
+        :rtype: Deadline.Cloud.HardwareType
+        """
+        if self._hardware_types is None:
+            self._build_hardware_types()
+        return self._hardware_types_by_id.get(vm_size)
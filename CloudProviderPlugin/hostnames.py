@@ -0,0 +1,98 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import codecs
+import threading
+
+# Where the start task writes the node's hostname, relative to the node's root directory
+HOSTNAME_FILE_PATH = '/startup/wd/hostname.txt'
+
+
+def decode_hostname(content):
+    """
+    Decodes the hostname file written by the start task. PowerShell writes
+    UTF-16 with a byte order mark, bash writes UTF-8.
+    :param content: The file's bytes
+    :type content: bytes
+    :rtype: str
+    """
+    if content.startswith(codecs.BOM_UTF16_LE) or content.startswith(codecs.BOM_UTF16_BE):
+        text = content.decode('utf-16')
+    else:
+        text = content.decode('utf-8-sig')
+    return text.strip()
+
+
+class HostnameCache:
+    """
+    The hostnames of compute nodes keyed by instance id. A node's hostname
+    doesn't change while it's in the pool, so entries don't expire. They're
+    dropped when the node is no longer listed in its pool.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hostnames = {}
+
+    def get(self, instance_id):
+        """
+        :return: The cached hostname, or None
+        :rtype: str
+        """
+        with self._lock:
+            return self._hostnames.get(instance_id)
+
+    def update(self, hostnames):
+        """
+        :param hostnames: Hostnames by instance id
+        :type hostnames: dict of str to str
+        """
+        with self._lock:
+            self._hostnames.update(hostnames)
+
+    def get_missing(self, instance_ids):
+        """
+        Returns the instance ids which have no cached hostname
+        :rtype: list of str
+        """
+        with self._lock:
+            return [i for i in instance_ids if i not in self._hostnames]
+
+    def forget(self, instance_ids):
+        with self._lock:
+            for instance_id in instance_ids:
+                self._hostnames.pop(instance_id, None)
+
+    def retain(self, instance_ids):
+        """
+        Drops the hostnames of nodes which weren't listed
+        :param instance_ids: The ids of the listed instances
+        """
+        instance_ids = set(instance_ids)
+        with self._lock:
+            for instance_id in list(self._hostnames):
+                if instance_id not in instance_ids:
+                    del self._hostnames[instance_id]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._hostnames)
@@ -25,7 +25,7 @@
 from Deadline.Cloud import OSImage
 from FranticX import Environment2
 
-import azure.batch.models as batchmodels
+from azuresdk import batchmodels
 
 
 class BatchImageSpec:
@@ -23,7 +23,35 @@
 # DEALINGS IN THE SOFTWARE.
 
 from Deadline.Cloud import InstanceStatus, HardwareType, CloudInstance
-from azure.batch.models import ComputeNode, ComputeNodeState
+from azuresdk import batchmodels
+
+
+# Batch compute node state names mapped to Deadline cloud instance statuses
+_STATE_STATUSES = [
+    ('idle', InstanceStatus.Running),
+    ('rebooting', InstanceStatus.Rebooting),
+    ('reimaging', InstanceStatus.Rebooting),
+    ('running', InstanceStatus.Running),
+    ('unusable', InstanceStatus.Unknown),
+    ('starting', InstanceStatus.Pending),
+    ('waiting_for_start_task', InstanceStatus.Pending),
+    ('start_task_failed', InstanceStatus.Unknown),
+    ('unknown', InstanceStatus.Unknown),
+    ('leaving_pool', InstanceStatus.Stopping),
+    ('offline', InstanceStatus.Stopped),
+    ('preempted', InstanceStatus.Stopped),
+]
+
+_deadline_statuses = None
+
+
+def _get_deadline_statuses():
+    # Keyed by ComputeNodeState, built on first use so the SDK isn't imported with the module
+    global _deadline_statuses
+    if _deadline_statuses is None:
+        states = batchmodels.ComputeNodeState
+        _deadline_statuses = dict((getattr(states, name), status) for name, status in _STATE_STATUSES)
+    return _deadline_statuses
 
 
 def compute_node_state_to_deadline_status(compute_node_state):
@@ -32,41 +60,39 @@ def compute_node_state_to_deadline_status(compute_node_state):
     :param compute_node_state: azure.batch.models.ComputeNodeState
     :return: Deadline.Cloud.InstanceStatus
     """
-    if compute_node_state == ComputeNodeState.idle:
-        return InstanceStatus.Running
-    if compute_node_state == ComputeNodeState.rebooting:
-        return InstanceStatus.Rebooting
-    if compute_node_state == ComputeNodeState.reimaging:
-        return InstanceStatus.Rebooting
-    if compute_node_state == ComputeNodeState.running:
-        return InstanceStatus.Running
-    if compute_node_state == ComputeNodeState.unusable:
-        return InstanceStatus.Unknown
-    if compute_node_state == ComputeNodeState.starting:
-        return InstanceStatus.Pending
-    if compute_node_state == ComputeNodeState.waiting_for_start_task:
-        return InstanceStatus.Pending
-    if compute_node_state == ComputeNodeState.start_task_failed:
-        return InstanceStatus.Unknown
-    if compute_node_state == ComputeNodeState.unknown:
-        return InstanceStatus.Unknown
-    if compute_node_state == ComputeNodeState.leaving_pool:
-        return InstanceStatus.Stopping
-    if compute_node_state == ComputeNodeState.offline:
-        return InstanceStatus.Stopped
-    if compute_node_state == ComputeNodeState.preempted:
-        return InstanceStatus.Stopped
-    return InstanceStatus.Unknown
+    return _get_deadline_statuses().get(compute_node_state, InstanceStatus.Unknown)
 
 
 def get_mock_compute_node(id):
-    cn = ComputeNode()
+    cn = batchmodels.ComputeNode()
     cn.id = id
     cn.ip_address = '169.254.0.0'
-    cn.state = ComputeNodeState.starting
+    cn.state = batchmodels.ComputeNodeState.starting
     return cn
 
 
+def get_pool_image_id(pool):
+    """
+    Returns the Deadline image id of the pool's image
+    :param pool: The pool
+    :type pool: azure.batch.models.CloudPool
+    :rtype: str
+    """
+    vm_config = pool.virtual_machine_configuration
+    if vm_config and vm_config.image_reference:
+        image_ref = vm_config.image_reference
+        if image_ref.virtual_machine_image_id:
+            return image_ref.virtual_machine_image_id
+        return '{}:{}:{}:{}:{}'.format(
+            image_ref.publisher,
+            image_ref.offer,
+            image_ref.sku,
+            image_ref.version,
+            vm_config.node_agent_sku_id
+        )
+    return None
+
+
 def compute_node_to_deadline_instance(pool, compute_node):
     """
     Maps a Batch compute node to a Deadline cloud instance
@@ -78,40 +104,57 @@ def compute_node_to_deadline_instance(pool, compute_node):
     :return: The cloud instance
     :rtype: Deadline.Cloud.CloudInstance
     """
-    image_id = None
-    vm_config = pool.virtual_machine_configuration
-    if vm_config and vm_config.image_reference:
-        image_ref = vm_config.image_reference
-        if image_ref.virtual_machine_image_id:
-            image_id = image_ref.virtual_machine_image_id
-        else:
-            image_id = '{}:{}:{}:{}:{}'.format(
-                image_ref.publisher,
-                image_ref.offer,
-                image_ref.sku,
-                image_ref.version,
-                vm_config.node_agent_sku_id
-            )
-
-    ci = CloudInstance()
-    ci.ID = get_cloud_instance_id(pool.id, compute_node.id)
-    ci.Name = compute_node.id
-    ci.HardwareID = pool.vm_size
-    ci.Provider = "AzureBatch"
-    ci.Zone = None
-    ci.ImageID = image_id
-    ci.Hostname = compute_node.id
-    ci.PublicIP = compute_node.ip_address
-    ci.PrivateIP = compute_node.ip_address
-    ci.Status = compute_node_state_to_deadline_status(compute_node.state)
-
-    if compute_node.endpoint_configuration and compute_node.endpoint_configuration.inbound_endpoints:
-        endpoints = compute_node.endpoint_configuration.inbound_endpoints
-        for endpoint in endpoints:
-            if endpoint.name.startswith("RDP") or endpoint.name.startswith("SSH"):
-                ci.PublicIP = endpoint.public_ip_address
-
-    return ci
+    return map_pool_nodes(pool, [compute_node])[0]
+
+
+def map_pool_nodes(pool, compute_nodes, region=None, zone=None):
+    """
+    Maps the compute nodes of a pool to Deadline cloud instances. The pool's
+    fields are only read once, use this rather than mapping nodes one by one.
+    :param pool: The pool
+    :type pool: azure.batch.models.CloudPool
+    :param compute_nodes: The pool's compute nodes
+    :type compute_nodes: collections.Iterable[azure.batch.models.ComputeNode]
+    :param region: The Deadline region
+    :type region: str
+    :param zone: The Azure region
+    :type zone: str
+    :return: The cloud instances
+    :rtype: list of Deadline.Cloud.CloudInstance
+    """
+    image_id = get_pool_image_id(pool)
+    instance_id_prefix = pool.id + ':'
+    vm_size = pool.vm_size
+    statuses = _get_deadline_statuses()
+    unknown = InstanceStatus.Unknown
+
+    instances = []
+    append = instances.append
+    for compute_node in compute_nodes:
+        node_id = compute_node.id
+        ip_address = compute_node.ip_address
+
+        ci = CloudInstance()
+        ci.ID = instance_id_prefix + node_id
+        ci.Name = node_id
+        ci.HardwareID = vm_size
+        ci.Provider = "AzureBatch"
+        ci.RegionName = region
+        ci.Zone = zone
+        ci.ImageID = image_id
+        ci.Hostname = node_id
+        ci.PublicIP = ip_address
+        ci.PrivateIP = ip_address
+        ci.Status = statuses.get(compute_node.state, unknown)
+
+        endpoint_config = compute_node.endpoint_configuration
+        if endpoint_config and endpoint_config.inbound_endpoints:
+            for endpoint in endpoint_config.inbound_endpoints:
+                if endpoint.name.startswith("RDP") or endpoint.name.startswith("SSH"):
+                    ci.PublicIP = endpoint.public_ip_address
+
+        append(ci)
+    return instances
 
 
 def get_cloud_instance_id(pool_id, compute_node_id):
@@ -0,0 +1,277 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import functools
+import inspect
+import os
+import threading
+import time
+
+import throttle
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix of the exported metric names
+METRIC_PREFIX = 'azurebatch'
+
+
+def get_error_label(error):
+    """
+    Returns the Batch error code of the error, else its HTTP status code or type name
+    :rtype: str
+    """
+    code = throttle.get_error_code(error)
+    if code:
+        return str(code)
+    status_code = throttle.get_status_code(error)
+    if status_code:
+        return str(status_code)
+    return type(error).__name__
+
+
+class Histogram:
+    """
+    Counts observed values into fixed buckets, with their count and sum
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def get_cumulative_counts(self):
+        """
+        :return: The number of values at or below each bucket bound
+        :rtype: list of int
+        """
+        counts = []
+        total = 0
+        for count in self.bucket_counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class MetricsRegistry:
+    """
+    Records the latency, errors and throttled requests of operations, keyed
+    by kind, e.g. 'callback', 'batch' or 'api', and operation name. Collectors
+    add values read from other objects, such as the retry policy's counters,
+    when a snapshot is taken.
+    """
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._errors = {}
+        self._throttled = {}
+        self._collectors = {}
+
+    def observe(self, kind, name, seconds, error=None):
+        """
+        Records a call to an operation
+        :param seconds: How long the call took
+        :type seconds: float
+        :param error: The exception raised by the call, if any
+        :type error: Exception
+        """
+        key = (kind, name)
+        with self._lock:
+            histogram = self._latencies.get(key)
+            if histogram is None:
+                histogram = self._latencies[key] = Histogram()
+            histogram.observe(seconds)
+            if error is not None:
+                error_key = (kind, name, get_error_label(error))
+                self._errors[error_key] = self._errors.get(error_key, 0) + 1
+                if throttle.is_throttled(error):
+                    self._throttled[key] = self._throttled.get(key, 0) + 1
+
+    def call(self, kind, name, func, *args, **kwargs):
+        """
+        Calls func and records its latency and any error. StopIteration, used by
+        paged listings to signal the last page, isn't an error.
+        """
+        start = self._clock()
+        try:
+            result = func(*args, **kwargs)
+        except StopIteration:
+            self.observe(kind, name, self._clock() - start)
+            raise
+        except Exception as e:
+            self.observe(kind, name, self._clock() - start, e)
+            raise
+        self.observe(kind, name, self._clock() - start)
+        return result
+
+    def wrap(self, kind, name, func):
+        """
+        Returns a function which calls func and records the call
+        """
+        return lambda *args, **kwargs: self.call(kind, name, func, *args, **kwargs)
+
+    def add_collector(self, name, func):
+        """
+        :param name: Prefixes the names of the collected values
+        :type name: str
+        :param func: Returns a dict of numeric values
+        """
+        with self._lock:
+            self._collectors[name] = func
+
+    def get_snapshot(self):
+        """
+        Returns a copy of the recorded metrics
+        :return: 'operations' keyed by (kind, name) with the call count, total
+         seconds, cumulative bucket counts, error counts by code and throttled
+         count, and 'values' with the collected values keyed by name
+        :rtype: dict
+        """
+        with self._lock:
+            operations = {}
+            for key, histogram in self._latencies.items():
+                operations[key] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': list(zip(histogram.buckets, histogram.get_cumulative_counts())),
+                    'errors': {},
+                    'throttled': self._throttled.get(key, 0),
+                }
+            for (kind, name, code), count in self._errors.items():
+                operations[(kind, name)]['errors'][code] = count
+            collectors = list(self._collectors.items())
+
+        values = {}
+        for collector_name, func in collectors:
+            try:
+                collected = func()
+            except Exception as e:
+                print('Error collecting {} metrics: {}'.format(collector_name, e))
+                continue
+            for name, value in collected.items():
+                values['{}_{}'.format(collector_name, name)] = value
+        return {'operations': operations, 'values': values}
+
+    def render_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format
+        :rtype: str
+        """
+        snapshot = self.get_snapshot()
+        operations = sorted(snapshot['operations'].items())
+        latency = METRIC_PREFIX + '_operation_seconds'
+        errors = METRIC_PREFIX + '_operation_errors_total'
+        throttled = METRIC_PREFIX + '_operation_throttled_total'
+
+        lines = ['# HELP {} Latency of plugin callbacks, Batch wrapper methods and Batch API requests'.format(latency),
+                 '# TYPE {} histogram'.format(latency)]
+        for (kind, name), op in operations:
+            labels = _format_labels(kind=kind, operation=name)
+            for bound, count in op['buckets']:
+                lines.append('{}_bucket{} {}'.format(
+                    latency, _format_labels(kind=kind, operation=name, le=repr(float(bound))), count))
+            lines.append('{}_bucket{} {}'.format(latency, _format_labels(kind=kind, operation=name, le='+Inf'),
+                                                 op['count']))
+            lines.append('{}_sum{} {!r}'.format(latency, labels, op['sum']))
+            lines.append('{}_count{} {}'.format(latency, labels, op['count']))
+
+        lines.extend(['# HELP {} Failed calls by error code'.format(errors),
+                      '# TYPE {} counter'.format(errors)])
+        for (kind, name), op in operations:
+            for code, count in sorted(op['errors'].items()):
+                lines.append('{}{} {}'.format(errors, _format_labels(kind=kind, operation=name, code=code), count))
+
+        lines.extend(['# HELP {} Calls throttled by the Batch service'.format(throttled),
+                      '# TYPE {} counter'.format(throttled)])
+        for (kind, name), op in operations:
+            if op['throttled']:
+                lines.append('{}{} {}'.format(throttled, _format_labels(kind=kind, operation=name), op['throttled']))
+
+        for name, value in sorted(snapshot['values'].items()):
+            metric = '{}_{}'.format(METRIC_PREFIX, name)
+            lines.append('# TYPE {} gauge'.format(metric))
+            lines.append('{} {!r}'.format(metric, float(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Writes the metrics to a file for the Prometheus node exporter's text
+        file collector. The file is written alongside and renamed over the old
+        one so readers never see a partial file. On POSIX the rename replaces
+        the file atomically. Windows can't rename over an existing file, so
+        there the old file is removed first and is briefly missing.
+        """
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(self.render_prometheus())
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+
+
+def _format_labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in sorted(labels.items())) + '}'
+
+
+def instrument_methods(cls, kind, names=None, exclude=()):
+    """
+    Wraps methods of a class so their calls are recorded in the instance's
+    metrics attribute, a MetricsRegistry. Calls aren't recorded while it's None.
+    Generator methods aren't wrapped, as their work happens as they're iterated.
+    :param kind: The kind the calls are recorded under
+    :type kind: str
+    :param names: The methods to wrap, by default all public methods
+    :type names: list of str
+    :param exclude: Methods not to wrap
+    :type exclude: list of str
+    """
+    if names is None:
+        names = [name for name, value in vars(cls).items()
+                 if not name.startswith('_') and inspect.isfunction(value) and name not in exclude]
+    for name in names:
+        method = getattr(cls, name)
+        func = getattr(method, '__func__', method)
+        if inspect.isgeneratorfunction(func):
+            continue
+        setattr(cls, name, _instrument(func, kind, name))
+
+
+def _instrument(func, kind, name):
+    @functools.wraps(func)
+    def instrumented(self, *args, **kwargs):
+        registry = getattr(self, 'metrics', None)
+        if registry is None:
+            return func(self, *args, **kwargs)
+        return registry.call(kind, name, func, self, *args, **kwargs)
+    return instrumented
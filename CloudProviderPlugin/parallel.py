@@ -0,0 +1,109 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import traceback
+
+
+class Result:
+    """
+    The outcome of applying a function to a single item.
+    """
+    def __init__(self, item, value=None, error=None, error_trace=None):
+        self.item = item
+        self.value = value
+        self.error = error
+        self.error_trace = error_trace
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+def map_bounded(func, items, max_workers):
+    """
+    Applies func to each item using at most max_workers threads. Failures are
+    captured per item so one failing item doesn't affect the others.
+    :param func: The function to apply
+    :param items: The items
+    :type items: list
+    :param max_workers: Maximum number of concurrent calls
+    :type max_workers: int
+    :return: A result for each item, in the same order as items
+    :rtype: list of Result
+    """
+    return list(imap_bounded(func, items, max_workers))
+
+
+def imap_bounded(func, items, max_workers):
+    """
+    Like map_bounded, but yields each result as soon as it and the results
+    before it are available. Results are released once yielded.
+    :rtype: collections.Iterable[Result]
+    """
+    items = list(items)
+    if not items:
+        return
+
+    results = [None] * len(items)
+    condition = threading.Condition()
+    next_index = [0]
+
+    def worker():
+        while True:
+            with condition:
+                index = next_index[0]
+                if index >= len(items):
+                    return
+                next_index[0] += 1
+            item = items[index]
+            try:
+                result = Result(item, value=func(item))
+            except Exception as e:
+                result = Result(item, error=e, error_trace=traceback.format_exc())
+            with condition:
+                results[index] = result
+                condition.notify_all()
+
+    worker_count = max(1, min(max_workers, len(items)))
+    if worker_count == 1:
+        for item in items:
+            try:
+                yield Result(item, value=func(item))
+            except Exception as e:
+                yield Result(item, error=e, error_trace=traceback.format_exc())
+        return
+
+    threads = [threading.Thread(target=worker) for _ in range(worker_count)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    for index in range(len(items)):
+        with condition:
+            while results[index] is None:
+                condition.wait()
+            result = results[index]
+            results[index] = None
+        yield result
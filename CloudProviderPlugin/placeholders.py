@@ -0,0 +1,108 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import uuid
+
+
+def new_placeholder_id():
+    return 'pending-{}'.format(uuid.uuid4().hex[:12])
+
+
+class PlaceholderTracker:
+    """
+    Tracks the placeholder compute node ids reported for nodes a pool has
+    been asked for but not yet allocated. Ids are stable across calls so the
+    Balancer can follow them, and are retired oldest first, one for each real
+    node that appears.
+    """
+    def __init__(self, id_factory=new_placeholder_id):
+        self._id_factory = id_factory
+        self._lock = threading.Lock()
+        self._placeholders = {}
+
+    def add(self, pool_id, count):
+        """
+        Adds placeholders for newly requested nodes
+        :return: The new placeholder ids
+        :rtype: list of str
+        """
+        with self._lock:
+            new_ids = [self._id_factory() for _ in range(max(0, count))]
+            self._placeholders.setdefault(pool_id, []).extend(new_ids)
+            return new_ids
+
+    def reconcile(self, pool_id, pending_count):
+        """
+        Adjusts the pool's placeholders to the number of nodes still to be allocated
+        :param pending_count: The number of requested nodes not yet allocated
+        :type pending_count: int
+        :return: The placeholder ids
+        :rtype: list of str
+        """
+        pending_count = max(0, pending_count)
+        with self._lock:
+            placeholder_ids = self._placeholders.get(pool_id, [])
+            if len(placeholder_ids) > pending_count:
+                placeholder_ids = placeholder_ids[len(placeholder_ids) - pending_count:]
+            else:
+                placeholder_ids = placeholder_ids + \
+                    [self._id_factory() for _ in range(pending_count - len(placeholder_ids))]
+            if placeholder_ids:
+                self._placeholders[pool_id] = placeholder_ids
+            else:
+                self._placeholders.pop(pool_id, None)
+            return list(placeholder_ids)
+
+    def discard(self, pool_id, placeholder_ids):
+        """
+        Retires placeholders whose nodes are no longer wanted
+        :param placeholder_ids: Compute node ids, ids which aren't placeholders are ignored
+        :return: The retired placeholder ids
+        :rtype: list of str
+        """
+        with self._lock:
+            existing = self._placeholders.get(pool_id, [])
+            retired = [i for i in existing if i in placeholder_ids]
+            remaining = [i for i in existing if i not in placeholder_ids]
+            if remaining:
+                self._placeholders[pool_id] = remaining
+            else:
+                self._placeholders.pop(pool_id, None)
+            return retired
+
+    def get(self, pool_id):
+        with self._lock:
+            return list(self._placeholders.get(pool_id, []))
+
+    def retain(self, pool_ids):
+        """
+        Drops the placeholders of pools which weren't listed
+        :param pool_ids: The ids of the listed pools
+        """
+        pool_ids = set(pool_ids)
+        with self._lock:
+            for pool_id in list(self._placeholders):
+                if pool_id not in pool_ids:
+                    del self._placeholders[pool_id]
@@ -22,6 +22,9 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import hashlib
+import threading
+import time
 import traceback
 
 from Deadline.Cloud import CloudPluginWrapper, OSImage
@@ -29,6 +32,10 @@ from FranticX import Environment2
 
 import images
 
+# Seconds between checks of the config entries for changes
+CONFIG_CHECK_INTERVAL = 30
+
+
 def load_config(cloud_plugin_wrapper):
     try:
         config = BatchPluginConfig(
@@ -84,7 +91,30 @@ def load_config(cloud_plugin_wrapper):
             # Application insights
             app_insights_app_key=cloud_plugin_wrapper.GetConfigEntryWithDefault("ApplicationInsightsAppId", None),
             app_insights_instrumentation_key=cloud_plugin_wrapper.GetConfigEntryWithDefault(
-                "ApplicationInsightsInstrumentationKey", None))
+                "ApplicationInsightsInstrumentationKey", None),
+
+            # Performance
+            max_parallel_requests=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("MaxParallelRequests", 8),
+            state_cache_ttl=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("StateCacheTtlSeconds", 15),
+            resize_interval=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("ResizeIntervalSeconds", 15),
+            resize_coalesce_window=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("ResizeCoalesceSeconds", 2),
+            use_autoscale=cloud_plugin_wrapper.GetBooleanConfigEntryWithDefault("UseAutoScale", False),
+            autoscale_interval=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("AutoScaleEvaluationIntervalMinutes", 5),
+            idle_pool_grace_period=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("IdlePoolGraceSeconds", 600),
+            idle_pool_min_checks=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("IdlePoolMinimumChecks", 3),
+            max_requests_per_second=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("MaxRequestsPerSecond", 20),
+            max_request_attempts=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("MaxRequestAttempts", 4),
+            warm_pool_floors=cloud_plugin_wrapper.GetConfigEntryWithDefault("WarmPoolFloors", None),
+            warm_pool_schedule=cloud_plugin_wrapper.GetConfigEntryWithDefault("WarmPoolSchedule", None),
+            scale_down_prefer_idle=cloud_plugin_wrapper.GetBooleanConfigEntryWithDefault("ScaleDownPreferIdle", False),
+            scale_down_running_nodes=cloud_plugin_wrapper.GetConfigEntryWithDefault("ScaleDownRunningNodes",
+                                                                                   'TaskCompletion'),
+            metrics_file=cloud_plugin_wrapper.GetConfigEntryWithDefault("MetricsFile", None),
+            metrics_interval=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("MetricsIntervalSeconds", 60),
+            profile_callbacks=cloud_plugin_wrapper.GetConfigEntryWithDefault("ProfileCallbacks", None),
+            profile_budget=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("ProfileBudgetSeconds", 30),
+            profile_sample_percent=cloud_plugin_wrapper.GetIntegerConfigEntryWithDefault("ProfileSamplePercent", 100),
+            profile_directory=cloud_plugin_wrapper.GetConfigEntryWithDefault("ProfileDirectory", None))
     except:
         traceback.print_exc()
         raise
@@ -92,6 +122,114 @@ def load_config(cloud_plugin_wrapper):
     return config
 
 
+class _RecordingWrapper:
+    """
+    Passes config reads through to the plugin wrapper, recording the names
+    of the entries read so they can be checked for changes later.
+    """
+    def __init__(self, cloud_plugin_wrapper):
+        self._wrapper = cloud_plugin_wrapper
+        self.names = []
+
+    def __getattr__(self, name):
+        func = getattr(self._wrapper, name)
+        if 'ConfigEntry' not in name:
+            return func
+
+        def read(entry_name, *args):
+            self.names.append(entry_name)
+            return func(entry_name, *args)
+        return read
+
+
+def get_fingerprint(cloud_plugin_wrapper, names):
+    """
+    Returns a digest of the raw values of the config entries
+    :param names: The entry names
+    :type names: list of str
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    for name in names:
+        value = cloud_plugin_wrapper.GetConfigEntryWithDefault(name, '')
+        digest.update(u'{}={}\n'.format(name, value if value is not None else '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_changed_settings(old_config, new_config):
+    """
+    Returns the names of the settings which differ between two configs
+    :type old_config: BatchPluginConfig
+    :type new_config: BatchPluginConfig
+    :rtype: set of str
+    """
+    old_settings = vars(old_config)
+    new_settings = vars(new_config)
+    return set(name for name in set(old_settings) | set(new_settings)
+               if old_settings.get(name) != new_settings.get(name))
+
+
+class ConfigLoader:
+    """
+    Loads the plugin config and keeps it between callbacks. The raw entries are
+    re-read at most every check_interval seconds and the config is only rebuilt
+    when their fingerprint changes, so edits are picked up without a restart.
+    """
+    def __init__(self, cloud_plugin_wrapper, check_interval=CONFIG_CHECK_INTERVAL, clock=time.time,
+                 load=load_config):
+        """
+        :param cloud_plugin_wrapper: The plugin the config entries are read from
+        :param check_interval: Seconds between checks for changes
+        :type check_interval: float
+        :param clock: Callable returning the current time in seconds
+        :param load: Builds the config from the plugin's entries
+        """
+        self.check_interval = check_interval
+        self._wrapper = cloud_plugin_wrapper
+        self._clock = clock
+        self._load = load
+        self._lock = threading.Lock()
+        self._names = []
+        self._checked = None
+        self.config = None
+        self.fingerprint = None
+        self.loads = 0
+
+    def get(self):
+        """
+        Returns the current config, a new instance only if the entries changed.
+        If a changed config can't be loaded the previous one is kept.
+        :rtype: BatchPluginConfig
+        """
+        with self._lock:
+            now = self._clock()
+            if self.config is not None and now - self._checked < self.check_interval:
+                return self.config
+            self._checked = now
+
+            if self.config is not None:
+                fingerprint = get_fingerprint(self._wrapper, self._names)
+                if fingerprint == self.fingerprint:
+                    return self.config
+
+            recorder = _RecordingWrapper(self._wrapper)
+            try:
+                config = self._load(recorder)
+            except:
+                if self.config is None:
+                    raise
+                # Not retried until the entries change again
+                print('Keeping the previous config, the changed config failed to load')
+                self.fingerprint = fingerprint
+                return self.config
+
+            self._names = recorder.names
+            self.fingerprint = get_fingerprint(self._wrapper, self._names)
+            self.config = config
+            self.loads += 1
+            return config
+
+
 class BatchPluginConfig:
     def __init__(self,
                  batch_url,
@@ -138,6 +276,27 @@ class BatchPluginConfig:
                  app_insights_app_key,
                  app_insights_instrumentation_key,
 
+                 max_parallel_requests=8,
+                 state_cache_ttl=15,
+                 resize_interval=15,
+                 resize_coalesce_window=2,
+                 use_autoscale=False,
+                 autoscale_interval=5,
+                 idle_pool_grace_period=600,
+                 idle_pool_min_checks=3,
+                 max_requests_per_second=20,
+                 max_request_attempts=4,
+                 warm_pool_floors=None,
+                 warm_pool_schedule=None,
+                 scale_down_prefer_idle=False,
+                 scale_down_running_nodes='TaskCompletion',
+                 metrics_file=None,
+                 metrics_interval=60,
+                 profile_callbacks=None,
+                 profile_budget=30,
+                 profile_sample_percent=100,
+                 profile_directory=None,
+
                  authority_host_uri='https://login.microsoftonline.com'):
         self.batch_url = batch_url
         self.batch_sp_tenant_id = batch_sp_tenant_id
@@ -184,6 +343,27 @@ class BatchPluginConfig:
         self.app_insights_app_key = app_insights_app_key
         self.app_insights_instrumentation_key = app_insights_instrumentation_key
 
+        self.max_parallel_requests = max_parallel_requests
+        self.state_cache_ttl = state_cache_ttl
+        self.resize_interval = resize_interval
+        self.resize_coalesce_window = resize_coalesce_window
+        self.use_autoscale = use_autoscale
+        self.autoscale_interval = autoscale_interval
+        self.idle_pool_grace_period = idle_pool_grace_period
+        self.idle_pool_min_checks = idle_pool_min_checks
+        self.max_requests_per_second = max_requests_per_second
+        self.max_request_attempts = max_request_attempts
+        self.warm_pool_floors = warm_pool_floors
+        self.warm_pool_schedule = warm_pool_schedule
+        self.scale_down_prefer_idle = scale_down_prefer_idle
+        self.scale_down_running_nodes = scale_down_running_nodes
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.profile_callbacks = profile_callbacks
+        self.profile_budget = profile_budget
+        self.profile_sample_percent = profile_sample_percent
+        self.profile_directory = profile_directory
+
     def get_os_images(self):
         """
         Converts an Azure managed image Ids to a Deadline.Cloud.OSImage list
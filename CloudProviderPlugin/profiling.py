@@ -0,0 +1,218 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Opt-in profiling of the plugin's callbacks. A sample of the calls to the
+selected callbacks run under cProfile, and the profile of each call which
+takes longer than the latency budget is dumped to a .prof file and summarized
+in the log. Callbacks are only profiled while the plugin has a profiler.
+"""
+
+import functools
+import os
+import random
+import threading
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# Selects all of the callbacks in the callbacks setting
+ALL_CALLBACKS = '*'
+
+# Functions listed in the summary logged for a call over budget
+SUMMARY_LINES = 20
+
+# Profile dumps kept in the profile directory, the oldest are removed first
+MAX_PROFILE_DUMPS = 50
+
+# Folder in the temp directory profiles are dumped to when none is configured
+PROFILE_DIRECTORY_NAME = 'AzureBatchProfiles'
+
+
+def parse_callback_names(value, callback_names):
+    """
+    Parses the profiled callbacks setting, e.g. 'GetActiveInstances;CreateInstances'
+    :param value: Semi-colon delimited list of callback names, or * for all of them
+    :type value: str
+    :param callback_names: The callbacks which can be profiled
+    :type callback_names: list of str
+    :rtype: frozenset of str
+    """
+    names = set()
+    if not value:
+        return frozenset()
+    for name in value.split(';'):
+        name = name.strip()
+        if not name:
+            continue
+        if name == ALL_CALLBACKS:
+            names.update(callback_names)
+        elif name in callback_names:
+            names.add(name)
+        else:
+            raise ValueError('Unknown callback "{}", expected one of {} or {}'.format(
+                name, ', '.join(callback_names), ALL_CALLBACKS))
+    return frozenset(names)
+
+
+def get_default_directory():
+    """
+    :return: The directory profiles are dumped to when none is configured
+    :rtype: str
+    """
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), PROFILE_DIRECTORY_NAME)
+
+
+def get_summary(profile, lines=SUMMARY_LINES):
+    """
+    Returns the functions which took the most time in a profile
+    :type profile: cProfile.Profile
+    :param lines: The number of functions listed
+    :type lines: int
+    :rtype: str
+    """
+    import pstats
+    stream = StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(lines)
+    return stream.getvalue().strip()
+
+
+class CallbackProfiler:
+    """
+    Profiles a sample of the calls to the selected callbacks. Calls a callback
+    makes to other callbacks on the same thread are part of its profile.
+    """
+    def __init__(self, callbacks, budget, sample_rate, directory, log,
+                 summary_lines=SUMMARY_LINES, max_dumps=MAX_PROFILE_DUMPS, clock=time.time, sample=random.random):
+        """
+        :param callbacks: The names of the profiled callbacks
+        :type callbacks: frozenset of str
+        :param budget: Seconds a call can take before its profile is reported
+        :type budget: float
+        :param sample_rate: The fraction of calls which are profiled, from 0 to 1
+        :type sample_rate: float
+        :param directory: The directory profiles are dumped to
+        :type directory: str
+        :param log: Logs a message
+        """
+        self.callbacks = callbacks
+        self.budget = budget
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.summary_lines = summary_lines
+        self.max_dumps = max_dumps
+        self._log = log
+        self._clock = clock
+        self._sample = sample
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._dump_count = 0
+
+    def call(self, name, func, *args, **kwargs):
+        """
+        Calls func, profiling the call if the callback is selected and the
+        call is sampled, and reports the profile if the call is over budget
+        """
+        if (name not in self.callbacks or getattr(self._local, 'profiling', False)
+                or self._sample() >= self.sample_rate):
+            return func(*args, **kwargs)
+
+        import cProfile
+        profile = cProfile.Profile()
+        self._local.profiling = True
+        start = self._clock()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            elapsed = self._clock() - start
+            self._local.profiling = False
+            if elapsed > self.budget:
+                self._report(name, elapsed, profile)
+
+    def _report(self, name, elapsed, profile):
+        try:
+            path = self._dump(name, profile)
+            self._log('{} took {:.2f}s, over the {}s budget, profile written to {}\n{}'.format(
+                name, elapsed, self.budget, path, get_summary(profile, self.summary_lines)))
+        except Exception as e:
+            # Profiling mustn't fail the callback
+            self._log('Error reporting the profile of {}: {}'.format(name, e))
+
+    def _dump(self, name, profile):
+        """
+        Writes the profile to a new file in the profile directory and removes
+        the oldest dumps beyond max_dumps
+        :return: The path of the file
+        :rtype: str
+        """
+        with self._lock:
+            self._dump_count += 1
+            count = self._dump_count
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+        file_name = '{}-{}-{}-{}.prof'.format(
+            name, time.strftime('%Y%m%d-%H%M%S', time.localtime(self._clock())), os.getpid(), count)
+        path = os.path.join(self.directory, file_name)
+        profile.dump_stats(path)
+        self._remove_old_dumps()
+        return path
+
+    def _remove_old_dumps(self):
+        with self._lock:
+            paths = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.prof')]
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:max(0, len(paths) - self.max_dumps)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def profile_methods(cls, names):
+    """
+    Wraps methods of a class so their calls go through the instance's profiler
+    attribute, a CallbackProfiler. While it's None the methods are called
+    directly, so profiling costs an attribute lookup when it's disabled.
+    :param names: The methods to wrap
+    :type names: list of str
+    """
+    for name in names:
+        method = getattr(cls, name)
+        func = getattr(method, '__func__', method)
+        setattr(cls, name, _profiled(func, name))
+
+
+def _profiled(func, name):
+    @functools.wraps(func)
+    def profiled(self, *args, **kwargs):
+        profiler = getattr(self, 'profiler', None)
+        if profiler is None:
+            return func(self, *args, **kwargs)
+        return profiler.call(name, func, self, *args, **kwargs)
+    return profiled
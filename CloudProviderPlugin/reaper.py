@@ -0,0 +1,90 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+
+
+class IdlePoolReaper:
+    """
+    Decides when empty pools can be deleted. A pool is only deleted after it
+    has been seen empty on a number of consecutive checks spanning the grace
+    period, so pools which are emptied and reused shortly after are kept.
+    Any observation of the pool in use starts the count again.
+    """
+    def __init__(self, grace_period, min_idle_checks=2, clock=time.time):
+        """
+        :param grace_period: Seconds a pool must be empty before it's deleted
+        :type grace_period: float
+        :param min_idle_checks: Consecutive checks a pool must be seen empty on
+        :type min_idle_checks: int
+        """
+        self.grace_period = grace_period
+        self.min_idle_checks = max(1, min_idle_checks)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def observe(self, pool_id, is_idle):
+        """
+        Records whether the pool is empty
+        :return: True if the pool has been empty long enough to be deleted
+        :rtype: bool
+        """
+        with self._lock:
+            if not is_idle:
+                self._idle.pop(pool_id, None)
+                return False
+
+            now = self._clock()
+            idle_since, checks = self._idle.get(pool_id, (now, 0))
+            checks += 1
+            self._idle[pool_id] = (idle_since, checks)
+            return checks >= self.min_idle_checks and now - idle_since >= self.grace_period
+
+    def get_idle_seconds(self, pool_id):
+        """
+        :return: Seconds the pool has been empty, or None if it's in use
+        :rtype: float
+        """
+        with self._lock:
+            entry = self._idle.get(pool_id)
+            if entry is None:
+                return None
+            return self._clock() - entry[0]
+
+    def forget(self, pool_id):
+        with self._lock:
+            self._idle.pop(pool_id, None)
+
+    def retain(self, pool_ids):
+        """
+        Drops the state of pools which no longer exist
+        :param pool_ids: The ids of the existing pools
+        """
+        pool_ids = set(pool_ids)
+        with self._lock:
+            for pool_id in list(self._idle):
+                if pool_id not in pool_ids:
+                    del self._idle[pool_id]
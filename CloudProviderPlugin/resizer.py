@@ -0,0 +1,299 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+import traceback
+
+from azuresdk import batchmodels
+
+import background
+import throttle
+
+# The Batch service rejects autoscale updates to a pool more often than this
+AUTOSCALE_MIN_INTERVAL = 30
+
+# The maximum number of nodes the Batch service removes in one request
+MAX_NODES_PER_REMOVAL = 100
+
+# Seconds a removal, e.g. one waiting for tasks to complete, holds back a pending target
+REMOVAL_TIMEOUT = 300
+
+
+def get_lowered_target(target_dedicated, target_low_priority, count):
+    """
+    Returns the pool target with count fewer nodes, low priority nodes are removed first
+    :rtype: tuple of (int, int)
+    """
+    low_priority = min(target_low_priority, count)
+    dedicated = min(target_dedicated, count - low_priority)
+    return target_dedicated - dedicated, target_low_priority - low_priority
+
+
+class ResizeTarget:
+    def __init__(self, target_dedicated, target_low_priority, not_before=0):
+        self.target_dedicated = target_dedicated
+        self.target_low_priority = target_low_priority
+        self.not_before = not_before
+        self.stop_requested = False
+
+    @property
+    def total(self):
+        return self.target_dedicated + self.target_low_priority
+
+
+class PoolResizer:
+    """
+    Records the desired size of pools and applies them from a background
+    thread. A pool that is resizing has its resize stopped, and the new
+    target is applied once the pool is steady. Changes requested with
+    request_delta are added to any target that hasn't been applied yet, and
+    those within the coalescing window are summed into one resize.
+
+    Node removals which can't be made while a pool is resizing are queued and
+    made, a chunk at a time, once the pool is steady. Queued removals are made
+    before the pool's pending target is applied, and a resize caused by a
+    removal is only stopped for a pending target once it has run for
+    REMOVAL_TIMEOUT seconds.
+    """
+    def __init__(self, batch, interval=15, coalesce_window=0, clock=time.time):
+        """
+        :param batch: The Batch wrapper used to read and resize pools
+        :type batch: AzureBatch.Batch
+        :param interval: Seconds between checks of pools with pending targets
+        :type interval: float
+        :param coalesce_window: Seconds to wait for further changes before resizing
+        :type coalesce_window: float
+        :param clock: Callable returning the current time in seconds
+        """
+        self._batch = batch
+        self._coalesce_window = coalesce_window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._removals = {}
+        self._removing = {}
+        self._autoscale_updates = {}
+        self._worker = background.PeriodicWorker('AzureBatchPoolResizer', interval, self.apply_pending)
+
+    def reconfigure(self, interval, coalesce_window):
+        """
+        Changes the check interval and coalescing window, pending targets are kept
+        """
+        self._coalesce_window = coalesce_window
+        self._worker.interval = interval
+
+    def request_delta(self, pool_id, current_dedicated, current_low_priority,
+                      delta_dedicated, delta_low_priority):
+        """
+        Changes the size of a pool by the given number of nodes and returns immediately.
+        Changes requested within the coalescing window are summed and applied as a
+        single resize.
+        :param current_dedicated: The pool's dedicated target, used if no resize is pending
+        :param current_low_priority: The pool's low priority target, used if no resize is pending
+        :return: The combined target
+        :rtype: ResizeTarget
+        """
+        with self._lock:
+            pending = self._pending.get(pool_id)
+            if pending:
+                target = ResizeTarget(
+                    max(0, pending.target_dedicated + delta_dedicated),
+                    max(0, pending.target_low_priority + delta_low_priority),
+                    not_before=pending.not_before)
+                target.stop_requested = pending.stop_requested
+            else:
+                target = ResizeTarget(
+                    max(0, current_dedicated + delta_dedicated),
+                    max(0, current_low_priority + delta_low_priority),
+                    not_before=self._clock() + self._coalesce_window)
+            self._pending[pool_id] = target
+
+        self._worker.start()
+        if not pending and self._coalesce_window > 0:
+            timer = threading.Timer(self._coalesce_window, self._worker.wake)
+            timer.daemon = True
+            timer.start()
+        else:
+            self._worker.wake()
+        return target
+
+    def request_removal(self, pool_id, node_ids, deallocation_option=None):
+        """
+        Queues the removal of nodes from a pool and returns immediately.
+        """
+        node_ids = list(node_ids)
+        with self._lock:
+            queue = self._removals.setdefault(pool_id, [])
+            for i in range(0, len(node_ids), MAX_NODES_PER_REMOVAL):
+                queue.append((node_ids[i:i + MAX_NODES_PER_REMOVAL], deallocation_option))
+        self._worker.start()
+        self._worker.wake()
+
+    def get_pending_removals(self, pool_id):
+        """
+        Returns the ids of the nodes queued for removal from the pool
+        :rtype: list of str
+        """
+        with self._lock:
+            return [node_id for node_ids, _ in self._removals.get(pool_id, []) for node_id in node_ids]
+
+    def on_removed(self, pool_id, count, auto_scale=False):
+        """
+        Called when nodes have been removed from a pool. Removing nodes lowers the
+        pool's target, so the pending target is lowered by the same number. The
+        pending target of an autoscale pool is the formula's desired nodes, which
+        callers lower when they request the removal.
+        """
+        with self._lock:
+            self._removing[pool_id] = self._clock()
+            pending = self._pending.get(pool_id)
+            if pending and not auto_scale:
+                target = ResizeTarget(*get_lowered_target(pending.target_dedicated,
+                                                          pending.target_low_priority,
+                                                          count),
+                                      not_before=pending.not_before)
+                target.stop_requested = pending.stop_requested
+                self._pending[pool_id] = target
+
+    def get_pending_target(self, pool_id):
+        """
+        Returns the target that hasn't been applied to the pool yet, or None
+        :rtype: ResizeTarget
+        """
+        with self._lock:
+            return self._pending.get(pool_id)
+
+    def cancel(self, pool_id):
+        with self._lock:
+            self._pending.pop(pool_id, None)
+            self._removals.pop(pool_id, None)
+
+    @property
+    def worker(self):
+        return self._worker
+
+    def apply_pending(self):
+        """
+        Tries to make every queued removal and apply every pending target,
+        pools that aren't steady yet are retried on the next run.
+        """
+        with self._lock:
+            pool_ids = set(self._pending) | set(self._removals)
+
+        now = self._clock()
+        for pool_id in pool_ids:
+            try:
+                self._apply_pool(pool_id, now)
+            except:
+                traceback.print_exc()
+
+    def _apply_pool(self, pool_id, now):
+        with self._lock:
+            target = self._pending.get(pool_id)
+            removals = self._removals.get(pool_id)
+        if not removals and (target is None or target.not_before > now):
+            # Nothing to do, or still waiting for further changes
+            return
+
+        pool = self._batch.get_pool(pool_id, use_cache=False)
+        if not pool:
+            # The pool has been deleted
+            self.cancel(pool_id)
+            return
+
+        steady = pool.allocation_state == batchmodels.AllocationState.steady
+        if steady:
+            with self._lock:
+                self._removing.pop(pool_id, None)
+
+        if removals:
+            # Removals are made first, the pending target waits for them
+            if steady:
+                self._try_remove(pool_id, removals[0], pool)
+            return
+
+        if self._try_apply(pool_id, target, pool):
+            with self._lock:
+                if self._pending.get(pool_id) is target:
+                    del self._pending[pool_id]
+
+    def _try_remove(self, pool_id, removal, pool):
+        node_ids, deallocation_option = removal
+        try:
+            self._batch.apply_removal(pool_id, node_ids, deallocation_option, bool(pool.enable_auto_scale))
+        except Exception as e:
+            if throttle.get_status_code(e) == 409:
+                # The pool started resizing, retried on the next run
+                return
+            self._drop_removal(pool_id, removal)
+            raise
+        self._drop_removal(pool_id, removal)
+
+    def _drop_removal(self, pool_id, removal):
+        with self._lock:
+            queue = self._removals.get(pool_id)
+            if queue and queue[0] is removal:
+                queue.pop(0)
+            if not queue:
+                self._removals.pop(pool_id, None)
+
+    def _try_apply(self, pool_id, target, pool):
+        if pool.enable_auto_scale:
+            if pool.allocation_state != batchmodels.AllocationState.steady:
+                # The service rejects formula updates while the pool is resizing
+                return False
+            return self._try_apply_autoscale(pool_id, target)
+
+        if pool.target_dedicated_nodes == target.target_dedicated \
+                and pool.target_low_priority_nodes == target.target_low_priority:
+            # Already resizing, or resized, to the target
+            return True
+
+        if pool.allocation_state == batchmodels.AllocationState.resizing:
+            with self._lock:
+                removal_started = self._removing.get(pool_id)
+            if removal_started is not None and self._clock() - removal_started < REMOVAL_TIMEOUT:
+                # Stopping the resize would stop the removal
+                return False
+            if not target.stop_requested:
+                self._batch.stop_resize(pool_id)
+                target.stop_requested = True
+            return False
+
+        if pool.allocation_state != batchmodels.AllocationState.steady:
+            return False
+
+        self._batch.apply_resize(pool_id, target.target_dedicated, target.target_low_priority)
+        return True
+
+    def _try_apply_autoscale(self, pool_id, target):
+        last_update = self._autoscale_updates.get(pool_id)
+        now = self._clock()
+        if last_update is not None and now - last_update < AUTOSCALE_MIN_INTERVAL:
+            return False
+
+        self._batch.apply_autoscale_target(pool_id, target.total, target.target_low_priority > 0)
+        self._autoscale_updates[pool_id] = now
+        return True
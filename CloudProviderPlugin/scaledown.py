@@ -0,0 +1,158 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+from azuresdk import batchmodels
+
+# Nodes that lose no work when they're removed
+_IDLE_STATES = ('idle', 'unusable', 'start_task_failed', 'preempted', 'unknown')
+
+# Nodes that haven't been given any work yet
+_STARTING_STATES = ('creating', 'starting', 'waiting_for_start_task', 'rebooting', 'reimaging')
+
+# How running nodes are removed, config names mapped to ComputeNodeDeallocationOption members
+RUNNING_NODE_OPTIONS = {
+    'TaskCompletion': 'task_completion',
+    'RetainedData': 'retained_data',
+    'Requeue': 'requeue',
+    'Terminate': 'terminate',
+}
+
+_victim_ranks = None
+
+
+def _get_victim_ranks():
+    # Built on first use so the SDK isn't imported with the module
+    global _victim_ranks
+    if _victim_ranks is None:
+        states = batchmodels.ComputeNodeState
+        ranks = dict((getattr(states, name), 0) for name in _IDLE_STATES)
+        ranks.update((getattr(states, name), 1) for name in _STARTING_STATES)
+        ranks[states.leaving_pool] = None
+        _victim_ranks = ranks
+    return _victim_ranks
+
+
+def get_victim_rank(state):
+    """
+    Returns the order in which a node in the given state is removed, idle
+    nodes first, then starting nodes and then running nodes.
+    :return: The rank, or None if the node is already leaving the pool
+    :rtype: int
+    """
+    return _get_victim_ranks().get(state, 2)
+
+
+def is_running_work(node, ignored_job_ids=()):
+    """
+    Returns true unless every task the node is running belongs to one of the
+    ignored jobs, e.g. a licensed pool's license job, whose task runs for as
+    long as the node does. A node whose running tasks weren't listed is
+    assumed to be doing work.
+    :param node: A compute node listed with its recent tasks
+    :type node: azure.batch.models.ComputeNode
+    :type ignored_job_ids: collections.Container
+    :rtype: bool
+    """
+    recent_tasks = getattr(node, 'recent_tasks', None) or []
+    running = [t for t in recent_tasks if t.task_state == batchmodels.TaskState.running]
+    if not running:
+        return True
+    return any(t.job_id not in ignored_job_ids for t in running)
+
+
+def get_node_rank(node, ignored_job_ids=()):
+    """
+    Returns the node's victim rank, see get_victim_rank. A running node whose
+    only tasks belong to the ignored jobs is ranked with the idle nodes.
+    :rtype: int
+    """
+    rank = get_victim_rank(node.state)
+    if rank == 2 and ignored_job_ids and not is_running_work(node, ignored_job_ids):
+        return 0
+    return rank
+
+
+class ScaleDownPlanner:
+    """
+    Picks the nodes to remove when a pool is scaled down. Idle nodes are
+    removed first, then nodes still starting, and both are terminated
+    straight away. Running nodes are removed last using the configured
+    deallocation option, by default letting their tasks complete. Nodes only
+    running tasks of the ignored jobs count as idle. Only the requested
+    nodes are removed unless prefer_idle is set.
+    """
+    def __init__(self, prefer_idle=False, running_node_option='TaskCompletion', ignored_job_ids=()):
+        """
+        :param prefer_idle: If true, idle nodes are removed in place of the requested running nodes
+        :type prefer_idle: bool
+        :param running_node_option: One of the RUNNING_NODE_OPTIONS names
+        :type running_node_option: str
+        :param ignored_job_ids: Jobs whose tasks aren't work, e.g. the pool's license job
+        :type ignored_job_ids: collections.Iterable[str]
+        """
+        self.prefer_idle = prefer_idle
+        self.running_node_option = getattr(batchmodels.ComputeNodeDeallocationOption,
+                                           RUNNING_NODE_OPTIONS.get(running_node_option, 'task_completion'))
+        self.ignored_job_ids = frozenset(ignored_job_ids)
+
+    def get_deallocation_option(self, rank):
+        if rank == 2:
+            return self.running_node_option
+        return batchmodels.ComputeNodeDeallocationOption.terminate
+
+    def plan(self, nodes, requested_ids, excluded_ids=()):
+        """
+        Picks as many nodes to remove as there are requested nodes in the pool,
+        requested nodes are preferred over other nodes of the same rank.
+        :param nodes: The pool's compute nodes
+        :type nodes: list of warmpool.NodeState or azure.batch.models.ComputeNode
+        :param requested_ids: The ids of the nodes the Balancer asked to remove
+        :type requested_ids: list of str
+        :param excluded_ids: The ids of nodes which mustn't be removed unless requested
+        :type excluded_ids: set of str
+        :return: The nodes to remove grouped by deallocation option, in removal order
+        :rtype: list of (azure.batch.models.ComputeNodeDeallocationOption, list of str)
+        """
+        requested_ids = set(requested_ids)
+        candidates = []
+        count = 0
+        for index, node in enumerate(nodes):
+            rank = get_node_rank(node, self.ignored_job_ids)
+            if rank is None:
+                continue
+            requested = node.id in requested_ids
+            if requested:
+                count += 1
+            elif not self.prefer_idle or node.id in excluded_ids:
+                continue
+            candidates.append((rank, not requested, index, node))
+
+        candidates.sort(key=lambda c: c[:3])
+        groups = []
+        for rank, _, _, node in candidates[:count]:
+            option = self.get_deallocation_option(rank)
+            if groups and groups[-1][0] == option:
+                groups[-1][1].append(node.id)
+            else:
+                groups.append((option, [node.id]))
+        return groups
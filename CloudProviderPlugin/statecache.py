@@ -0,0 +1,178 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+
+
+class StateCache:
+    """
+    A snapshot cache of pools and their compute nodes, keyed by pool id.
+    Entries expire after the TTL, mutations should invalidate or patch
+    the affected entries. A TTL of zero or less disables caching. Pools
+    from a projected listing are only returned with that listing, as they
+    lack the properties that weren't selected.
+    """
+    MISS = object()
+
+    def __init__(self, ttl, clock=time.time):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pool_list = None
+        self._pools = {}
+        self._nodes = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def get_pools(self, key=None):
+        """
+        Returns the cached pool listing, or StateCache.MISS
+        :param key: Identifies the listing mode, e.g. the filter and select
+         clauses. A listing cached with a different key is a miss.
+        :rtype: list of azure.batch.models.CloudPool
+        """
+        with self._lock:
+            if self._pool_list and self._pool_list[2] != key:
+                return self._record(StateCache.MISS)
+            pools = self._record(self._lookup(self._pool_list))
+            if pools is StateCache.MISS:
+                return pools
+            return list(pools)
+
+    def set_pools(self, pools, key=None, projected=False):
+        """
+        :param key: Identifies the listing mode, see get_pools
+        :param projected: Whether only some of the pools' properties were selected,
+         if not the pools are also returned by get_pool
+        :type projected: bool
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            now = self._clock()
+            self._pool_list = (now, list(pools), key)
+            if not projected:
+                for p in pools:
+                    self._pools[p.id] = (now, p)
+
+    def get_pool(self, pool_id):
+        """
+        Returns the cached pool, or StateCache.MISS
+        :rtype: azure.batch.models.CloudPool
+        """
+        with self._lock:
+            return self._record(self._lookup(self._pools.get(pool_id)))
+
+    def set_pool(self, pool):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._pools[pool.id] = (self._clock(), pool)
+
+    def get_nodes(self, pool_id, key=None):
+        """
+        Returns the cached compute nodes for a pool, or StateCache.MISS
+        :param key: Identifies the listing mode, see get_pools
+        :rtype: list of azure.batch.models.ComputeNode
+        """
+        with self._lock:
+            entry = self._nodes.get(pool_id)
+            if entry and entry[2] != key:
+                return self._record(StateCache.MISS)
+            nodes = self._record(self._lookup(entry))
+            if nodes is StateCache.MISS:
+                return nodes
+            return list(nodes)
+
+    def set_nodes(self, pool_id, nodes, key=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._nodes[pool_id] = (self._clock(), list(nodes), key)
+
+    def patch_pool(self, pool_id, **attributes):
+        """
+        Updates attributes on the cached pool in place, e.g. after a resize.
+        """
+        with self._lock:
+            pools = [p for p in (self._pool_list[1] if self._pool_list else []) if p.id == pool_id]
+            entry = self._pools.get(pool_id)
+            if entry and entry[1] not in pools:
+                pools.append(entry[1])
+            for pool in pools:
+                for name, value in attributes.items():
+                    setattr(pool, name, value)
+
+    def invalidate_pool(self, pool_id):
+        """
+        Drops the pool and its compute nodes from the cache, along with the
+        pool listing if it includes the pool.
+        """
+        with self._lock:
+            self._pools.pop(pool_id, None)
+            self._nodes.pop(pool_id, None)
+            if self._pool_list and any(p.id == pool_id for p in self._pool_list[1]):
+                self._pool_list = None
+
+    def invalidate_nodes(self, pool_id):
+        with self._lock:
+            self._nodes.pop(pool_id, None)
+
+    def remove_pool(self, pool_id):
+        """
+        Removes a deleted pool from the cache, including the pool listing.
+        """
+        with self._lock:
+            self._pools.pop(pool_id, None)
+            self._nodes.pop(pool_id, None)
+            if self._pool_list:
+                timestamp, pools, key = self._pool_list
+                self._pool_list = (timestamp, [p for p in pools if p.id != pool_id], key)
+
+    def invalidate_pool_list(self):
+        with self._lock:
+            self._pool_list = None
+
+    def clear(self):
+        with self._lock:
+            self._pool_list = None
+            self._pools = {}
+            self._nodes = {}
+
+    def _lookup(self, entry):
+        if entry is None or not self.enabled or self._clock() - entry[0] >= self.ttl:
+            return StateCache.MISS
+        return entry[1]
+
+    def _record(self, value):
+        if value is StateCache.MISS:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
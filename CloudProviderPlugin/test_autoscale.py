@@ -0,0 +1,81 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import autoscale
+
+
+class AutoScaleFormulaTests(unittest.TestCase):
+    def test_dedicated_formula(self):
+        formula = autoscale.get_autoscale_formula(5, False)
+        variables = autoscale.evaluate_formula(formula)
+        self.assertEqual(5, variables['$TargetDedicatedNodes'])
+        self.assertEqual(0, variables['$TargetLowPriorityNodes'])
+        self.assertEqual('taskcompletion', variables['$NodeDeallocationOption'])
+
+    def test_low_priority_formula(self):
+        formula = autoscale.get_autoscale_formula(3, True, deallocation_option='requeue')
+        variables = autoscale.evaluate_formula(formula)
+        self.assertEqual(0, variables['$TargetDedicatedNodes'])
+        self.assertEqual(3, variables['$TargetLowPriorityNodes'])
+        self.assertEqual('requeue', variables['$NodeDeallocationOption'])
+
+    def test_negative_desired_nodes_clamped(self):
+        formula = autoscale.get_autoscale_formula(-2, False)
+        self.assertEqual(0, autoscale.evaluate_formula(formula)['$TargetDedicatedNodes'])
+
+    def test_get_formula_targets(self):
+        formula = autoscale.get_autoscale_formula(7, True)
+        self.assertEqual((7, True), autoscale.get_formula_targets(formula))
+
+    def test_get_formula_targets_foreign_formula(self):
+        self.assertEqual(None, autoscale.get_formula_targets('$TargetDedicatedNodes = 1;'))
+        self.assertEqual(None, autoscale.get_formula_targets('$x = $PendingTasks.GetSample(1);'))
+        self.assertEqual(None, autoscale.get_formula_targets(None))
+
+    def test_expressions(self):
+        variables = autoscale.evaluate_formula(
+            '$a = 2 + 3 * 4; $b = ($a - 4) / 2; $c = max($a, 20, $b); '
+            '$d = $a > 10 && !($b == 0) ? 1 : 0; $e = -$b',
+            {'$PendingTasks': 4})
+        self.assertEqual(14, variables['$a'])
+        self.assertEqual(5, variables['$b'])
+        self.assertEqual(20, variables['$c'])
+        self.assertEqual(1, variables['$d'])
+        self.assertEqual(-5, variables['$e'])
+        self.assertEqual(4, variables['$PendingTasks'])
+
+    def test_invalid_formula(self):
+        self.assertRaises(autoscale.FormulaError, autoscale.evaluate_formula, '$a = ;')
+        self.assertRaises(autoscale.FormulaError, autoscale.evaluate_formula, '$a = $undefined;')
+        self.assertRaises(autoscale.FormulaError, autoscale.evaluate_formula, '$a = 1 / 0;')
+
+
+if __name__ == '__main__':
+    unittest.main()
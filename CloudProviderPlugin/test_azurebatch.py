@@ -0,0 +1,354 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+
+import threading
+
+import azure.batch.models as batchmodels
+
+import AzureBatch
+import autoscale
+import catalog
+import mappers
+from test_pluginconfig import get_config
+from test_resizer import NoopWorker
+
+POOL_ID = 'azurewestus-rendering-centos73-Standard_F16'
+
+
+class FakeLoader:
+    def __init__(self, config):
+        self.config = config
+
+    def get(self):
+        return self.config
+
+
+class FakePoolOperations:
+    def __init__(self, service):
+        self.service = service
+        self.removals = []
+        self.formulas = []
+        self.evaluation_error = None
+
+    def get(self, pool_id):
+        return self.service.pools[pool_id]
+
+    def remove_nodes(self, pool_id, remove_param):
+        pool = self.service.pools[pool_id]
+        self.removals.append((pool_id, remove_param.node_list))
+        self.service.nodes[pool_id] = [n for n in self.service.nodes[pool_id] if n.id not in remove_param.node_list]
+        pool.target_dedicated_nodes -= len(remove_param.node_list)
+        pool.allocation_state = batchmodels.AllocationState.resizing
+
+    def evaluate_auto_scale(self, pool_id, auto_scale_formula):
+        return batchmodels.AutoScaleRun(timestamp=None, error=self.evaluation_error)
+
+    def enable_auto_scale(self, pool_id, auto_scale_formula, auto_scale_evaluation_interval):
+        self.formulas.append((pool_id, auto_scale_formula))
+        self.service.pools[pool_id].auto_scale_formula = auto_scale_formula
+
+
+class FakeComputeNodeOperations:
+    def __init__(self, service):
+        self.service = service
+        self.listings = 0
+
+    def list(self, pool_id, compute_node_list_options=None):
+        self.listings += 1
+        return list(self.service.nodes.get(pool_id, []))
+
+
+class FakeTaskOperations:
+    def __init__(self):
+        self.requests = []
+        self.tasks = []
+        self.states = {}
+        self.deleted = []
+        self.first_outcomes = {}
+        self._submitted = set()
+        self._lock = threading.Lock()
+
+    def add_collection(self, job_id, value):
+        """
+        Adds the tasks. first_outcomes holds the (status, error code) of the
+        first submission of a task by the order tasks are first submitted in.
+        A ServerBusyAfterAdd server error adds the task anyway.
+        """
+        results = []
+        with self._lock:
+            self.requests.append(len(value))
+            for task in value:
+                if task.id not in self._submitted:
+                    status, code = self.first_outcomes.get(len(self._submitted), ('success', None))
+                    self._submitted.add(task.id)
+                elif task.id in self.tasks:
+                    status, code = 'client_error', 'TaskExists'
+                else:
+                    status, code = 'success', None
+                if status == 'success' or code == 'ServerBusyAfterAdd':
+                    self.tasks.append(task.id)
+                error = batchmodels.BatchError(code=code, message=code) if code else None
+                results.append(batchmodels.TaskAddResult(status=getattr(batchmodels.TaskAddStatus, status),
+                                                         task_id=task.id, error=error))
+        return batchmodels.TaskAddCollectionResult(value=results)
+
+    def list(self, job_id, task_list_options=None):
+        # The service filters out completed tasks
+        states = [self.states.get(task_id, batchmodels.TaskState.active) for task_id in self.tasks]
+        return [batchmodels.CloudTask(id=task_id, state=state) for task_id, state in zip(self.tasks, states)
+                if state != batchmodels.TaskState.completed]
+
+    def delete(self, job_id, task_id):
+        with self._lock:
+            self.deleted.append(task_id)
+            self.tasks.remove(task_id)
+
+
+class FakeServiceClient:
+    def __init__(self):
+        self.pools = {}
+        self.nodes = {}
+        self.pool = FakePoolOperations(self)
+        self.compute_node = FakeComputeNodeOperations(self)
+        self.task = FakeTaskOperations()
+
+    def add_pool(self, pool_id, node_states, auto_scale=False):
+        pool = batchmodels.CloudPool(id=pool_id, vm_size='Standard_F16')
+        pool.allocation_state = batchmodels.AllocationState.steady
+        pool.target_dedicated_nodes = len(node_states)
+        pool.target_low_priority_nodes = 0
+        pool.enable_auto_scale = auto_scale
+        if auto_scale:
+            pool.auto_scale_formula = autoscale.get_autoscale_formula(len(node_states), False)
+        self.pools[pool_id] = pool
+        self.nodes[pool_id] = [batchmodels.ComputeNode(id='n{}'.format(i), state=state)
+                               for i, state in enumerate(node_states)]
+        return pool
+
+
+def get_batch(config, service):
+    batch = AzureBatch.Batch(config)
+    batch._client = service
+    batch.resizer._worker = NoopWorker()
+    return batch
+
+
+def get_plugin(service, **settings):
+    config = get_config()
+    config.resize_coalesce_window = 0
+    for name, value in settings.items():
+        setattr(config, name, value)
+    plugin = AzureBatch.AzureBatchCloudPlugin()
+    plugin.config_loader = FakeLoader(config)
+    plugin.batch_client = get_batch(config, service)
+    return plugin
+
+
+class ComputeNodeListingTests(unittest.TestCase):
+    def test_streamed_summary_listing_cached(self):
+        service = FakeServiceClient()
+        service.add_pool(POOL_ID, [batchmodels.ComputeNodeState.idle] * 2)
+        config = get_config()
+        config.state_cache_ttl = 60
+        batch = get_batch(config, service)
+
+        first = list(batch.iter_compute_nodes(POOL_ID, select=AzureBatch.NODE_SUMMARY_SELECT))
+        second = list(batch.iter_compute_nodes(POOL_ID, select=AzureBatch.NODE_SUMMARY_SELECT))
+        self.assertEqual(1, service.compute_node.listings)
+        self.assertEqual([n.id for n in first], [n.id for n in second])
+        self.assertIsInstance(second[0], AzureBatch.NodeSummary)
+
+    def test_partial_listing_not_cached(self):
+        service = FakeServiceClient()
+        service.add_pool(POOL_ID, [batchmodels.ComputeNodeState.idle] * 2)
+        config = get_config()
+        config.state_cache_ttl = 60
+        batch = get_batch(config, service)
+
+        next(iter(batch.iter_compute_nodes(POOL_ID, select=AzureBatch.NODE_SUMMARY_SELECT)))
+        list(batch.iter_compute_nodes(POOL_ID, select=AzureBatch.NODE_SUMMARY_SELECT))
+        self.assertEqual(2, service.compute_node.listings)
+
+
+class IdlePoolTests(unittest.TestCase):
+    def get_empty_pool(self, service, target):
+        pool = service.add_pool(POOL_ID, [])
+        pool.state = batchmodels.PoolState.active
+        pool.current_dedicated_nodes = 0
+        pool.current_low_priority_nodes = 0
+        pool.target_dedicated_nodes = target
+        return pool
+
+    def test_empty_pool_idle(self):
+        service = FakeServiceClient()
+        pool = self.get_empty_pool(service, 0)
+        self.assertTrue(get_plugin(service)._is_idle_pool(pool))
+
+    def test_failed_allocation_idle_despite_target(self):
+        service = FakeServiceClient()
+        pool = self.get_empty_pool(service, 2)
+        pool.resize_errors = [batchmodels.ResizeError(code='AccountCoreQuotaReached')]
+        self.assertTrue(get_plugin(service)._is_idle_pool(pool))
+
+    def test_pending_resize_not_idle(self):
+        service = FakeServiceClient()
+        pool = self.get_empty_pool(service, 0)
+        plugin = get_plugin(service)
+        plugin.batch_client.resizer.request_delta(POOL_ID, 0, 0, 2, 0)
+        self.assertFalse(plugin._is_idle_pool(pool))
+
+    def test_autoscale_pool_waiting_for_evaluation_not_idle(self):
+        service = FakeServiceClient()
+        pool = self.get_empty_pool(service, 0)
+        pool.enable_auto_scale = True
+        pool.auto_scale_formula = autoscale.get_autoscale_formula(2, False)
+        self.assertFalse(get_plugin(service)._is_idle_pool(pool))
+
+
+class TerminateInstancesTests(unittest.TestCase):
+    def test_autoscale_pool_removes_named_nodes(self):
+        service = FakeServiceClient()
+        pool = service.add_pool(POOL_ID, [batchmodels.ComputeNodeState.idle] * 3, auto_scale=True)
+        plugin = get_plugin(service)
+        client = plugin.batch_client
+
+        results = plugin.TerminateInstances([mappers.get_cloud_instance_id(POOL_ID, 'n1')])
+        self.assertEqual([True], results)
+        self.assertEqual([(POOL_ID, ['n1'])], service.pool.removals)
+
+        # The formula is lowered by the removed node once the pool is steady again
+        self.assertEqual(2, client.get_pending_resize(POOL_ID).total)
+        client.resizer.apply_pending()
+        self.assertEqual([], service.pool.formulas)
+        pool.allocation_state = batchmodels.AllocationState.steady
+        client.resizer.apply_pending()
+        self.assertEqual((2, False), autoscale.get_formula_targets(service.pool.formulas[-1][1]))
+
+    def test_requested_nodes_removed(self):
+        service = FakeServiceClient()
+        service.add_pool(POOL_ID, [batchmodels.ComputeNodeState.running, batchmodels.ComputeNodeState.idle])
+        plugin = get_plugin(service)
+        instance_id = mappers.get_cloud_instance_id(POOL_ID, 'n0')
+        plugin.hostnames.update({instance_id: 'render0'})
+
+        self.assertEqual([True], plugin.TerminateInstances([instance_id]))
+        self.assertEqual([(POOL_ID, ['n0'])], service.pool.removals)
+        self.assertIsNone(plugin.hostnames.get(instance_id))
+
+    def test_idle_node_substituted_for_running_node(self):
+        service = FakeServiceClient()
+        service.add_pool(POOL_ID, [batchmodels.ComputeNodeState.running, batchmodels.ComputeNodeState.idle])
+        plugin = get_plugin(service, scale_down_prefer_idle=True)
+        running_id = mappers.get_cloud_instance_id(POOL_ID, 'n0')
+        idle_id = mappers.get_cloud_instance_id(POOL_ID, 'n1')
+        plugin.hostnames.update({running_id: 'render0', idle_id: 'render1'})
+
+        # The running node keeps running, so it isn't reported as terminated
+        self.assertEqual([False], plugin.TerminateInstances([running_id]))
+        self.assertEqual([(POOL_ID, ['n1'])], service.pool.removals)
+        self.assertEqual('render0', plugin.hostnames.get(running_id))
+        self.assertIsNone(plugin.hostnames.get(idle_id))
+
+    def test_autoscale_formula_evaluation_error(self):
+        service = FakeServiceClient()
+        service.add_pool(POOL_ID, [batchmodels.ComputeNodeState.idle], auto_scale=True)
+        service.pool.evaluation_error = batchmodels.AutoScaleRunError(code='InvalidFormula', message='bad')
+        client = get_batch(get_config(), service)
+        self.assertRaises(autoscale.FormulaError, client.apply_autoscale_target, POOL_ID, 1, False)
+        self.assertEqual([], service.pool.formulas)
+
+
+class PoolNameTests(unittest.TestCase):
+    def test_pool_named_after_catalog_image(self):
+        config = get_config()
+        image = catalog.Catalog(config).get_image(config.managed_image_id_1)
+        self.assertEqual('azurewestus-MyCentOsImage-Standard_F16',
+                         AzureBatch.get_pool_name(config.deadline_cloud_region, image, 'Standard_F16', False))
+        self.assertEqual('azurewestus-MyCentOsImage-Standard_F16-lp',
+                         AzureBatch.get_pool_name(config.deadline_cloud_region, image, 'Standard_F16', True))
+
+
+class CreateInstancesTests(unittest.TestCase):
+    def test_unknown_hardware_type_rejected(self):
+        service = FakeServiceClient()
+        plugin = get_plugin(service, managed_image_os_1='CentOS7')
+        config = plugin.config_loader.get()
+        image = plugin._get_catalog().get_image(config.managed_image_id_1)
+        pool_id = AzureBatch.get_pool_name(config.deadline_cloud_region, image, 'Standard_F8', False)
+        service.add_pool(pool_id, [])
+
+        self.assertEqual([], plugin.CreateInstances('Standard_F8', config.managed_image_id_1, 2))
+        self.assertIsNone(plugin.batch_client.get_pending_resize(pool_id))
+
+
+class LicenseTaskTests(unittest.TestCase):
+    def test_tasks_added_in_chunks(self):
+        service = FakeServiceClient()
+        results = get_batch(get_config(), service).add_license_tasks('job', 250, True)
+        self.assertEqual([100, 100, 50], sorted(service.task.requests, reverse=True))
+        self.assertEqual(250, len(results))
+        self.assertEqual(250, len(set(service.task.tasks)))
+        self.assertTrue(all(r.status == batchmodels.TaskAddStatus.success for r in results))
+
+    def test_server_errors_retried(self):
+        service = FakeServiceClient()
+        service.task.first_outcomes = {
+            0: ('server_error', 'ServerBusy'),
+            1: ('server_error', 'ServerBusyAfterAdd'),
+            2: ('client_error', 'InvalidPropertyValue'),
+        }
+        results = get_batch(get_config(), service).add_license_tasks('job', 150, True)
+        self.assertEqual(150, len(results))
+        failed = [r for r in results if r.status != batchmodels.TaskAddStatus.success]
+        self.assertEqual(['InvalidPropertyValue'], [r.error.code for r in failed])
+        self.assertEqual(149, len(set(service.task.tasks)))
+        # The two server errors are resubmitted in one request
+        self.assertEqual(2, service.task.requests[-1])
+
+    def test_missing_tasks_added(self):
+        service = FakeServiceClient()
+        service.task.tasks = ['t0', 't1', 't2']
+        service.task.states = {'t0': batchmodels.TaskState.running, 't1': batchmodels.TaskState.completed}
+        results = get_batch(get_config(), service).reconcile_license_tasks('job', 4, True)
+        # t1 has completed, so two of the four nodes need a task
+        self.assertEqual(2, len(results))
+        self.assertEqual(5, len(service.task.tasks))
+
+    def test_surplus_queued_tasks_deleted(self):
+        service = FakeServiceClient()
+        service.task.tasks = ['t0', 't1', 't2']
+        service.task.states = {'t0': batchmodels.TaskState.running}
+        results = get_batch(get_config(), service).reconcile_license_tasks('job', 1, True)
+        self.assertEqual([], results)
+        self.assertEqual(['t1', 't2'], sorted(service.task.deleted))
+        self.assertEqual(['t0'], service.task.tasks)
+
+
+if __name__ == '__main__':
+    unittest.main()
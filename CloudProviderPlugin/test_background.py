@@ -0,0 +1,85 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+
+import threading
+import time
+
+import background
+
+
+class PeriodicWorkerTests(unittest.TestCase):
+
+    def test_stop_waits_for_worker(self):
+        ran = threading.Event()
+        worker = background.PeriodicWorker('Test', 60, ran.set)
+        worker.start()
+        worker.wake()
+        self.assertTrue(ran.wait(5))
+        self.assertTrue(worker.stop())
+        self.assertFalse(worker.running)
+
+    def test_stop_gives_up_on_blocked_worker(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocked():
+            started.set()
+            release.wait(5)
+
+        worker = background.PeriodicWorker('Test', 60, blocked)
+        worker.start()
+        worker.wake()
+        self.assertTrue(started.wait(5))
+        try:
+            self.assertFalse(worker.stop(timeout=0.1))
+        finally:
+            release.set()
+
+    def test_workers_stopped_against_one_deadline(self):
+        release = threading.Event()
+        workers = []
+        for i in range(3):
+            started = threading.Event()
+            worker = background.PeriodicWorker('Test{}'.format(i), 60,
+                                               lambda started=started: (started.set(), release.wait(5)))
+            worker.start()
+            worker.wake()
+            self.assertTrue(started.wait(5))
+            workers.append(worker)
+        try:
+            start = time.time()
+            self.assertFalse(background.stop_workers(workers, timeout=0.2))
+            self.assertLess(time.time() - start, 0.5)
+        finally:
+            release.set()
+        self.assertTrue(all(w.join(5) for w in workers))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import requests
+
+from batchauth import CachedTokenCredentials, TokenCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.fetched = 0
+
+    def fetch_token(self):
+        self.fetched += 1
+        return 'token{}'.format(self.fetched), 3600
+
+    def test_token_is_cached(self):
+        cache = TokenCache(self.fetch_token, refresh_margin=300, clock=self.clock)
+        self.assertEqual('token1', cache.get_token())
+        self.assertEqual('token1', cache.get_token())
+        self.assertEqual({'token_fetches': 1, 'token_cache_hits': 1}, cache.get_stats())
+
+    def test_token_refreshed_before_expiry(self):
+        cache = TokenCache(self.fetch_token, refresh_margin=300, clock=self.clock)
+        cache.get_token()
+        self.clock.now += 3600 - 300
+        self.assertEqual('token2', cache.get_token())
+        self.assertEqual(2, cache.token_fetches)
+
+    def test_default_lifetime_used_without_expiry(self):
+        cache = TokenCache(lambda: ('abc', None), refresh_margin=0, default_lifetime=60, clock=self.clock)
+        cache.get_token()
+        self.clock.now += 59
+        cache.get_token()
+        self.assertEqual(1, cache.token_fetches)
+        self.clock.now += 1
+        cache.get_token()
+        self.assertEqual(2, cache.token_fetches)
+
+    def test_invalidate_forces_fetch(self):
+        cache = TokenCache(self.fetch_token, clock=self.clock)
+        cache.get_token()
+        cache.invalidate()
+        self.assertEqual('token2', cache.get_token())
+
+
+
+class CachedTokenCredentialsTests(unittest.TestCase):
+    def get_credentials(self):
+        credentials = CachedTokenCredentials(None, pool_size=32)
+        credentials.token_cache = TokenCache(lambda: ('token', 3600))
+        return credentials
+
+    def test_supplied_sessions_share_pooled_adapter(self):
+        credentials = self.get_credentials()
+        first = credentials.signed_session(requests.Session())
+        second = credentials.signed_session(requests.Session())
+        adapter = first.adapters['https://']
+        self.assertIs(adapter, second.adapters['https://'])
+        self.assertEqual(32, adapter._pool_maxsize)
+        self.assertEqual('Bearer token', second.headers['Authorization'])
+
+    def test_pooled_session_used_without_session(self):
+        credentials = self.get_credentials()
+        session = credentials.signed_session()
+        self.assertIs(session, credentials.signed_session())
+        self.assertIs(credentials.signed_session(requests.Session()).adapters['https://'],
+                      session.adapters['https://'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+from FranticX import Environment2
+
+from catalog import Catalog
+from test_pluginconfig import get_config
+
+
+class CatalogTests(unittest.TestCase):
+
+    def setUp(self):
+        self.config = get_config()
+        self.config.managed_image_os_1 = 'CentOS7'
+        self.catalog = Catalog(self.config)
+
+    def test_images_include_managed_and_rendering_images(self):
+        image_ids = [i.ID for i in self.catalog.get_os_images()]
+        self.assertEqual(image_ids[:2], [self.config.managed_image_id_1, self.config.managed_image_id_2])
+        self.assertEqual(len(image_ids), 4)
+
+    def test_get_image(self):
+        image = self.catalog.get_image('batch:rendering-centos73:rendering:latest:batch.node.centos 7')
+        self.assertEqual(image.display_name, 'rendering-centos73')
+        self.assertEqual(image.platform, Environment2.OS.Linux)
+        self.assertTrue(image.is_linux)
+        self.assertEqual(image.image_spec.image_offer, 'rendering-centos73')
+        self.assertEqual(image.image_spec.node_agent_sku_id, 'batch.node.centos 7')
+
+    def test_get_managed_image(self):
+        image = self.catalog.get_image(self.config.managed_image_id_1)
+        self.assertEqual(image.image_spec.image_id, self.config.managed_image_id_1)
+        self.assertEqual(image.image_spec.node_agent_sku_id, 'batch.node.centos 7')
+
+    def test_get_image_by_name(self):
+        image = self.catalog.get_image_by_name('MyWIndowsImage')
+        self.assertEqual(image.id, self.config.managed_image_id_2)
+        self.assertFalse(image.is_linux)
+
+    def test_unknown_image(self):
+        self.assertIsNone(self.catalog.get_image('batch:unknown:sku:latest:agent'))
+        self.assertIsNone(self.catalog.get_image_by_name('unknown'))
+
+    def test_unsupported_managed_image_os(self):
+        self.config.managed_image_os_1 = 'CentOS73'
+        image = Catalog(self.config).get_image(self.config.managed_image_id_1)
+        self.assertIsNone(image.image_spec)
+
+    def test_images_are_built_once(self):
+        calls = []
+        get_os_images = self.config.get_os_images
+        self.config.get_os_images = lambda: calls.append(1) or get_os_images()
+        self.catalog.get_os_images()
+        self.catalog.get_image(self.config.managed_image_id_1)
+        self.assertEqual(len(calls), 1)
+
+    def test_returned_lists_are_copies(self):
+        self.catalog.get_os_images().pop()
+        self.assertEqual(len(self.catalog.get_os_images()), 4)
+
+    def test_hardware_types(self):
+        self.assertEqual([h.ID for h in self.catalog.get_hardware_types()], ['Standard_F16'])
+        self.assertEqual(self.catalog.get_hardware_type('Standard_F16').VCPUs, 16)
+        self.assertIsNone(self.catalog.get_hardware_type('Standard_F8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import codecs
+
+from hostnames import HostnameCache, decode_hostname
+
+
+class HostnameCacheTests(unittest.TestCase):
+    def test_get_and_missing(self):
+        cache = HostnameCache()
+        cache.update({'p1:n1': 'host1'})
+        self.assertEqual('host1', cache.get('p1:n1'))
+        self.assertEqual(None, cache.get('p1:n2'))
+        self.assertEqual(['p1:n2'], cache.get_missing(['p1:n1', 'p1:n2']))
+
+    def test_retain_drops_unlisted_nodes(self):
+        cache = HostnameCache()
+        cache.update({'p1:n1': 'host1', 'p1:n2': 'host2'})
+        cache.retain(['p1:n2', 'p1:n3'])
+        self.assertEqual(None, cache.get('p1:n1'))
+        self.assertEqual('host2', cache.get('p1:n2'))
+        self.assertEqual(1, len(cache))
+
+    def test_forget(self):
+        cache = HostnameCache()
+        cache.update({'p1:n1': 'host1'})
+        cache.forget(['p1:n1', 'p1:n9'])
+        self.assertEqual(0, len(cache))
+
+
+class DecodeHostnameTests(unittest.TestCase):
+    def test_utf8(self):
+        self.assertEqual('node-1', decode_hostname(b'node-1\n'))
+
+    def test_powershell_utf16(self):
+        content = codecs.BOM_UTF16_LE + u'NODE-1\r\n'.encode('utf-16-le')
+        self.assertEqual('NODE-1', decode_hostname(content))
+
+
+if __name__ == '__main__':
+    unittest.main()
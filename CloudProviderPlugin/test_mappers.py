@@ -28,6 +28,9 @@ import os
 import clr
 sys.path.insert(0, os.environ['DEADLINE_PATH'])
 
+import azure.batch.models as batchmodels
+from Deadline.Cloud import InstanceStatus
+
 from pluginconfig import BatchPluginConfig
 import mappers
 
@@ -84,5 +87,60 @@ class Tests(unittest.TestCase):
         config = get_config()
 
 
+def get_pool():
+    pool = batchmodels.CloudPool(id='azurewestus-rendering-centos73-Standard_F16', vm_size='Standard_F16')
+    pool.virtual_machine_configuration = batchmodels.VirtualMachineConfiguration(
+        image_reference=batchmodels.ImageReference(
+            publisher='batch', offer='rendering-centos73', sku='rendering', version='latest'),
+        node_agent_sku_id='batch.node.centos 7')
+    return pool
+
+
+class MapPoolNodesTests(unittest.TestCase):
+    def test_maps_nodes(self):
+        nodes = [batchmodels.ComputeNode(id='node1', state=batchmodels.ComputeNodeState.idle, ip_address='10.0.0.4'),
+                 batchmodels.ComputeNode(id='node2', state=batchmodels.ComputeNodeState.starting, ip_address='10.0.0.5')]
+        instances = mappers.map_pool_nodes(get_pool(), nodes, 'westus', 'westus2')
+        self.assertEqual(len(instances), 2)
+        ci = instances[0]
+        self.assertEqual(ci.ID, 'azurewestus-rendering-centos73-Standard_F16:node1')
+        self.assertEqual(ci.Name, 'node1')
+        self.assertEqual(ci.HardwareID, 'Standard_F16')
+        self.assertEqual(ci.ImageID, 'batch:rendering-centos73:rendering:latest:batch.node.centos 7')
+        self.assertEqual(ci.RegionName, 'westus')
+        self.assertEqual(ci.Zone, 'westus2')
+        self.assertEqual(ci.PrivateIP, '10.0.0.4')
+        self.assertEqual(ci.Status, InstanceStatus.Running)
+        self.assertEqual(instances[1].Status, InstanceStatus.Pending)
+
+    def test_public_ip_from_remote_access_endpoint(self):
+        node = batchmodels.ComputeNode(id='node1', state=batchmodels.ComputeNodeState.idle, ip_address='10.0.0.4')
+        node.endpoint_configuration = batchmodels.ComputeNodeEndpointConfiguration(inbound_endpoints=[
+            batchmodels.InboundEndpoint(name='SSHRule.0', protocol='tcp', public_ip_address='1.2.3.4',
+                                        public_fqdn='', frontend_port=50000, backend_port=22)])
+        ci = mappers.map_pool_nodes(get_pool(), [node])[0]
+        self.assertEqual(ci.PublicIP, '1.2.3.4')
+        self.assertEqual(ci.PrivateIP, '10.0.0.4')
+
+    def test_managed_image_id(self):
+        pool = get_pool()
+        pool.virtual_machine_configuration.image_reference = batchmodels.ImageReference(
+            virtual_machine_image_id='/subscriptions/abc/images/MyImage')
+        self.assertEqual(mappers.get_pool_image_id(pool), '/subscriptions/abc/images/MyImage')
+
+    def test_state_mapping(self):
+        self.assertEqual(mappers.compute_node_state_to_deadline_status(batchmodels.ComputeNodeState.preempted),
+                         InstanceStatus.Stopped)
+        self.assertEqual(mappers.compute_node_state_to_deadline_status(batchmodels.ComputeNodeState.leaving_pool),
+                         InstanceStatus.Stopping)
+        self.assertEqual(mappers.compute_node_state_to_deadline_status(None), InstanceStatus.Unknown)
+
+    def test_single_node(self):
+        node = batchmodels.ComputeNode(id='node1', state=batchmodels.ComputeNodeState.running, ip_address='10.0.0.4')
+        ci = mappers.compute_node_to_deadline_instance(get_pool(), node)
+        self.assertEqual(ci.ID, 'azurewestus-rendering-centos73-Standard_F16:node1')
+        self.assertEqual(ci.Status, InstanceStatus.Running)
 
 
+if __name__ == '__main__':
+    unittest.main()
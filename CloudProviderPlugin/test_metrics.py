@@ -0,0 +1,147 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import shutil
+import tempfile
+
+import metrics
+import throttle
+from test_throttle import FakeClock, FakePaged, batch_error
+
+
+class HistogramTests(unittest.TestCase):
+    def test_cumulative_counts(self):
+        histogram = metrics.Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 5.0):
+            histogram.observe(value)
+        self.assertEqual([1, 3], histogram.get_cumulative_counts())
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(6.25, histogram.sum)
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.registry = metrics.MetricsRegistry(clock=self.clock)
+
+    def test_call_records_latency_and_errors(self):
+        def slow():
+            self.clock.now += 0.2
+            return 'ok'
+
+        def throttled():
+            raise batch_error(503, 'ServerBusy')
+
+        self.assertEqual('ok', self.registry.call('api', 'pool.get', slow))
+        self.assertRaises(Exception, self.registry.call, 'api', 'pool.get', throttled)
+
+        op = self.registry.get_snapshot()['operations'][('api', 'pool.get')]
+        self.assertEqual(2, op['count'])
+        self.assertAlmostEqual(0.2, op['sum'])
+        self.assertEqual({'ServerBusy': 1}, op['errors'])
+        self.assertEqual(1, op['throttled'])
+
+    def test_collected_values(self):
+        self.registry.add_collector('client', lambda: {'retries': 3})
+        self.assertEqual({'client_retries': 3}, self.registry.get_snapshot()['values'])
+
+    def test_render_prometheus(self):
+        self.registry.observe('api', 'pool.list', 0.02)
+        self.registry.observe('api', 'pool.list', 0.3, ValueError('bad'))
+        text = self.registry.render_prometheus()
+        self.assertIn('azurebatch_operation_seconds_bucket{kind="api",le="0.025",operation="pool.list"} 1', text)
+        self.assertIn('azurebatch_operation_seconds_bucket{kind="api",le="+Inf",operation="pool.list"} 2', text)
+        self.assertIn('azurebatch_operation_seconds_count{kind="api",operation="pool.list"} 2', text)
+        self.assertIn('azurebatch_operation_errors_total{code="ValueError",kind="api",operation="pool.list"} 1',
+                      text)
+
+    def test_write_prometheus_replaces_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'azurebatch.prom')
+            self.registry.write_prometheus(path)
+            self.registry.observe('callback', 'GetActiveInstances', 1.5)
+            self.registry.write_prometheus(path)
+            with open(path) as f:
+                self.assertIn('operation="GetActiveInstances"', f.read())
+            self.assertEqual(['azurebatch.prom'], os.listdir(directory))
+        finally:
+            shutil.rmtree(directory)
+
+
+class InstrumentMethodsTests(unittest.TestCase):
+    def test_public_methods_recorded(self):
+        class Wrapper:
+            def __init__(self, registry):
+                self.metrics = registry
+
+            def get_pool(self, pool_id):
+                return pool_id
+
+            def iter_nodes(self):
+                yield 1
+
+            def _private(self):
+                return 1
+
+        metrics.instrument_methods(Wrapper, 'batch')
+        registry = metrics.MetricsRegistry()
+        wrapper = Wrapper(registry)
+        self.assertEqual('p1', wrapper.get_pool('p1'))
+        self.assertEqual([1], list(wrapper.iter_nodes()))
+        wrapper._private()
+        self.assertEqual([('batch', 'get_pool')], list(registry.get_snapshot()['operations']))
+
+        # Nothing is recorded without a registry
+        Wrapper(None).get_pool('p1')
+
+
+class ThrottledClientMetricsTests(unittest.TestCase):
+    def test_each_attempt_recorded(self):
+        clock = FakeClock()
+        policy = throttle.RetryPolicy(sleep=clock.sleep, random_func=lambda: 1.0)
+        registry = metrics.MetricsRegistry(clock=clock)
+        paged = FakePaged([[1], batch_error(429, 'TooManyRequests'), [2]])
+
+        class Operations:
+            def list(self):
+                return paged
+
+        class Client:
+            pool = Operations()
+
+        client = throttle.ThrottledClient(Client(), policy, registry)
+        self.assertEqual([1, 2], list(client.pool.list()))
+        op = registry.get_snapshot()['operations'][('api', 'pool.list')]
+        self.assertEqual(4, op['count'])
+        self.assertEqual(1, op['throttled'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import threading
+import time
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import parallel
+
+
+class ParallelTests(unittest.TestCase):
+    def test_results_in_item_order(self):
+        def slow_square(x):
+            time.sleep(0.01 * (5 - x))
+            return x * x
+        results = parallel.map_bounded(slow_square, range(5), 5)
+        self.assertEqual([0, 1, 4, 9, 16], [r.value for r in results])
+        self.assertEqual([0, 1, 2, 3, 4], [r.item for r in results])
+
+    def test_failures_are_isolated(self):
+        def fail_on_two(x):
+            if x == 2:
+                raise ValueError('boom')
+            return x
+        results = parallel.map_bounded(fail_on_two, range(4), 2)
+        self.assertEqual([True, True, False, True], [r.succeeded for r in results])
+        self.assertTrue(isinstance(results[2].error, ValueError))
+        self.assertTrue('boom' in results[2].error_trace)
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        state = {'active': 0, 'max': 0}
+
+        def track(x):
+            with lock:
+                state['active'] += 1
+                state['max'] = max(state['max'], state['active'])
+            time.sleep(0.01)
+            with lock:
+                state['active'] -= 1
+
+        parallel.map_bounded(track, range(20), 3)
+        self.assertTrue(state['max'] <= 3)
+
+    def test_empty_items(self):
+        self.assertEqual([], parallel.map_bounded(lambda x: x, [], 4))
+
+    def test_imap_yields_results_before_all_complete(self):
+        release = threading.Event()
+
+        def wait_on_last(x):
+            if x == 2:
+                release.wait(5)
+            return x
+
+        results = parallel.imap_bounded(wait_on_last, range(3), 3)
+        self.assertEqual(0, next(results).value)
+        self.assertEqual(1, next(results).value)
+        release.set()
+        self.assertEqual(2, next(results).value)
+
+    def test_imap_single_worker_is_lazy(self):
+        calls = []
+        results = parallel.imap_bounded(lambda x: calls.append(x) or x, range(3), 1)
+        self.assertEqual(0, next(results).value)
+        self.assertEqual([0], calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+
+from placeholders import PlaceholderTracker
+
+
+class SequentialIds:
+    def __init__(self):
+        self.next_id = 0
+
+    def __call__(self):
+        self.next_id += 1
+        return 'pending-{}'.format(self.next_id)
+
+
+class TestPlaceholderTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = PlaceholderTracker(id_factory=SequentialIds())
+
+    def test_add_returns_new_ids(self):
+        self.assertEqual(self.tracker.add('pool', 2), ['pending-1', 'pending-2'])
+        self.assertEqual(self.tracker.add('pool', 1), ['pending-3'])
+        self.assertEqual(self.tracker.get('pool'), ['pending-1', 'pending-2', 'pending-3'])
+
+    def test_ids_are_stable(self):
+        self.tracker.add('pool', 2)
+        self.assertEqual(self.tracker.reconcile('pool', 2), ['pending-1', 'pending-2'])
+        self.assertEqual(self.tracker.reconcile('pool', 2), ['pending-1', 'pending-2'])
+
+    def test_ids_are_retired_oldest_first(self):
+        self.tracker.add('pool', 3)
+        self.assertEqual(self.tracker.reconcile('pool', 2), ['pending-2', 'pending-3'])
+        self.assertEqual(self.tracker.reconcile('pool', 0), [])
+        self.assertEqual(self.tracker.get('pool'), [])
+
+    def test_reconcile_adds_missing_ids(self):
+        self.tracker.add('pool', 1)
+        self.assertEqual(self.tracker.reconcile('pool', 3), ['pending-1', 'pending-2', 'pending-3'])
+
+    def test_ids_are_distinct_across_pools(self):
+        a = self.tracker.reconcile('a', 2)
+        b = self.tracker.reconcile('b', 2)
+        self.assertEqual(len(set(a + b)), 4)
+
+    def test_default_ids_are_unique(self):
+        tracker = PlaceholderTracker()
+        self.assertEqual(len(set(tracker.add('pool', 100))), 100)
+
+    def test_retain_drops_missing_pools(self):
+        self.tracker.add('a', 1)
+        self.tracker.add('b', 1)
+        self.tracker.retain(['a'])
+        self.assertEqual(self.tracker.get('a'), ['pending-1'])
+        self.assertEqual(self.tracker.get('b'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
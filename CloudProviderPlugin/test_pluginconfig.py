@@ -29,7 +29,7 @@ import clr
 sys.path.insert(0, os.environ['DEADLINE_PATH'])
 
 from FranticX import Environment2
-from pluginconfig import BatchPluginConfig
+from pluginconfig import BatchPluginConfig, ConfigLoader, get_changed_settings
 
 
 def get_config():
@@ -96,6 +96,75 @@ class ConfigTests(unittest.TestCase):
         self.assertEqual('MyWIndowsImage', image.Description)
         self.assertEqual(Environment2.OS.Windows, image.Platform)
 
+    def test_changed_settings(self):
+        old_config = get_config()
+        new_config = get_config()
+        self.assertEqual(set(), get_changed_settings(old_config, new_config))
+        new_config.max_parallel_requests = 16
+        self.assertEqual({'max_parallel_requests'}, get_changed_settings(old_config, new_config))
+
+
+class FakeWrapper:
+    def __init__(self, entries):
+        self.entries = entries
+        self.reads = 0
+
+    def GetConfigEntryWithDefault(self, name, default):
+        self.reads += 1
+        return self.entries.get(name, default)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def load_fake_config(wrapper):
+    if wrapper.GetConfigEntryWithDefault('BatchAccountUrl', None) == 'invalid':
+        raise ValueError('invalid')
+    config = get_config()
+    config.max_parallel_requests = int(wrapper.GetConfigEntryWithDefault('MaxParallelRequests', 8))
+    return config
+
+
+class ConfigLoaderTests(unittest.TestCase):
+    def setUp(self):
+        self.wrapper = FakeWrapper({'BatchAccountUrl': 'https://contoso', 'MaxParallelRequests': '8'})
+        self.clock = FakeClock()
+        self.loader = ConfigLoader(self.wrapper, check_interval=30, clock=self.clock, load=load_fake_config)
+
+    def test_entries_not_read_within_interval(self):
+        config = self.loader.get()
+        reads = self.wrapper.reads
+        self.clock.now += 29
+        self.assertIs(config, self.loader.get())
+        self.assertEqual(reads, self.wrapper.reads)
+
+    def test_unchanged_entries_keep_config(self):
+        config = self.loader.get()
+        self.clock.now += 30
+        self.assertIs(config, self.loader.get())
+        self.assertEqual(1, self.loader.loads)
+
+    def test_changed_entries_reload_config(self):
+        config = self.loader.get()
+        self.wrapper.entries['MaxParallelRequests'] = '16'
+        self.clock.now += 30
+        new_config = self.loader.get()
+        self.assertIsNot(config, new_config)
+        self.assertEqual(16, new_config.max_parallel_requests)
+
+    def test_invalid_change_keeps_previous_config(self):
+        config = self.loader.get()
+        self.wrapper.entries['BatchAccountUrl'] = 'invalid'
+        self.clock.now += 30
+        self.assertIs(config, self.loader.get())
+        self.clock.now += 30
+        self.assertIs(config, self.loader.get())
+        self.assertEqual(1, self.loader.loads)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,138 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import shutil
+import tempfile
+
+import profiling
+from test_throttle import FakeClock
+
+CALLBACKS = ['CreateInstances', 'GetActiveInstances', 'TerminateInstances']
+
+
+class ParseCallbackNamesTests(unittest.TestCase):
+    def test_names(self):
+        self.assertEqual(frozenset(), profiling.parse_callback_names(None, CALLBACKS))
+        self.assertEqual(frozenset(['GetActiveInstances', 'CreateInstances']),
+                         profiling.parse_callback_names(' GetActiveInstances; CreateInstances;', CALLBACKS))
+        self.assertEqual(frozenset(CALLBACKS), profiling.parse_callback_names('*', CALLBACKS))
+
+    def test_unknown_name(self):
+        self.assertRaises(ValueError, profiling.parse_callback_names, 'GetActiveInstance', CALLBACKS)
+
+
+class CallbackProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.logs = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_profiler(self, budget=10, sample_rate=1.0, max_dumps=profiling.MAX_PROFILE_DUMPS):
+        return profiling.CallbackProfiler(frozenset(['GetActiveInstances']), budget, sample_rate, self.directory,
+                                          self.logs.append, max_dumps=max_dumps, clock=self.clock,
+                                          sample=lambda: 0.5)
+
+    def slow_callback(self, seconds):
+        self.clock.now += seconds
+        return seconds
+
+    def test_over_budget_dumped_and_summarized(self):
+        profiler = self.get_profiler()
+        self.assertEqual(30, profiler.call('GetActiveInstances', self.slow_callback, 30))
+        self.assertEqual(1, len(os.listdir(self.directory)))
+        self.assertTrue(os.listdir(self.directory)[0].startswith('GetActiveInstances-'))
+        self.assertEqual(1, len(self.logs))
+        self.assertIn('GetActiveInstances took 30.00s', self.logs[0])
+        self.assertIn('slow_callback', self.logs[0])
+
+    def test_within_budget_not_reported(self):
+        profiler = self.get_profiler()
+        profiler.call('GetActiveInstances', self.slow_callback, 5)
+        self.assertEqual([], os.listdir(self.directory))
+        self.assertEqual([], self.logs)
+
+    def test_unselected_and_unsampled_calls_not_profiled(self):
+        self.get_profiler().call('CreateInstances', self.slow_callback, 30)
+        self.get_profiler(sample_rate=0.25).call('GetActiveInstances', self.slow_callback, 30)
+        self.assertEqual([], self.logs)
+
+    def test_errors_reported(self):
+        def failing():
+            self.clock.now += 30
+            raise ValueError('failed')
+
+        profiler = self.get_profiler()
+        self.assertRaises(ValueError, profiler.call, 'GetActiveInstances', failing)
+        self.assertEqual(1, len(self.logs))
+
+    def test_nested_calls_in_outer_profile(self):
+        profiler = self.get_profiler()
+
+        def outer():
+            return profiler.call('GetActiveInstances', self.slow_callback, 30)
+
+        profiler.call('GetActiveInstances', outer)
+        self.assertEqual(1, len(self.logs))
+
+    def test_old_dumps_removed(self):
+        profiler = self.get_profiler(max_dumps=2)
+        for i in range(4):
+            profiler.call('GetActiveInstances', self.slow_callback, 30)
+        self.assertEqual(2, len(os.listdir(self.directory)))
+
+
+class ProfileMethodsTests(unittest.TestCase):
+    def test_calls_go_through_profiler(self):
+        calls = []
+
+        class Profiler:
+            def call(self, name, func, *args, **kwargs):
+                calls.append(name)
+                return func(*args, **kwargs)
+
+        class Plugin:
+            profiler = None
+
+            def GetActiveInstances(self):
+                return []
+
+        profiling.profile_methods(Plugin, ['GetActiveInstances'])
+        plugin = Plugin()
+        self.assertEqual([], plugin.GetActiveInstances())
+        self.assertEqual([], calls)
+        plugin.profiler = Profiler()
+        plugin.GetActiveInstances()
+        self.assertEqual(['GetActiveInstances'], calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
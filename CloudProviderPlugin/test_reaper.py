@@ -0,0 +1,83 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+from reaper import IdlePoolReaper
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestIdlePoolReaper(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.reaper = IdlePoolReaper(600, min_idle_checks=2, clock=self.clock)
+
+    def test_pool_in_use_is_kept(self):
+        self.assertFalse(self.reaper.observe('pool', False))
+        self.assertIsNone(self.reaper.get_idle_seconds('pool'))
+
+    def test_pool_deleted_after_grace_period(self):
+        self.assertFalse(self.reaper.observe('pool', True))
+        self.clock.now += 599
+        self.assertFalse(self.reaper.observe('pool', True))
+        self.clock.now += 1
+        self.assertTrue(self.reaper.observe('pool', True))
+        self.assertEqual(self.reaper.get_idle_seconds('pool'), 600)
+
+    def test_pool_needs_consecutive_checks(self):
+        self.assertFalse(self.reaper.observe('pool', True))
+        self.clock.now += 3600
+        self.assertFalse(self.reaper.observe('pool', False))
+        self.assertFalse(self.reaper.observe('pool', True))
+        self.clock.now += 3600
+        self.assertTrue(self.reaper.observe('pool', True))
+
+    def test_single_check_after_long_idle_is_not_enough(self):
+        self.reaper.observe('pool', True)
+        self.reaper.forget('pool')
+        self.clock.now += 3600
+        self.assertFalse(self.reaper.observe('pool', True))
+
+    def test_retain_drops_missing_pools(self):
+        self.reaper.observe('a', True)
+        self.reaper.observe('b', True)
+        self.reaper.retain(['a'])
+        self.assertIsNotNone(self.reaper.get_idle_seconds('a'))
+        self.assertIsNone(self.reaper.get_idle_seconds('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
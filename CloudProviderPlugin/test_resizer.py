@@ -0,0 +1,302 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import azure.batch.models as batchmodels
+
+from resizer import PoolResizer, REMOVAL_TIMEOUT, get_lowered_target
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class ConflictError(Exception):
+    def __init__(self):
+        Exception.__init__(self, 'PoolNotSteady')
+        self.response = FakeResponse(409)
+
+
+class FakePool:
+    def __init__(self, allocation_state, target_dedicated_nodes=0, target_low_priority_nodes=0):
+        self.enable_auto_scale = False
+        self.allocation_state = allocation_state
+        self.target_dedicated_nodes = target_dedicated_nodes
+        self.target_low_priority_nodes = target_low_priority_nodes
+
+
+class FakeBatch:
+    def __init__(self, pool):
+        self.pool = pool
+        self.resizes = []
+        self.autoscale_targets = []
+        self.removals = []
+        self.removal_error = None
+        self.stop_resizes = 0
+        self.resizer = None
+
+    def get_pool(self, pool_id, use_cache=True):
+        return self.pool
+
+    def stop_resize(self, pool_id):
+        self.stop_resizes += 1
+        self.pool.allocation_state = batchmodels.AllocationState.stopping
+
+    def apply_autoscale_target(self, pool_id, desired_nodes, prefer_low_priority):
+        self.autoscale_targets.append((pool_id, desired_nodes, prefer_low_priority))
+
+    def apply_removal(self, pool_id, node_ids, deallocation_option=None, auto_scale=False):
+        if self.removal_error:
+            raise self.removal_error
+        self.removals.append((pool_id, list(node_ids), deallocation_option))
+        self.pool.allocation_state = batchmodels.AllocationState.resizing
+        self.resizer.on_removed(pool_id, len(node_ids), auto_scale)
+
+    def apply_resize(self, pool_id, target_dedicated, target_low_priority):
+        self.resizes.append((pool_id, target_dedicated, target_low_priority))
+        self.pool.target_dedicated_nodes = target_dedicated
+        self.pool.target_low_priority_nodes = target_low_priority
+        self.pool.allocation_state = batchmodels.AllocationState.resizing
+
+
+class NoopWorker:
+    def start(self):
+        pass
+
+    def wake(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def get_resizer(batch, coalesce_window=0, clock=None):
+    resizer = PoolResizer(batch, coalesce_window=coalesce_window, clock=clock or FakeClock())
+    resizer._worker = NoopWorker()
+    if batch:
+        batch.resizer = resizer
+    return resizer
+
+
+class PoolResizerTests(unittest.TestCase):
+    def test_steady_pool_resized(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.steady))
+        resizer = get_resizer(batch)
+        resizer.request_delta('p1', 0, 0, 3, 0)
+        self.assertEqual(3, resizer.get_pending_target('p1').total)
+        resizer.apply_pending()
+        self.assertEqual([('p1', 3, 0)], batch.resizes)
+        self.assertEqual(None, resizer.get_pending_target('p1'))
+
+    def test_resizing_pool_stopped_then_resized(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.resizing, 1))
+        resizer = get_resizer(batch)
+        resizer.request_delta('p1', 0, 0, 4, 0)
+        resizer.apply_pending()
+        resizer.apply_pending()
+        self.assertEqual(1, batch.stop_resizes)
+        self.assertEqual([], batch.resizes)
+
+        batch.pool.allocation_state = batchmodels.AllocationState.steady
+        resizer.apply_pending()
+        self.assertEqual([('p1', 4, 0)], batch.resizes)
+
+    def test_delta_added_to_pending(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.stopping))
+        resizer = get_resizer(batch)
+        resizer.request_delta('p1', 0, 0, 2, 0)
+        resizer.apply_pending()
+        resizer.request_delta('p1', 0, 0, 3, 1)
+        batch.pool.allocation_state = batchmodels.AllocationState.steady
+        resizer.apply_pending()
+        self.assertEqual([('p1', 5, 1)], batch.resizes)
+
+    def test_target_already_applied(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.resizing, 2))
+        resizer = get_resizer(batch)
+        resizer.request_delta('p1', 0, 0, 2, 0)
+        resizer.apply_pending()
+        self.assertEqual(0, batch.stop_resizes)
+        self.assertEqual(None, resizer.get_pending_target('p1'))
+
+    def test_deltas_coalesced_into_one_resize(self):
+        clock = FakeClock()
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.steady, 2))
+        resizer = get_resizer(batch, coalesce_window=5, clock=clock)
+        resizer.request_delta('p1', 2, 0, 3, 0)
+        resizer.apply_pending()
+        self.assertEqual([], batch.resizes)
+
+        clock.now += 2
+        target = resizer.request_delta('p1', 2, 0, 1, 2)
+        self.assertEqual(6, target.target_dedicated)
+        self.assertEqual(2, target.target_low_priority)
+
+        clock.now += 3
+        resizer.apply_pending()
+        self.assertEqual([('p1', 6, 2)], batch.resizes)
+
+    def test_delta_never_negative(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.steady, 2))
+        resizer = get_resizer(batch)
+        target = resizer.request_delta('p1', 2, 0, -5, 0)
+        self.assertEqual(0, target.total)
+
+    def test_autoscale_pool_updates_formula(self):
+        clock = FakeClock()
+        pool = FakePool(batchmodels.AllocationState.resizing)
+        pool.enable_auto_scale = True
+        batch = FakeBatch(pool)
+        resizer = get_resizer(batch, clock=clock)
+        resizer.request_delta('p1', 0, 0, 0, 4)
+
+        # The formula can't be updated while the pool is resizing, and the resize isn't stopped
+        resizer.apply_pending()
+        self.assertEqual([], batch.autoscale_targets)
+        self.assertEqual(0, batch.stop_resizes)
+        pool.allocation_state = batchmodels.AllocationState.steady
+        resizer.apply_pending()
+        self.assertEqual([('p1', 4, True)], batch.autoscale_targets)
+
+        # Updates are limited to one every 30 seconds
+        resizer.request_delta('p1', 0, 4, 0, 2)
+        resizer.apply_pending()
+        self.assertEqual(1, len(batch.autoscale_targets))
+        clock.now += 30
+        resizer.apply_pending()
+        self.assertEqual(('p1', 6, True), batch.autoscale_targets[-1])
+
+    def test_deleted_pool_dropped(self):
+        batch = FakeBatch(None)
+        resizer = get_resizer(batch)
+        resizer.request_delta('p1', 0, 0, 2, 0)
+        resizer.apply_pending()
+        self.assertEqual(None, resizer.get_pending_target('p1'))
+
+    def test_lowered_target_removes_low_priority_first(self):
+        self.assertEqual((3, 0), get_lowered_target(4, 2, 3))
+        self.assertEqual((0, 0), get_lowered_target(1, 1, 5))
+
+    def test_removals_chunked_and_made_when_steady(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.resizing, 250))
+        resizer = get_resizer(batch)
+        node_ids = ['n{}'.format(i) for i in range(250)]
+        resizer.request_removal('p1', node_ids)
+        resizer.apply_pending()
+        self.assertEqual([], batch.removals)
+        self.assertEqual(0, batch.stop_resizes)
+
+        for _ in range(3):
+            batch.pool.allocation_state = batchmodels.AllocationState.steady
+            resizer.apply_pending()
+        self.assertEqual([100, 100, 50], [len(r[1]) for r in batch.removals])
+        self.assertEqual(node_ids, [n for r in batch.removals for n in r[1]])
+        self.assertEqual([], resizer.get_pending_removals('p1'))
+
+    def test_conflicting_removal_retried(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.steady, 2))
+        resizer = get_resizer(batch)
+        resizer.request_removal('p1', ['n1'])
+        batch.removal_error = ConflictError()
+        resizer.apply_pending()
+        self.assertEqual(['n1'], resizer.get_pending_removals('p1'))
+
+        batch.removal_error = None
+        resizer.apply_pending()
+        self.assertEqual([('p1', ['n1'], None)], batch.removals)
+
+    def test_target_applied_after_removals(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.resizing, 4))
+        resizer = get_resizer(batch)
+        resizer.request_delta('p1', 0, 0, 3, 0)
+        resizer.request_removal('p1', ['n1', 'n2'])
+        batch.pool.allocation_state = batchmodels.AllocationState.steady
+        resizer.apply_pending()
+        self.assertEqual(1, len(batch.removals))
+        self.assertEqual(1, resizer.get_pending_target('p1').target_dedicated)
+
+        # The resize caused by the removal isn't stopped
+        resizer.apply_pending()
+        self.assertEqual(0, batch.stop_resizes)
+        self.assertEqual([], batch.resizes)
+
+        batch.pool.allocation_state = batchmodels.AllocationState.steady
+        resizer.apply_pending()
+        self.assertEqual([('p1', 1, 0)], batch.resizes)
+
+    def test_grow_stops_long_removal(self):
+        batch = FakeBatch(FakePool(batchmodels.AllocationState.steady, 4))
+        clock = FakeClock()
+        resizer = get_resizer(batch, clock=clock)
+        resizer.request_removal('p1', ['n1'])
+        resizer.apply_pending()
+        self.assertEqual(1, len(batch.removals))
+
+        # Nodes were requested while the removal waits for tasks to complete
+        resizer.request_delta('p1', 0, 0, 6, 0)
+        resizer.apply_pending()
+        self.assertEqual(0, batch.stop_resizes)
+
+        clock.now += REMOVAL_TIMEOUT
+        resizer.apply_pending()
+        self.assertEqual(1, batch.stop_resizes)
+
+        batch.pool.allocation_state = batchmodels.AllocationState.steady
+        resizer.apply_pending()
+        self.assertEqual([('p1', 6, 0)], batch.resizes)
+
+    def test_autoscale_formula_applied_after_removals(self):
+        pool = FakePool(batchmodels.AllocationState.steady)
+        pool.enable_auto_scale = True
+        batch = FakeBatch(pool)
+        resizer = get_resizer(batch)
+        # The caller lowers the formula by the nodes it removes
+        resizer.request_delta('p1', 0, 0, 2, 0)
+        resizer.request_removal('p1', ['n1', 'n2'])
+        resizer.apply_pending()
+        self.assertEqual(1, len(batch.removals))
+        self.assertEqual([], batch.autoscale_targets)
+        self.assertEqual(2, resizer.get_pending_target('p1').target_dedicated)
+
+        pool.allocation_state = batchmodels.AllocationState.steady
+        resizer.apply_pending()
+        self.assertEqual([('p1', 2, False)], batch.autoscale_targets)
+
+
+if __name__ == '__main__':
+    unittest.main()
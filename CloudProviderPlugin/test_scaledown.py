@@ -0,0 +1,97 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import azure.batch.models as batchmodels
+
+from scaledown import ScaleDownPlanner
+from warmpool import NodeState
+
+IDLE = batchmodels.ComputeNodeState.idle
+STARTING = batchmodels.ComputeNodeState.starting
+RUNNING = batchmodels.ComputeNodeState.running
+LEAVING = batchmodels.ComputeNodeState.leaving_pool
+TERMINATE = batchmodels.ComputeNodeDeallocationOption.terminate
+TASK_COMPLETION = batchmodels.ComputeNodeDeallocationOption.task_completion
+
+
+def get_nodes(*states):
+    return [NodeState('n{}'.format(i), state) for i, state in enumerate(states)]
+
+
+def get_task_node(node_id, *job_ids):
+    tasks = [batchmodels.TaskInformation(task_url='', job_id=job_id, task_id='t',
+                                         task_state=batchmodels.TaskState.running)
+             for job_id in job_ids]
+    return batchmodels.ComputeNode(id=node_id, state=RUNNING, recent_tasks=tasks)
+
+
+class ScaleDownPlannerTests(unittest.TestCase):
+    def test_idle_nodes_removed_in_place_of_running(self):
+        nodes = get_nodes(RUNNING, RUNNING, IDLE, STARTING)
+        plan = ScaleDownPlanner(prefer_idle=True).plan(nodes, ['n0', 'n1'])
+        self.assertEqual([(TERMINATE, ['n2', 'n3'])], plan)
+
+    def test_running_nodes_let_tasks_complete(self):
+        nodes = get_nodes(RUNNING, IDLE, RUNNING)
+        plan = ScaleDownPlanner(prefer_idle=True).plan(nodes, ['n0', 'n2'])
+        self.assertEqual([(TERMINATE, ['n1']), (TASK_COMPLETION, ['n0'])], plan)
+
+    def test_requested_nodes_preferred_within_rank(self):
+        nodes = get_nodes(IDLE, IDLE, IDLE)
+        plan = ScaleDownPlanner(prefer_idle=True).plan(nodes, ['n2'])
+        self.assertEqual([(TERMINATE, ['n2'])], plan)
+
+    def test_excluded_nodes_not_substituted(self):
+        nodes = get_nodes(RUNNING, IDLE)
+        plan = ScaleDownPlanner(prefer_idle=True).plan(nodes, ['n0'], excluded_ids={'n1'})
+        self.assertEqual([(TASK_COMPLETION, ['n0'])], plan)
+
+    def test_requested_nodes_removed_by_default(self):
+        nodes = get_nodes(RUNNING, IDLE)
+        plan = ScaleDownPlanner(running_node_option='RetainedData').plan(nodes, ['n0'])
+        self.assertEqual([(batchmodels.ComputeNodeDeallocationOption.retained_data, ['n0'])], plan)
+
+    def test_license_only_nodes_removed_as_idle(self):
+        nodes = [get_task_node('n0', 'pool'), get_task_node('n1', 'pool', 'render')]
+        plan = ScaleDownPlanner(ignored_job_ids=['pool']).plan(nodes, ['n0', 'n1'])
+        self.assertEqual([(TERMINATE, ['n0']), (TASK_COMPLETION, ['n1'])], plan)
+
+    def test_nodes_without_listed_tasks_are_running(self):
+        nodes = [get_task_node('n0')]
+        plan = ScaleDownPlanner(ignored_job_ids=['pool']).plan(nodes, ['n0'])
+        self.assertEqual([(TASK_COMPLETION, ['n0'])], plan)
+
+    def test_missing_and_leaving_nodes_not_counted(self):
+        nodes = get_nodes(LEAVING, IDLE)
+        plan = ScaleDownPlanner(prefer_idle=True).plan(nodes, ['n0', 'gone'])
+        self.assertEqual([], plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
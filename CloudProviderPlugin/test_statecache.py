@@ -0,0 +1,135 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+from statecache import StateCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePool:
+    def __init__(self, id, target_dedicated_nodes=0):
+        self.id = id
+        self.target_dedicated_nodes = target_dedicated_nodes
+
+
+class StateCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = StateCache(10, clock=self.clock)
+
+    def test_empty_cache_misses(self):
+        self.assertTrue(self.cache.get_pools() is StateCache.MISS)
+        self.assertTrue(self.cache.get_pool('p1') is StateCache.MISS)
+        self.assertTrue(self.cache.get_nodes('p1') is StateCache.MISS)
+
+    def test_pool_listing_populates_pools(self):
+        self.cache.set_pools([FakePool('p1'), FakePool('p2')])
+        self.assertEqual(['p1', 'p2'], [p.id for p in self.cache.get_pools()])
+        self.assertEqual('p2', self.cache.get_pool('p2').id)
+
+    def test_entries_expire(self):
+        self.cache.set_pools([FakePool('p1')])
+        self.cache.set_nodes('p1', ['n1'])
+        self.clock.now += 10
+        self.assertTrue(self.cache.get_pools() is StateCache.MISS)
+        self.assertTrue(self.cache.get_pool('p1') is StateCache.MISS)
+        self.assertTrue(self.cache.get_nodes('p1') is StateCache.MISS)
+
+    def test_invalidate_pool_misses_listing(self):
+        self.cache.set_pools([FakePool('p1'), FakePool('p2')])
+        self.cache.set_nodes('p1', ['n1'])
+        self.cache.invalidate_pool('p1')
+        self.assertTrue(self.cache.get_pools() is StateCache.MISS)
+        self.assertTrue(self.cache.get_nodes('p1') is StateCache.MISS)
+        self.assertEqual('p2', self.cache.get_pool('p2').id)
+
+    def test_remove_pool_patches_listing(self):
+        self.cache.set_pools([FakePool('p1'), FakePool('p2')])
+        self.cache.remove_pool('p1')
+        self.assertEqual(['p2'], [p.id for p in self.cache.get_pools()])
+
+    def test_patch_pool(self):
+        self.cache.set_pools([FakePool('p1', 1)])
+        self.cache.patch_pool('p1', target_dedicated_nodes=5)
+        self.assertEqual(5, self.cache.get_pool('p1').target_dedicated_nodes)
+        self.assertEqual(5, self.cache.get_pools()[0].target_dedicated_nodes)
+
+    def test_listing_key_must_match(self):
+        self.cache.set_pools([FakePool('p1')], key='summary')
+        self.cache.set_nodes('p1', ['n1'], key='summary')
+        self.assertTrue(self.cache.get_pools() is StateCache.MISS)
+        self.assertTrue(self.cache.get_nodes('p1') is StateCache.MISS)
+        self.assertEqual(1, len(self.cache.get_pools(key='summary')))
+        self.assertEqual(['n1'], self.cache.get_nodes('p1', key='summary'))
+
+    def test_projected_listing_not_served_as_pools(self):
+        self.cache.set_pools([FakePool('p1')], key='summary', projected=True)
+        self.assertEqual(1, len(self.cache.get_pools(key='summary')))
+        self.assertTrue(self.cache.get_pool('p1') is StateCache.MISS)
+
+        # A full pool fetched later doesn't change the listing
+        full = FakePool('p1', 3)
+        self.cache.set_pool(full)
+        self.assertTrue(self.cache.get_pool('p1') is full)
+        self.assertFalse(self.cache.get_pools(key='summary')[0] is full)
+
+        self.cache.patch_pool('p1', target_dedicated_nodes=5)
+        self.assertEqual(5, full.target_dedicated_nodes)
+        self.assertEqual(5, self.cache.get_pools(key='summary')[0].target_dedicated_nodes)
+
+    def test_clear(self):
+        self.cache.set_pools([FakePool('p1')])
+        self.cache.set_nodes('p1', ['n1'])
+        self.cache.clear()
+        self.assertTrue(self.cache.get_pools() is StateCache.MISS)
+        self.assertTrue(self.cache.get_pool('p1') is StateCache.MISS)
+        self.assertTrue(self.cache.get_nodes('p1') is StateCache.MISS)
+
+    def test_zero_ttl_disables_cache(self):
+        cache = StateCache(0, clock=self.clock)
+        cache.set_pools([FakePool('p1')])
+        self.assertTrue(cache.get_pool('p1') is StateCache.MISS)
+
+    def test_hit_and_miss_counts(self):
+        self.cache.get_pool('p1')
+        self.cache.set_pool(FakePool('p1'))
+        self.cache.get_pool('p1')
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
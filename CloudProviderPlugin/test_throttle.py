@@ -0,0 +1,270 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+
+import azure.batch.models as batchmodels
+
+import throttle
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def batch_error(status_code, code, retry_after=None):
+    error = batchmodels.BatchErrorException.__new__(batchmodels.BatchErrorException)
+    Exception.__init__(error, code)
+    error.error = batchmodels.BatchError(code=code)
+    error.response = FakeResponse(status_code, {'Retry-After': retry_after} if retry_after else None)
+    error.message = code
+    return error
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Failing:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class ClassificationTests(unittest.TestCase):
+
+    def test_throttled(self):
+        self.assertTrue(throttle.is_throttled(batch_error(429, 'TooManyRequests')))
+        self.assertTrue(throttle.is_throttled(batch_error(503, 'ServerBusy')))
+        self.assertFalse(throttle.is_throttled(batch_error(404, 'PoolNotFound')))
+
+    def test_transient(self):
+        self.assertTrue(throttle.is_transient(batch_error(500, 'OperationTimedOut')))
+        self.assertTrue(throttle.is_transient(batch_error(500, 'InternalError')))
+        self.assertFalse(throttle.is_transient(batch_error(409, 'PoolExists')))
+        self.assertFalse(throttle.is_transient(ValueError()))
+
+    def test_retry_after(self):
+        self.assertEqual(throttle.get_retry_after(batch_error(429, 'TooManyRequests', '7')), 7)
+        self.assertIsNone(throttle.get_retry_after(batch_error(429, 'TooManyRequests')))
+
+
+class TokenBucketTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = throttle.TokenBucket(2, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_burst_then_rate_limited(self):
+        self.assertEqual(self.bucket.acquire(), 0)
+        self.assertEqual(self.bucket.acquire(), 0)
+        self.assertAlmostEqual(self.bucket.acquire(), 0.5)
+
+    def test_throttling_halves_rate_and_recovers(self):
+        self.bucket.on_throttled()
+        self.assertEqual(self.bucket.rate, 1)
+        self.bucket.on_success()
+        self.assertAlmostEqual(self.bucket.rate, 1.1)
+
+    def test_retry_after_blocks_all_callers(self):
+        self.bucket.on_throttled(retry_after=5)
+        self.assertAlmostEqual(self.bucket.acquire(), 5)
+
+
+class RetryPolicyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.policy = throttle.RetryPolicy(max_attempts=3, base_delay=1, max_delay=8,
+                                           sleep=self.clock.sleep, random_func=lambda: 1.0)
+
+    def test_retries_throttled_requests(self):
+        func = Failing(batch_error(503, 'ServerBusy'), batch_error(503, 'ServerBusy'))
+        self.assertEqual(self.policy.call(func), 'ok')
+        self.assertEqual(func.calls, 3)
+        self.assertEqual(self.clock.sleeps, [1, 2])
+        stats = self.policy.get_stats()
+        self.assertEqual(stats['throttled'], 2)
+        self.assertEqual(stats['retries'], 2)
+        self.assertEqual(stats['backoff_wait_seconds'], 3)
+
+    def test_honours_retry_after(self):
+        func = Failing(batch_error(429, 'TooManyRequests', '10'))
+        self.policy.call(func)
+        self.assertEqual(self.clock.sleeps, [10])
+
+    def test_gives_up_after_max_attempts(self):
+        func = Failing(*[batch_error(503, 'ServerBusy')] * 3)
+        self.assertRaises(batchmodels.BatchErrorException, self.policy.call, func)
+        self.assertEqual(func.calls, 3)
+        self.assertEqual(self.policy.get_stats()['failures'], 1)
+
+    def test_non_idempotent_only_retried_when_throttled(self):
+        func = Failing(batch_error(500, 'OperationTimedOut'))
+        self.assertRaises(batchmodels.BatchErrorException, self.policy.call, func, False)
+        self.assertEqual(func.calls, 1)
+
+        func = Failing(batch_error(503, 'ServerBusy'))
+        self.assertEqual(self.policy.call(func, False), 'ok')
+
+    def test_idempotent_transient_failure_retried(self):
+        func = Failing(batch_error(500, 'OperationTimedOut'))
+        self.assertEqual(self.policy.call(func, True), 'ok')
+
+    def test_permanent_failure_not_retried(self):
+        func = Failing(batch_error(404, 'PoolNotFound'))
+        self.assertRaises(batchmodels.BatchErrorException, self.policy.call, func)
+        self.assertEqual(func.calls, 1)
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = throttle.RetryPolicy(base_delay=1, max_delay=8, random_func=lambda: 0.0)
+        self.assertEqual(policy.get_backoff(1), 0.5)
+        self.assertEqual(policy.get_backoff(10), 4)
+
+
+class FakePaged:
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.fetches = 0
+
+    def advance_page(self):
+        self.fetches += 1
+        if not self.pages:
+            raise StopIteration('End of paging')
+        page = self.pages[0]
+        if isinstance(page, Exception):
+            self.pages.pop(0)
+            raise page
+        return self.pages.pop(0)
+
+
+class ThrottledClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.policy = throttle.RetryPolicy(sleep=self.clock.sleep, random_func=lambda: 1.0)
+
+    def test_paged_listing_retries_pages(self):
+        paged = FakePaged([[1, 2], batch_error(503, 'ServerBusy'), [3]])
+
+        class Operations:
+            def list(self):
+                return paged
+
+        class Client:
+            pool = Operations()
+
+        client = throttle.ThrottledClient(Client(), self.policy)
+        self.assertEqual(list(client.pool.list()), [1, 2, 3])
+        self.assertEqual(self.policy.get_stats()['retries'], 1)
+
+    def test_non_idempotent_operations(self):
+        calls = []
+
+        class Operations:
+            def add(self, pool):
+                calls.append(pool)
+                raise batch_error(500, 'OperationTimedOut')
+
+        class Client:
+            pool = Operations()
+            config = 'config'
+
+        client = throttle.ThrottledClient(Client(), self.policy)
+        self.assertRaises(batchmodels.BatchErrorException, client.pool.add, 'pool')
+        self.assertEqual(calls, ['pool'])
+        self.assertEqual(client.config, 'config')
+
+    def test_unauthorized_request_retried_with_new_token(self):
+        invalidated = []
+        operation = Failing(batch_error(401, 'AuthenticationFailed'))
+
+        class Operations:
+            def add(self, pool):
+                return operation()
+
+        class Client:
+            pool = Operations()
+
+        client = throttle.ThrottledClient(Client(), self.policy, on_unauthorized=lambda: invalidated.append(1))
+        self.assertEqual(client.pool.add('pool'), 'ok')
+        self.assertEqual(operation.calls, 2)
+        self.assertEqual(len(invalidated), 1)
+
+    def test_unauthorized_request_retried_once(self):
+        invalidated = []
+        operation = Failing(batch_error(401, 'AuthenticationFailed'), batch_error(401, 'AuthenticationFailed'))
+
+        class Operations:
+            def get(self, pool_id):
+                return operation()
+
+        class Client:
+            pool = Operations()
+
+        client = throttle.ThrottledClient(Client(), self.policy, on_unauthorized=lambda: invalidated.append(1))
+        self.assertRaises(batchmodels.BatchErrorException, client.pool.get, 'pool')
+        self.assertEqual(operation.calls, 2)
+        self.assertEqual(len(invalidated), 1)
+
+    def test_unauthorized_page_retried_with_new_token(self):
+        invalidated = []
+        paged = FakePaged([[1], batch_error(403, 'AuthenticationFailed'), [2]])
+
+        class Operations:
+            def list(self):
+                return paged
+
+        class Client:
+            pool = Operations()
+
+        client = throttle.ThrottledClient(Client(), self.policy, on_unauthorized=lambda: invalidated.append(1))
+        self.assertEqual(list(client.pool.list()), [1, 2])
+        self.assertEqual(len(invalidated), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
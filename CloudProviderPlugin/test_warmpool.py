@@ -0,0 +1,153 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import unittest
+import sys
+import os
+import clr
+sys.path.insert(0, os.environ['DEADLINE_PATH'])
+
+import datetime
+
+import azure.batch.models as batchmodels
+
+from warmpool import WARM_FLOOR_METADATA, WarmPoolManager, WarmSchedule, parse_warm_floors
+
+
+class FakePool:
+    def __init__(self, pool_id, warm_floor=None):
+        self.id = pool_id
+        self.metadata = None
+        if warm_floor is not None:
+            self.metadata = [batchmodels.MetadataItem(WARM_FLOOR_METADATA, str(warm_floor))]
+
+
+class FakeNode:
+    def __init__(self, node_id, state=batchmodels.ComputeNodeState.idle):
+        self.id = node_id
+        self.state = state
+
+
+def at(hour, minute=0):
+    return lambda: datetime.datetime(2018, 1, 1, hour, minute)
+
+
+class TestParseWarmFloors(unittest.TestCase):
+
+    def test_parse(self):
+        floors = parse_warm_floors('rendering-windows2016/Standard_F16=2; MyImage/Standard_D4_v3=1;')
+        self.assertEqual(floors, {('rendering-windows2016', 'Standard_F16'): 2,
+                                  ('MyImage', 'Standard_D4_v3'): 1})
+
+    def test_empty(self):
+        self.assertEqual(parse_warm_floors(None), {})
+        self.assertEqual(parse_warm_floors(''), {})
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, parse_warm_floors, 'Standard_F16=2')
+        self.assertRaises(ValueError, parse_warm_floors, 'image/Standard_F16=two')
+
+
+class TestWarmSchedule(unittest.TestCase):
+
+    def test_empty_schedule_is_always_active(self):
+        self.assertTrue(WarmSchedule().is_active(at(3)()))
+
+    def test_daytime_window(self):
+        schedule = WarmSchedule('07:00-19:00')
+        self.assertFalse(schedule.is_active(at(6, 59)()))
+        self.assertTrue(schedule.is_active(at(7)()))
+        self.assertFalse(schedule.is_active(at(19)()))
+
+    def test_window_spanning_midnight(self):
+        schedule = WarmSchedule('22:00-06:00')
+        self.assertTrue(schedule.is_active(at(23)()))
+        self.assertTrue(schedule.is_active(at(5)()))
+        self.assertFalse(schedule.is_active(at(12)()))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, WarmSchedule, '7am')
+
+
+class TestWarmPoolManager(unittest.TestCase):
+
+    def _manager(self, clock=at(12), schedule=None):
+        return WarmPoolManager({('image', 'Standard_F16'): 2}, WarmSchedule(schedule), clock=clock)
+
+    def test_floor_outside_schedule(self):
+        self.assertEqual(self._manager(clock=at(12)).get_floor('image', 'Standard_F16'), 2)
+        self.assertEqual(self._manager(clock=at(20), schedule='07:00-19:00').get_floor('image', 'Standard_F16'), 0)
+        self.assertEqual(self._manager().get_floor('image', 'Standard_F8'), 0)
+
+    def test_applied_from_metadata(self):
+        manager = self._manager()
+        self.assertEqual(manager.get_applied(FakePool('pool', 3)), 3)
+        self.assertEqual(manager.get_applied(FakePool('pool')), 0)
+        manager.set_applied('pool', 1)
+        self.assertEqual(manager.get_applied(FakePool('pool', 3)), 1)
+
+    def test_select_reserved_prefers_idle_nodes(self):
+        manager = self._manager()
+        nodes = [FakeNode('a', batchmodels.ComputeNodeState.starting),
+                 FakeNode('b', batchmodels.ComputeNodeState.running),
+                 FakeNode('c')]
+        reserved, unallocated = manager.select_reserved(FakePool('pool', 3), nodes)
+        self.assertEqual(reserved, {'a', 'c'})
+        self.assertEqual(unallocated, 1)
+
+    def test_select_reserved_is_stable(self):
+        manager = self._manager()
+        pool = FakePool('pool', 1)
+        manager.select_reserved(pool, [FakeNode('b')])
+        reserved, _ = manager.select_reserved(pool, [FakeNode('a'), FakeNode('b')])
+        self.assertEqual(reserved, {'b'})
+
+    def test_hand_out_releases_idle_nodes(self):
+        manager = self._manager()
+        pool = FakePool('pool', 2)
+        nodes = [FakeNode('a'), FakeNode('b', batchmodels.ComputeNodeState.starting), FakeNode('c')]
+        manager.select_reserved(pool, nodes)
+        self.assertEqual(manager.hand_out('pool', 1), ['a'])
+
+        # The handed out node isn't reserved again, its replacement is
+        reserved, unallocated = manager.select_reserved(pool, nodes)
+        self.assertEqual(reserved, {'b', 'c'})
+        self.assertEqual(unallocated, 0)
+
+    def test_take_reserved_prefers_starting_nodes(self):
+        manager = self._manager()
+        pool = FakePool('pool', 2)
+        manager.select_reserved(pool, [FakeNode('a'), FakeNode('b', batchmodels.ComputeNodeState.starting)])
+        self.assertEqual(manager.take_reserved('pool', 1), ['b'])
+        self.assertEqual(manager.take_reserved('pool', 1), ['a'])
+        self.assertEqual(manager.take_reserved('pool', 1), [])
+
+    def test_no_reservation_without_floor(self):
+        reserved, unallocated = self._manager().select_reserved(FakePool('pool'), [FakeNode('a')])
+        self.assertEqual(reserved, set())
+        self.assertEqual(unallocated, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,395 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import email.utils
+import random
+import threading
+import time
+
+from azuresdk import batchmodels
+
+# Errors returned when the Batch service is rejecting requests, the request wasn't processed
+THROTTLE_STATUS_CODES = (429, 503)
+THROTTLE_ERROR_CODES = ('ServerBusy', 'TooManyRequests')
+
+# Errors where the outcome of the request is unknown
+TRANSIENT_STATUS_CODES = (500, 502, 504)
+TRANSIENT_ERROR_CODES = ('OperationTimedOut', 'InternalError')
+
+# Errors returned when the service rejects the access token, the request wasn't processed
+UNAUTHORIZED_STATUS_CODES = (401,)
+UNAUTHORIZED_ERROR_CODES = ('AuthenticationFailed',)
+
+# The operations which change state when repeated, these are only retried when throttled
+NON_IDEMPOTENT_OPERATIONS = frozenset([
+    'pool.add',
+    'pool.remove_nodes',
+    'job.add',
+    'task.add',
+    'task.add_collection',
+    'compute_node.reboot',
+    'compute_node.reimage',
+])
+
+# The operations returning a paged listing, no request is sent until it's iterated
+PAGED_OPERATIONS = frozenset([
+    'list',
+    'list_usage_metrics',
+    'list_from_job_schedule',
+    'list_preparation_and_release_task_status',
+    'list_from_task',
+    'list_from_compute_node',
+    'list_node_agent_skus',
+    'list_pool_node_counts',
+])
+
+# The operation groups of the BatchServiceClient which send requests
+OPERATION_GROUPS = frozenset([
+    'application',
+    'pool',
+    'account',
+    'job',
+    'certificate',
+    'file',
+    'job_schedule',
+    'task',
+    'compute_node',
+])
+
+
+def get_status_code(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def get_error_code(error):
+    batch_error = getattr(error, 'error', None)
+    return getattr(batch_error, 'code', None)
+
+
+def get_retry_after(error):
+    """
+    Returns the delay the service asked for in the Retry-After header
+    :return: Seconds to wait, or None
+    :rtype: float
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        retry_time = email.utils.parsedate_tz(value)
+        if retry_time is None:
+            return None
+        return max(0.0, email.utils.mktime_tz(retry_time) - time.time())
+
+
+def is_throttled(error):
+    return get_status_code(error) in THROTTLE_STATUS_CODES or get_error_code(error) in THROTTLE_ERROR_CODES
+
+
+def is_unauthorized(error):
+    return get_status_code(error) in UNAUTHORIZED_STATUS_CODES or get_error_code(error) in UNAUTHORIZED_ERROR_CODES
+
+
+def retry_unauthorized(func, on_unauthorized):
+    """
+    Returns a function which calls func and, if the service rejects the access
+    token, e.g. as it was revoked before it expired, calls on_unauthorized to
+    drop the token and calls func once more with a new one.
+    """
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if not is_unauthorized(e):
+                raise
+            on_unauthorized()
+            return func(*args, **kwargs)
+    return call
+
+
+def is_transient(error):
+    """
+    Returns True if the error may not happen if the request is repeated
+    """
+    if is_throttled(error):
+        return True
+    if isinstance(error, batchmodels.BatchErrorException):
+        return get_status_code(error) in TRANSIENT_STATUS_CODES or get_error_code(error) in TRANSIENT_ERROR_CODES
+    # Connection failures and timeouts raised by msrest and requests
+    name = type(error).__name__
+    return name in ('ClientRequestError', 'ConnectionError', 'Timeout', 'ConnectTimeout', 'ReadTimeout')
+
+
+class TokenBucket:
+    """
+    A client side rate limiter shared by all threads. The rate is halved each
+    time the service throttles a request and recovers gradually as requests
+    succeed. A Retry-After from the service holds back every caller.
+    """
+    def __init__(self, rate, capacity=None, min_rate=1.0, recovery=0.1,
+                 clock=time.time, sleep=time.sleep):
+        """
+        :param rate: The maximum number of requests per second
+        :type rate: float
+        :param capacity: The largest burst of requests, defaults to the rate
+        :type capacity: float
+        :param min_rate: The rate isn't lowered below this when throttled
+        :type min_rate: float
+        :param recovery: Requests per second the rate recovers by on each success
+        :type recovery: float
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.recovery = recovery
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._blocked_until = 0
+
+    def acquire(self):
+        """
+        Waits until a request can be sent
+        :return: Seconds waited
+        :rtype: float
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            self._sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery)
+
+    def on_throttled(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, self._clock() + retry_after)
+
+
+class RetryPolicy:
+    """
+    Retries failed Batch requests with jittered exponential backoff, waiting
+    at least as long as the service asks in Retry-After. Throttled requests
+    are always retried, other transient failures only for idempotent
+    operations as the request may have been processed.
+    """
+    def __init__(self, limiter=None, max_attempts=4, base_delay=1.0, max_delay=30.0,
+                 sleep=time.sleep, random_func=random.random):
+        """
+        :param limiter: Rate limiter applied before each attempt
+        :type limiter: TokenBucket
+        :param max_attempts: Attempts including the first
+        :type max_attempts: int
+        :param base_delay: Seconds before the first retry, doubled on each retry
+        :type base_delay: float
+        :param max_delay: The longest backoff in seconds
+        :type max_delay: float
+        """
+        self.limiter = limiter
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self._sleep = sleep
+        self._random = random_func
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'retries': 0,
+            'throttled': 0,
+            'failures': 0,
+            'limiter_wait_seconds': 0.0,
+            'backoff_wait_seconds': 0.0,
+        }
+
+    def get_backoff(self, attempt, retry_after=None):
+        """
+        :param attempt: The number of attempts made so far
+        :type attempt: int
+        :return: Seconds to wait before the next attempt
+        :rtype: float
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        delay = delay / 2 + self._random() * delay / 2
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, func, idempotent=True, *args, **kwargs):
+        """
+        Calls func, retrying transient failures
+        :param idempotent: If False, the call is only retried when throttled
+        :type idempotent: bool
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.limiter:
+                waited = self.limiter.acquire()
+                self._add('limiter_wait_seconds', waited)
+            self._add('requests', 1)
+            try:
+                result = func(*args, **kwargs)
+            except StopIteration:
+                raise
+            except Exception as e:
+                throttled = is_throttled(e)
+                retry_after = get_retry_after(e)
+                if throttled:
+                    self._add('throttled', 1)
+                    if self.limiter:
+                        self.limiter.on_throttled(retry_after)
+
+                retryable = throttled or (idempotent and is_transient(e))
+                if not retryable or attempt >= self.max_attempts:
+                    self._add('failures', 1)
+                    raise
+
+                delay = self.get_backoff(attempt, retry_after)
+                self._add('retries', 1)
+                self._add('backoff_wait_seconds', delay)
+                self._sleep(delay)
+                continue
+
+            if self.limiter:
+                self.limiter.on_success()
+            return result
+
+    def get_stats(self):
+        """
+        :return: Request, retry, throttle and failure counts and the time spent waiting
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        if self.limiter:
+            stats['rate'] = self.limiter.rate
+        return stats
+
+    def _add(self, name, value):
+        with self._lock:
+            self._stats[name] += value
+
+
+def iter_paged(paged, policy, metrics=None, name=None, on_unauthorized=None):
+    """
+    Iterates a paged listing, fetching each page through the retry policy
+    :param paged: The listing returned by a list operation
+    :type paged: msrest.paging.Paged
+    :type policy: RetryPolicy
+    :param metrics: Records each page request under the operation name
+    :type metrics: metrics.MetricsRegistry
+    :param on_unauthorized: Drops the access token when the service rejects it
+    """
+    advance_page = paged.advance_page
+    if metrics:
+        advance_page = metrics.wrap('api', name, advance_page)
+    if on_unauthorized:
+        advance_page = retry_unauthorized(advance_page, on_unauthorized)
+    while True:
+        try:
+            page = policy.call(advance_page)
+        except StopIteration:
+            return
+        for item in page:
+            yield item
+
+
+class ThrottledOperations:
+    """
+    Wraps an operation group of the BatchServiceClient, e.g. client.pool, so
+    each request goes through the retry policy. Each attempt is recorded in
+    the metrics registry, if given. A request rejected for its access token
+    is sent once more after on_unauthorized drops the token.
+    """
+    def __init__(self, group_name, operations, policy, metrics=None, on_unauthorized=None):
+        self._group_name = group_name
+        self._operations = operations
+        self._policy = policy
+        self._metrics = metrics
+        self._on_unauthorized = on_unauthorized
+
+    def __getattr__(self, name):
+        operation = getattr(self._operations, name)
+        if not callable(operation):
+            return operation
+        policy = self._policy
+        metrics = self._metrics
+        on_unauthorized = self._on_unauthorized
+        operation_name = '{}.{}'.format(self._group_name, name)
+        if name in PAGED_OPERATIONS:
+            return lambda *args, **kwargs: iter_paged(operation(*args, **kwargs), policy, metrics, operation_name,
+                                                      on_unauthorized)
+
+        if metrics:
+            operation = metrics.wrap('api', operation_name, operation)
+        if on_unauthorized:
+            operation = retry_unauthorized(operation, on_unauthorized)
+        idempotent = operation_name not in NON_IDEMPOTENT_OPERATIONS
+        return lambda *args, **kwargs: policy.call(operation, idempotent, *args, **kwargs)
+
+
+class ThrottledClient:
+    """
+    Wraps a BatchServiceClient so every request is rate limited and retried.
+    """
+    def __init__(self, client, policy, metrics=None, on_unauthorized=None):
+        """
+        :type client: azure.batch.batch_service_client.BatchServiceClient
+        :type policy: RetryPolicy
+        :param metrics: Records every request attempt
+        :type metrics: metrics.MetricsRegistry
+        :param on_unauthorized: Drops the cached access token when the service rejects it
+        """
+        self.client = client
+        self.policy = policy
+        self.metrics = metrics
+        self.on_unauthorized = on_unauthorized
+
+    def __getattr__(self, name):
+        value = getattr(self.client, name)
+        if name in OPERATION_GROUPS:
+            return ThrottledOperations(name, value, self.policy, self.metrics, self.on_unauthorized)
+        return value
@@ -0,0 +1,245 @@
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import collections
+import datetime
+import threading
+
+from azuresdk import batchmodels
+
+# Pool metadata item recording how many warm nodes have been added to the pool's target
+WARM_FLOOR_METADATA = 'deadline-warm-floor'
+
+# The id and state of a compute node, all the warm pool manager needs to know about it
+NodeState = collections.namedtuple('NodeState', ['id', 'state'])
+
+# Nodes which are warm, or will be once their start task completes, in order of preference
+_RESERVABLE_STATES = None
+
+
+def _get_reservable_states():
+    # Built on first use so the SDK isn't imported with the module
+    global _RESERVABLE_STATES
+    if _RESERVABLE_STATES is None:
+        _RESERVABLE_STATES = [
+            batchmodels.ComputeNodeState.idle,
+            batchmodels.ComputeNodeState.waiting_for_start_task,
+            batchmodels.ComputeNodeState.starting,
+        ]
+    return _RESERVABLE_STATES
+
+
+def parse_warm_floors(value):
+    """
+    Parses the warm pool floors setting, e.g. 'rendering-windows2016/Standard_F16=2;MyImage/Standard_D4_v3=1'
+    :param value: Semi-colon delimited list of <image display name>/<vm size>=<count>
+    :type value: str
+    :return: The number of warm nodes keyed by image display name and VM size
+    :rtype: dict of (str, str) to int
+    """
+    floors = {}
+    if not value:
+        return floors
+    for entry in value.split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            key, count = entry.rsplit('=', 1)
+            image_name, vm_size = key.rsplit('/', 1)
+            floors[(image_name.strip(), vm_size.strip())] = max(0, int(count))
+        except ValueError:
+            raise ValueError('Invalid warm pool floor "{}", expected <image>/<vm size>=<count>'.format(entry))
+    return floors
+
+
+class WarmSchedule:
+    """
+    The time of day during which warm nodes are kept, e.g. '07:00-19:00'.
+    Windows which span midnight, e.g. '22:00-06:00', are supported. An empty
+    schedule is always active.
+    """
+    def __init__(self, value=None):
+        self.start = None
+        self.end = None
+        if value and value.strip():
+            try:
+                start, end = value.split('-')
+                self.start = self._parse_time(start)
+                self.end = self._parse_time(end)
+            except ValueError:
+                raise ValueError('Invalid warm pool schedule "{}", expected HH:MM-HH:MM'.format(value))
+
+    def is_active(self, now):
+        """
+        :param now: The local time
+        :type now: datetime.datetime
+        :rtype: bool
+        """
+        if self.start is None:
+            return True
+        time_of_day = now.time()
+        if self.start <= self.end:
+            return self.start <= time_of_day < self.end
+        return time_of_day >= self.start or time_of_day < self.end
+
+    @staticmethod
+    def _parse_time(value):
+        hours, minutes = value.strip().split(':')
+        return datetime.time(int(hours), int(minutes))
+
+
+class WarmPoolManager:
+    """
+    Tracks the warm standby nodes of each pool. Warm nodes are added on top of the
+    nodes the Balancer asked for and are hidden from it until they're handed out
+    by CreateInstances. Handed out nodes are back-filled by growing the pool.
+    """
+    def __init__(self, floors, schedule, clock=datetime.datetime.now):
+        """
+        :param floors: The number of warm nodes keyed by image display name and VM size
+        :type floors: dict of (str, str) to int
+        :param schedule: When warm nodes are kept
+        :type schedule: WarmSchedule
+        :param clock: Callable returning the current local time
+        """
+        self.floors = floors
+        self.schedule = schedule
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._applied = {}
+        self._reserved = {}
+        self._released = {}
+
+    @property
+    def enabled(self):
+        return any(count > 0 for count in self.floors.values())
+
+    def reconfigure(self, floors, schedule):
+        """
+        Changes the floors and schedule. Reserved and handed out nodes are kept,
+        the warm pool worker applies the new floors on its next run.
+        """
+        with self._lock:
+            self.floors = floors
+            self.schedule = schedule
+
+    def get_floor(self, image_name, vm_size):
+        """
+        Returns the number of warm nodes wanted now for the image and VM size
+        :rtype: int
+        """
+        if not self.schedule.is_active(self._clock()):
+            return 0
+        return self.floors.get((image_name, vm_size), 0)
+
+    def get_applied(self, pool):
+        """
+        Returns the number of warm nodes included in the pool's target
+        :param pool:
+        :type pool: azure.batch.models.CloudPool
+        :rtype: int
+        """
+        with self._lock:
+            if pool.id in self._applied:
+                return self._applied[pool.id]
+        for item in pool.metadata or []:
+            if item.name == WARM_FLOOR_METADATA:
+                try:
+                    return int(item.value)
+                except ValueError:
+                    return 0
+        return 0
+
+    def set_applied(self, pool_id, count):
+        with self._lock:
+            self._applied[pool_id] = count
+
+    def select_reserved(self, pool, nodes):
+        """
+        Chooses which of the pool's nodes are held in reserve as warm nodes,
+        preferring nodes already reserved, then idle nodes, then nodes still starting.
+        :param pool:
+        :type pool: azure.batch.models.CloudPool
+        :param nodes: The pool's compute nodes
+        :type nodes: list of NodeState or azure.batch.models.ComputeNode
+        :return: The reserved node ids, and the number of warm nodes not yet allocated
+        :rtype: tuple of (set of str, int)
+        """
+        applied = self.get_applied(pool)
+        node_ids = set(n.id for n in nodes)
+        with self._lock:
+            released = self._released.get(pool.id, set()) & node_ids
+            self._released[pool.id] = released
+            previous = self._reserved.get(pool.id, {})
+
+            if applied <= 0:
+                self._reserved.pop(pool.id, None)
+                return set(), 0
+
+            reservable_states = _get_reservable_states()
+            candidates = [n for n in nodes if n.id not in released and n.state in reservable_states]
+            candidates.sort(key=lambda n: (n.id not in previous, reservable_states.index(n.state), n.id))
+            reserved = dict((n.id, n.state) for n in candidates[:applied])
+            self._reserved[pool.id] = reserved
+            return set(reserved), applied - len(reserved)
+
+    def get_reserved(self, pool_id):
+        """
+        Returns the ids of the pool's nodes currently held in reserve
+        :rtype: set of str
+        """
+        with self._lock:
+            return set(self._reserved.get(pool_id, {}))
+
+    def hand_out(self, pool_id, count):
+        """
+        Releases up to count idle reserved nodes to the Balancer.
+        :return: The released node ids
+        :rtype: list of str
+        """
+        with self._lock:
+            reserved = self._reserved.get(pool_id, {})
+            idle = sorted(node_id for node_id, state in reserved.items()
+                          if state == batchmodels.ComputeNodeState.idle)[:max(0, count)]
+            for node_id in idle:
+                del reserved[node_id]
+            self._released.setdefault(pool_id, set()).update(idle)
+            return idle
+
+    def take_reserved(self, pool_id, count):
+        """
+        Removes up to count reserved nodes from the reserve so they can be
+        deleted when the floor is lowered.
+        :return: The node ids
+        :rtype: list of str
+        """
+        with self._lock:
+            reserved = self._reserved.get(pool_id, {})
+            reservable_states = _get_reservable_states()
+            node_ids = sorted(reserved, key=lambda n: (reservable_states.index(reserved[n]), n), reverse=True)
+            node_ids = node_ids[:max(0, count)]
+            for node_id in node_ids:
+                del reserved[node_id]
+            return node_ids